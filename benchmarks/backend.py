@@ -0,0 +1,89 @@
+"""Command backends for running the installer without a network or real disks
+
+ReplayRunner fakes every command like the test StubRunner, but first sleeps
+for the time the command took in a recorded trace. LoopRunner runs disk
+commands for real against loop devices and fakes pacstrap and the chroot.
+"""
+
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+from fakes import StubRunner
+
+def command_key(cmd):
+    """Program a command runs, the first one inside the script for chroot, with pacman's operation"""
+    try:
+        args = shlex.split(cmd)
+    except ValueError:
+        args = cmd.split()
+    if not args:
+        return ""
+    if args[0] == "chroot" and args[-1] != args[0]:
+        inner = args[-1].lstrip("( \n").split()
+        return f"chroot {inner[0]}" if inner else "chroot"
+    if os.path.basename(args[0]) == "pacman" and len(args) > 1:
+        # Syncing, resolving and downloading take very different times
+        return f"pacman {args[1]}"
+    return os.path.basename(args[0])
+
+def load_timings(path):
+    """Seconds per command key from a trace written by the installer or a profile
+
+    A trace is the Chrome trace JSON of a real install; a profile is a plain
+    {"timings": {key: seconds}} file. Commands seen several times in a trace
+    use their median.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if "timings" in data:
+        return dict(data["timings"])
+
+    samples = {}
+    for event in data.get("traceEvents", []):
+        if event.get("cat") == "command" and event.get("ph") == "X":
+            samples.setdefault(command_key(event["name"]), []).append(event["dur"] / 1e6)
+    return {key: statistics.median(values) for key, values in samples.items()}
+
+class ReplayRunner(StubRunner):
+    """Fake the system, taking as long as each command did in a real install"""
+
+    def __init__(self, timings, scale=1.0, default=0.0):
+        super().__init__()
+        self.timings = timings
+        self.scale = scale
+        self.default = default
+
+    def __call__(self, cmd):
+        time.sleep(self.timings.get(command_key(cmd), self.default) * self.scale)
+        return super().__call__(cmd)
+
+class LoopRunner(StubRunner):
+    """Run disk commands for real; pacstrap and the chroot stay fake"""
+
+    FAKE = ("pacstrap", "chroot", "mkdir", "pacman")
+
+    def __init__(self):
+        super().__init__()
+        # API filesystems of the chroot session, which are never really mounted
+        self.fake_mounts = set()
+
+    def __call__(self, cmd):
+        args = cmd.split()
+        if cmd.startswith(("mount -t", "mount --bind")):
+            self.fake_mounts.add(args[-1])
+            return super().__call__(cmd)
+        if args[0] == "umount" and args[-1] in self.fake_mounts:
+            self.fake_mounts.discard(args[-1])
+            return super().__call__(cmd)
+        if args[0] in self.FAKE:
+            return super().__call__(cmd)
+        self.commands.append(cmd)
+        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        return result.returncode, result.stdout + result.stderr
@@ -0,0 +1,91 @@
+"""Time commands run with a fresh chroot each against one persistent session
+
+Needs root. Pass an installed system, e.g. the target after pacstrap:
+
+    python benchmarks/bench_chroot.py /mnt --commands 20
+
+Without a root directory a throwaway one is assembled from read-only bind
+mounts of the host's /usr, /bin, /lib, /lib64 and /etc.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.chroot import ChrootSession
+
+HOST_DIRS = ("usr", "bin", "lib", "lib64", "etc")
+
+def scratch_root(path):
+    """Bind the host's programs into path; returns the mount points"""
+    mounts = []
+    for name in HOST_DIRS:
+        source = os.path.join("/", name)
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), os.path.join(path, name))
+            continue
+        if not os.path.isdir(source):
+            continue
+        target = os.path.join(path, name)
+        os.makedirs(target)
+        subprocess.run(["mount", "--bind", "-o", "ro", source, target], check=True)
+        mounts.append(target)
+    return mounts
+
+def timed(label, func, count):
+    start = time.monotonic()
+    func()
+    elapsed = time.monotonic() - start
+    print(f"{label:24} {elapsed:7.3f}s  {elapsed / count * 1000:7.1f} ms/command")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", nargs="?", help="root directory to chroot into")
+    parser.add_argument("--commands", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = None
+    mounts = []
+    root = args.root
+    if root is None:
+        tmp = tempfile.mkdtemp(prefix="bench-chroot-")
+        root = tmp
+        mounts = scratch_root(root)
+
+    cmd = "true"
+    count = args.commands
+    try:
+        def per_command():
+            for _ in range(count):
+                with ChrootSession(root) as session:
+                    session.run(cmd)
+
+        def session_run():
+            with ChrootSession(root) as session:
+                for _ in range(count):
+                    session.run(cmd)
+
+        def session_batch():
+            with ChrootSession(root) as session:
+                session.run_batch([cmd] * count)
+
+        if shutil.which("arch-chroot"):
+            timed("arch-chroot", lambda: [subprocess.run(["arch-chroot", root, cmd], check=True)
+                                          for _ in range(count)], count)
+        timed("setup per command", per_command, count)
+        timed("one session", session_run, count)
+        timed("one session, batched", session_batch, count)
+    finally:
+        for target in reversed(mounts):
+            subprocess.run(["umount", target])
+        if tmp:
+            shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
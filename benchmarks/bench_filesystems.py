@@ -0,0 +1,95 @@
+"""Time formatting a loop device and writing a root onto it with each filesystem backend
+
+Needs root and losetup. Every backend whose mkfs is installed is formatted
+on a fresh sparse file, mounted with its install options and filled with a
+copy of --source (by default /usr/lib) followed by a sync, standing in for
+the pacstrap write phase. "ext4-old" is the plain mkfs.ext4 -F and mount
+the installer used before the backends:
+
+    python benchmarks/bench_filesystems.py [--device ssd|hdd] [--size-gb 8]
+
+--device picks the options as if the loop device were flash or a spinning
+disk; the backing file decides how fast it really is.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer import utils
+from arch_installer.filesystems import BACKENDS, get_filesystem
+from arch_installer.inventory import BlockDevice
+
+class OldExt4:
+    """The formatting the installer did before filesystem backends"""
+
+    def format(self, partition, device=None):
+        utils.run(f"mkfs.ext4 -F {partition}")
+
+    def mount(self, partition, target, device=None):
+        utils.run(f"mount {partition} {target}")
+
+def used_mib(path):
+    stat = os.statvfs(path)
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize >> 20
+
+def timed(func):
+    start = time.monotonic()
+    func()
+    return time.monotonic() - start
+
+def bench(name, filesystem, device, source, size, tmp):
+    image = os.path.join(tmp, f"{name}.img")
+    with open(image, "wb") as f:
+        f.truncate(size)
+    loop = subprocess.check_output(["losetup", "-f", "--show", image], text=True).strip()
+    target = os.path.join(tmp, name)
+    os.makedirs(target)
+    try:
+        mkfs = timed(lambda: filesystem.format(loop, device))
+        filesystem.mount(loop, target, device)
+        try:
+            base = used_mib(target)
+            write = timed(lambda: (shutil.copytree(source, os.path.join(target, "usr/lib"), symlinks=True),
+                                   os.sync()))
+            used = used_mib(target) - base
+        finally:
+            subprocess.run(["umount", target], check=True)
+        mount = timed(lambda: subprocess.run(["mount", loop, target], check=True))
+        subprocess.run(["umount", target], check=True)
+    finally:
+        subprocess.run(["losetup", "-d", loop])
+        os.remove(image)
+    print(f"{name:10} {mkfs:8.2f}s {write:8.2f}s {mount:8.2f}s {used:8} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--device", choices=["ssd", "hdd"], default="ssd", help="device type to tune for")
+    parser.add_argument("--source", default="/usr/lib", help="tree written as the root")
+    parser.add_argument("--size-gb", type=int, default=8, help="loop device size")
+    parser.add_argument("--dir", help="where the backing files go")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0 or not shutil.which("losetup"):
+        raise SystemExit("needs root and losetup")
+    device = BlockDevice("loop", None, args.size_gb << 30, "disk")
+    device.rotational = args.device == "hdd"
+
+    candidates = [("ext4-old", OldExt4(), "mkfs.ext4")]
+    candidates += [(name, get_filesystem(name), f"mkfs.{name}") for name in BACKENDS]
+    print(f"{'backend':10} {'mkfs':>9} {'write':>9} {'remount':>9} {'used':>12}")
+    with tempfile.TemporaryDirectory(prefix="bench-fs-", dir=args.dir) as tmp:
+        for name, filesystem, tool in candidates:
+            if not shutil.which(tool):
+                print(f"{name:10} skipped, {tool} not installed")
+                continue
+            bench(name, filesystem, device, args.source, args.size_gb << 30, tmp)
+
+if __name__ == "__main__":
+    main()
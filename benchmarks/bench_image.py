@@ -0,0 +1,71 @@
+"""Time capturing and deploying a golden image against a plain copy of the same tree
+
+Pass an installed root to measure real data, or let the benchmark copy
+--source (by default /usr/lib) as a stand-in:
+
+    python benchmarks/bench_image.py [--root /mnt] [--target-dir /mnt/scratch]
+
+The target directory should sit on the filesystem a deploy would write to,
+so the copy shows the write speed the deploy is compared with.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.image import GoldenImage
+
+def tree_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def timed(label, func, size):
+    start = time.monotonic()
+    func()
+    elapsed = time.monotonic() - start
+    print(f"{label:20} {elapsed:7.2f}s  {size / elapsed / (1 << 20):8.1f} MiB/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", help="installed root to capture")
+    parser.add_argument("--source", default="/usr/lib", help="tree to copy into a stand-in root")
+    parser.add_argument("--target-dir", help="where the image and deployed copies go")
+    parser.add_argument("--level", type=int, default=3, help="zstd level")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-image-", dir=args.target_dir) as tmp:
+        root = args.root
+        if root is None:
+            root = os.path.join(tmp, "root")
+            shutil.copytree(args.source, os.path.join(root, "usr/lib"), symlinks=True)
+            os.makedirs(os.path.join(root, "boot"))
+        size = tree_size(root)
+        print(f"tree                 {size >> 20} MiB")
+
+        image = GoldenImage(os.path.join(tmp, "image"), level=args.level)
+        timed("capture", lambda: image.capture(root, ["bench"]), size)
+        compressed = sum(p["size"] for p in image.manifest()["parts"].values())
+        print(f"image                {compressed >> 20} MiB ({compressed / size:.0%})")
+
+        subprocess.run(["sync"])
+        copy = timed("copy (cp -a)", lambda: subprocess.run(
+            ["cp", "-a", root, os.path.join(tmp, "copy")], check=True), size)
+        subprocess.run(["sync"])
+        deploy = timed("deploy", lambda: image.deploy(os.path.join(tmp, "deployed")), size)
+        print(f"deploy / copy        {deploy / copy:7.2f}x")
+
+if __name__ == "__main__":
+    main()
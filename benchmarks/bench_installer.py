@@ -0,0 +1,164 @@
+"""Time the whole installer pipeline offline and compare it with a baseline
+
+Two backends, neither needs a network:
+
+replay  every command is faked, after sleeping for as long as it took in a
+        real install. Timings come from a trace the installer wrote
+        (/tmp/arch-install-trace.json) or a profile, scaled down by --scale.
+loop    partitioning, mkfs and mounts run for real against a loop device
+        (needs root, losetup, sfdisk, mkfs.fat and mkfs.ext4); pacstrap and
+        the chroot stay fake.
+
+    python benchmarks/bench_installer.py replay [--trace trace.json] [--scale 0.01]
+    sudo python benchmarks/bench_installer.py loop
+    python benchmarks/bench_installer.py replay --update-baseline
+
+Exits with 1 when the total or a step is slower than the baseline by more
+than --tolerance.
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer import utils
+from arch_installer.installer import Installer
+from arch_installer.tracing import tracer
+from arch_installer.ui.headless import HeadlessUI
+from backend import LoopRunner, ReplayRunner, load_timings
+from fakes import HARDWARE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROFILE = os.path.join(HERE, "profiles", "default.json")
+BASELINE = os.path.join(HERE, "baseline.json")
+LOOP_TOOLS = ("losetup", "sfdisk", "mkfs.fat", "mkfs.ext4", "mount")
+
+CONFIG = {
+    'username': "bench",
+    'userpass': "bench",
+    'rootpass': "bench",
+    'kernel': "linux",
+    'gpu': "None",
+    'wmde': "None",
+    'bootloader': "systemd-boot",
+    'swap': "swapfile",
+    'swap_size_mb': 64,
+}
+
+def install(runner, disk, tmp):
+    """Run one headless install through runner; returns total seconds and per-step seconds"""
+    config = dict(CONFIG, disk=disk, cache_dir=os.path.join(tmp, "cache"),
+                  trace_file=os.path.join(tmp, "trace.json"))
+    installer = Installer(ui=HeadlessUI(io.StringIO()), config=config,
+                          target=os.path.join(tmp, "mnt"), name="bench")
+    patches = [
+        patch('arch_installer.installer.HardwareProfile.detect', return_value=HARDWARE),
+        patch('arch_installer.disk.DiskManager.list_disks', return_value=[f"{disk} (20G)"]),
+        patch('arch_installer.packages.PackageManager.optimize_mirrorlist'),
+        patch('arch_installer.prefetch.Prefetcher.write_pacman_conf', return_value="pacman.conf"),
+    ]
+    for p in patches:
+        p.start()
+    utils.set_runner(runner)
+    try:
+        start = time.monotonic()
+        installer.run()
+        total = time.monotonic() - start
+    finally:
+        utils.set_runner(None)
+        for p in patches:
+            p.stop()
+
+    steps = {name: t["wall"] for name, t in tracer.step_totals(prefix="bench").items()}
+    return total, steps
+
+def run_replay(args, tmp):
+    timings = load_timings(args.trace or DEFAULT_PROFILE)
+    return install(ReplayRunner(timings, scale=args.scale), "/dev/vda", tmp)
+
+def run_loop(args, tmp):
+    missing = [tool for tool in LOOP_TOOLS if not shutil.which(tool)]
+    if os.geteuid() != 0 or missing:
+        raise SystemExit("loop mode needs root and " + ", ".join(missing or LOOP_TOOLS))
+
+    image = os.path.join(tmp, "disk.img")
+    with open(image, "wb") as f:
+        f.truncate(args.disk_mb << 20)
+    loop = subprocess.check_output(["losetup", "-f", "--show", "-P", image], text=True).strip()
+    try:
+        return install(LoopRunner(), loop, tmp)
+    finally:
+        subprocess.call(["umount", "-R", os.path.join(tmp, "mnt")], stderr=subprocess.DEVNULL)
+        subprocess.call(["losetup", "-d", loop])
+
+def compare(result, baseline, tolerance):
+    """Print the result next to the baseline; returns the names that regressed"""
+    regressions = []
+    rows = [("total", result["total"])] + sorted(result["steps"].items(), key=lambda item: -item[1])
+    known = dict(baseline.get("steps", {}), total=baseline.get("total"))
+    print(f"{'step':16} {'seconds':>9} {'baseline':>9} {'change':>8}")
+    for name, seconds in rows:
+        before = known.get(name)
+        if before is None:
+            print(f"{name:16} {seconds:9.3f}")
+            continue
+        change = (seconds - before) / before if before else 0.0
+        # Ignore noise on steps that take next to no time
+        slower = change > tolerance and seconds - before > 0.05
+        if slower:
+            regressions.append(name)
+        print(f"{name:16} {seconds:9.3f} {before:9.3f} {change:+7.0%}{'  SLOWER' if slower else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["replay", "loop"])
+    parser.add_argument("--trace", help="trace or profile with command timings (replay)")
+    parser.add_argument("--scale", type=float, default=0.01,
+                        help="factor applied to replayed timings (replay)")
+    parser.add_argument("--disk-mb", type=int, default=1536, help="loop device size (loop)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline, 0.2 = 20%%")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-installer-") as tmp:
+        # Progress lines of the installer go to stderr; keep the report readable
+        with open(os.devnull, "w") as devnull, patch("sys.stderr", devnull):
+            if args.mode == "replay":
+                total, steps = run_replay(args, tmp)
+            else:
+                total, steps = run_loop(args, tmp)
+    result = {"total": round(total, 3), "steps": {name: round(s, 3) for name, s in steps.items()}}
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = args.mode if args.mode == "loop" else f"replay@{args.scale:g}"
+
+    if args.update_baseline:
+        baselines[key] = result
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline {key} updated: {result['total']:.3f}s")
+        return
+
+    regressions = compare(result, baselines.get(key, {}), args.tolerance)
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
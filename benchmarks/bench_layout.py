@@ -0,0 +1,106 @@
+"""Time partitioning and formatting a multi-disk layout, serially and concurrently
+
+Needs root, losetup, sfdisk, mkfs for the filesystem and mkfs.fat, plus
+lvm2 or mdadm for the stack. Every run gets fresh sparse files attached as
+loop devices, split into an ESP, /, /var, /scratch and /home. "serial"
+writes one disk's table after the other and runs each mkfs in turn;
+"parallel" is DiskManager.partition_disk and format_and_mount, which write
+the tables and run mkfs concurrently:
+
+    python benchmarks/bench_layout.py [--stack lvm|raid0|raid1|raid10] [--disks 4] [--size-gb 4]
+
+All loop devices sit on the file system holding --dir, so the gain shown is
+from overlapping mkfs's CPU work and flushes, not from independent spindles.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.disk import DiskManager
+from arch_installer.layout import Layout, Volume, backend, volume_name
+from arch_installer.utils import run
+
+VOLUMES = [("/", 1 << 10), ("/var", 1 << 10), ("/scratch", 1 << 10), ("/home", None)]
+STACK_TOOLS = {"lvm": "pvcreate", "raid0": "mdadm", "raid1": "mdadm", "raid10": "mdadm"}
+
+def make_layout(loops, stack, filesystem):
+    volumes = [Volume(volume_name(mountpoint), mountpoint, size, filesystem) for mountpoint, size in VOLUMES]
+    if stack == "lvm":
+        return Layout(loops, volumes, lvm=True)
+    return Layout(loops, volumes, raid=int(stack[len("raid"):]))
+
+def serial(layout, root):
+    """Tables one disk at a time, then one mkfs after the other"""
+    start = time.monotonic()
+    for index in range(len(layout.disks)):
+        DiskManager.write_table(layout, index)
+    for cmd in layout.assemble_commands():
+        run(cmd)
+    partitioned = time.monotonic()
+    for _, name, path in layout.filesystems():
+        backend(name).format(path)
+    DiskManager.mount_layout(layout, root)
+    return partitioned - start, time.monotonic() - partitioned
+
+def parallel(layout, root):
+    start = time.monotonic()
+    DiskManager.partition_disk(layout)
+    partitioned = time.monotonic()
+    DiskManager.format_and_mount(layout, root)
+    return partitioned - start, time.monotonic() - partitioned
+
+def bench(name, func, args, tmp):
+    loops = []
+    root = os.path.join(tmp, name)
+    os.makedirs(root)
+    layout = None
+    try:
+        for i in range(args.disks):
+            image = os.path.join(tmp, f"{name}{i}.img")
+            with open(image, "wb") as f:
+                f.truncate(args.size_gb << 30)
+            loops.append(subprocess.check_output(["losetup", "-f", "--show", "-P", image], text=True).strip())
+        layout = make_layout(loops, args.stack, args.filesystem)
+        partition, mkfs = func(layout, root)
+    finally:
+        subprocess.run(["umount", "-R", root], stderr=subprocess.DEVNULL)
+        if layout is not None and layout.lvm:
+            subprocess.run(["vgremove", "-ff", "--yes", layout.volume_group], stderr=subprocess.DEVNULL)
+        if layout is not None and layout.raid is not None:
+            for array in ["lvm"] + [volume.name for volume in layout.volumes]:
+                if os.path.exists(layout.array(array)):
+                    subprocess.run(["mdadm", "--stop", layout.array(array)], stderr=subprocess.DEVNULL)
+        for loop in loops:
+            subprocess.run(["losetup", "-d", loop])
+    print(f"{name:10} {partition:9.2f}s {mkfs:9.2f}s {partition + mkfs:9.2f}s")
+    return partition + mkfs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stack", choices=sorted(STACK_TOOLS), default="lvm", help="what joins the disks")
+    parser.add_argument("--disks", type=int, default=4, help="loop devices in the layout")
+    parser.add_argument("--size-gb", type=int, default=4, help="size of each loop device")
+    parser.add_argument("--filesystem", default="ext4", help="filesystem of every volume")
+    parser.add_argument("--dir", help="where the backing files go")
+    args = parser.parse_args()
+
+    tools = ["losetup", "sfdisk", "mkfs.fat", f"mkfs.{args.filesystem}", STACK_TOOLS[args.stack]]
+    missing = [tool for tool in tools if not shutil.which(tool)]
+    if os.geteuid() != 0 or missing:
+        raise SystemExit("needs root and " + ", ".join(missing or tools))
+
+    print(f"{'run':10} {'partition':>10} {'mkfs':>10} {'total':>10}")
+    with tempfile.TemporaryDirectory(prefix="bench-layout-", dir=args.dir) as tmp:
+        before = bench("serial", serial, args, tmp)
+        after = bench("parallel", parallel, args, tmp)
+    print(f"{args.disks} disks on {args.stack}: {before / after:.2f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Time keypresses in the menu list for lists of different sizes
+
+Runs without a terminal: the window only counts writes. Typing is a
+filter query, scrolling pages down and back up:
+
+    python benchmarks/bench_listview.py [--sizes 5,500,50000]
+"""
+
+import argparse
+import curses
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.ui.listview import ListView
+
+class CountingWindow:
+    def __init__(self, height=40, width=80):
+        self.size = (height, width)
+        self.writes = 0
+
+    def getmaxyx(self):
+        return self.size
+
+    def addstr(self, y, x, text, attr=0):
+        self.writes += 1
+
+def options(count):
+    langs = ["de", "en", "es", "fr", "ja", "pt", "ru", "vi", "zh"]
+    return [f"{langs[i % len(langs)]}_{i:05d}.UTF-8" for i in range(count)]
+
+def per_key(view, keys):
+    """Worst and mean milliseconds for handling and drawing each key"""
+    times = []
+    for key in keys:
+        start = time.perf_counter()
+        view.handle(key)
+        view.draw()
+        times.append((time.perf_counter() - start) * 1000)
+    return max(times), sum(times) / len(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5,500,5000,50000", help="comma separated list sizes")
+    args = parser.parse_args()
+
+    print(f"{'options':>8} {'index':>9} {'scroll max':>11} {'mean':>7} {'type max':>9} {'mean':>7} {'writes/key':>11}")
+    for size in map(int, args.sizes.split(",")):
+        win = CountingWindow()
+        start = time.perf_counter()
+        view = ListView(win, options(size))
+        build = (time.perf_counter() - start) * 1000
+        view.draw()
+
+        win.writes = 0
+        scroll = [curses.KEY_DOWN] * 50 + [curses.KEY_NPAGE] * 10 + [curses.KEY_UP] * 50
+        scroll_max, scroll_mean = per_key(view, scroll)
+        writes = win.writes / len(scroll)
+        typing = [ord(c) for c in "en_01"] + [curses.KEY_BACKSPACE] * 5 + [ord(c) for c in "9.utf"]
+        type_max, type_mean = per_key(view, typing)
+        print(f"{size:8} {build:7.1f}ms {scroll_max:9.3f}ms {scroll_mean:5.3f}ms "
+              f"{type_max:7.3f}ms {type_mean:5.3f}ms {writes:11.1f}")
+
+if __name__ == "__main__":
+    main()
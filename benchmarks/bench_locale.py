@@ -0,0 +1,59 @@
+"""Time loading the locale menu and generating locales, fresh and from the archive cache
+
+Menu loading compares the old `locale -a` call with reading the SUPPORTED
+list under --root. With --generate, locales are set up twice in --root (an
+installed system with glibc's locale sources, e.g. /mnt after pacstrap):
+once compiled, once copied from the cache.
+
+    python benchmarks/bench_locale.py [--root /mnt] [--generate] [--locale de_DE.UTF-8]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.locale import LocaleManager, SupportedLocales, ARCHIVE_PATH, STAMP_PATH
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:28} {elapsed * 1000:9.2f}ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default="/", help="system whose SUPPORTED list is read")
+    parser.add_argument("--generate", action="store_true", help="also run locale generation in root")
+    parser.add_argument("--locale", default="de_DE.UTF-8", help="locale to generate")
+    args = parser.parse_args()
+
+    timed("menu: locale -a", lambda: subprocess.run("locale -a", shell=True, capture_output=True, text=True), 20)
+    if SupportedLocales.load(args.root) is None:
+        print(f"no SUPPORTED list under {args.root}, skipping the index")
+    else:
+        SupportedLocales._loaded.clear()
+        names = timed("menu: SUPPORTED, first", lambda: LocaleManager.get_available_locales(args.root))
+        timed("menu: SUPPORTED, cached", lambda: LocaleManager.get_available_locales(args.root), 20)
+        print(f"{len(names)} locales")
+
+    if not args.generate:
+        return
+    conf = {key: args.locale for key in ("locale", "lang", "time_format", "number_format", "currency_format")}
+    with tempfile.TemporaryDirectory(prefix="bench-locale-") as cache:
+        for label in ("generate: compiled", "generate: from cache"):
+            # Drop the stamp so only the cache can spare the compile
+            for path in (STAMP_PATH, ARCHIVE_PATH):
+                if os.path.exists(os.path.join(args.root, path)):
+                    os.remove(os.path.join(args.root, path))
+            how = timed(label, lambda: LocaleManager.setup_locale(conf, args.root, cache_dir=cache))
+            print(f"{'':28} {how}")
+
+if __name__ == "__main__":
+    main()
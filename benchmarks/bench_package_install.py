@@ -0,0 +1,82 @@
+"""Compare batched and per-package pacstrap runs against a stubbed pacstrap
+
+The stub sleeps for a fixed per-transaction cost (database sync, dependency
+resolution, hooks) plus a small per-package cost, and prints pacman's
+"(n/N) installing pkg" lines so the status parser is exercised too.
+
+    python benchmarks/bench_package_install.py [--overhead 0.5] [--per-package 0.02]
+"""
+
+import argparse
+import os
+import stat
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.packages import PackageManager
+
+PACSTRAP_STUB = """#!/bin/sh
+shift 2  # -K /mnt
+sleep {overhead}
+i=0
+for pkg in "$@"; do
+    i=$((i + 1))
+    sleep {per_package}
+    echo "($i/$#) installing $pkg"
+done
+"""
+
+class NullUI:
+    """UI that only counts status updates"""
+
+    def __init__(self):
+        self.updates = 0
+
+    def show_package_installation(self, packages):
+        pass
+
+    def update_package_status(self, package, status):
+        self.updates += 1
+
+    def update_package_progress(self, package, current, total):
+        self.updates += 1
+
+    def show_transaction_progress(self, progress):
+        self.updates += 1
+
+    def show_package_message(self, message):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--overhead", type=float, default=0.5,
+                        help="seconds per pacstrap transaction")
+    parser.add_argument("--per-package", type=float, default=0.02,
+                        help="seconds per installed package")
+    args = parser.parse_args()
+
+    pkgs = PackageManager.get_package_list("linux", "intel", "bspwm")
+
+    with tempfile.TemporaryDirectory() as bindir:
+        stub = os.path.join(bindir, "pacstrap")
+        with open(stub, "w") as f:
+            f.write(PACSTRAP_STUB.format(overhead=args.overhead, per_package=args.per_package))
+        os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+        os.environ["PATH"] = bindir + os.pathsep + os.environ["PATH"]
+
+        results = {}
+        for batch in (False, True):
+            start = time.monotonic()
+            PackageManager().install_packages(NullUI(), pkgs, batch=batch)
+            results[batch] = time.monotonic() - start
+
+    print(f"packages:     {len(pkgs)}")
+    print(f"per-package:  {results[False]:.2f}s")
+    print(f"batched:      {results[True]:.2f}s")
+    print(f"speedup:      {results[False] / results[True]:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compare peak memory of streamed command output against capturing all of it
+
+Runs a synthetic command printing --size-mb of 1 KiB lines, first through
+utils.run and then through subprocess.run(capture_output=True), each in a
+fresh process so the peak RSS of one does not hide the other:
+
+    python benchmarks/bench_run_memory.py --size-mb 1024
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+def command(size_mb):
+    return f"yes $(printf '%01023d' 0) | head -c {size_mb << 20}"
+
+def measure(mode, size_mb):
+    """Run the command once in this process and print seconds and peak RSS"""
+    from arch_installer.utils import run
+
+    cmd = command(size_mb)
+    start = time.monotonic()
+    if mode == "stream":
+        run(cmd)
+    else:
+        subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    elapsed = time.monotonic() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:8} {size_mb} MiB in {elapsed:6.2f}s, peak RSS {peak_mb:7.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--mode", choices=["stream", "capture"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.size_mb)
+        return
+    for mode in ("stream", "capture"):
+        subprocess.run([sys.executable, __file__, "--mode", mode, "--size-mb", str(args.size_mb)],
+                       stderr=subprocess.DEVNULL, check=True)
+
+if __name__ == "__main__":
+    main()
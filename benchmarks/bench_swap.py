@@ -0,0 +1,39 @@
+"""Time swap file allocation with fallocate against a streamed zero-fill
+
+Run it on the filesystem under test, e.g. a mounted ext4 or xfs loop device:
+
+    python benchmarks/bench_swap.py /mnt/test --size-mb 16384
+"""
+
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from arch_installer.swap import allocate_file
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="directory on the filesystem to test")
+    parser.add_argument("--size-mb", type=int, default=4096)
+    args = parser.parse_args()
+
+    path = os.path.join(args.directory, "bench-swapfile")
+    try:
+        start = time.monotonic()
+        method = allocate_file(path, args.size_mb)
+        print(f"{method:10} {args.size_mb} MiB in {time.monotonic() - start:.2f}s")
+
+        with patch("arch_installer.swap._fallocate", return_value=False):
+            start = time.monotonic()
+            method = allocate_file(path, args.size_mb)
+        print(f"{method:10} {args.size_mb} MiB in {time.monotonic() - start:.2f}s")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,93 @@
 #!/usr/bin/env python3
 """Main entry point for arch-installer"""
 
+import argparse
 import curses
+import signal
+import sys
+from arch_installer import utils
+from arch_installer.engine import CommandEngine, CommandCancelled, cancel_on_signals
 from arch_installer.installer import Installer
+from arch_installer.multi import MultiInstaller
+from arch_installer.config import load_config, ConfigError
+from arch_installer.ui.headless import HeadlessUI
 
-def main():
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(prog="arch-installer")
+    parser.add_argument("--config", metavar="FILE",
+                        help="run unattended from a YAML/JSON config file, '-' for stdin")
+    parser.add_argument("--disks", metavar="DISK[,DISK...]",
+                        help="with --config, install onto all of these disks in parallel")
+    return parser.parse_args(argv)
+
+def run_unattended(path, disks=None):
+    """Install from a config file, printing JSON progress events"""
+    ui = HeadlessUI()
+    try:
+        config = load_config(path)
+    except (ConfigError, ValueError, OSError) as e:
+        ui.emit("error", message=str(e))
+        return 1
+
+    if disks:
+        return run_parallel(config, disks)
+
+    ui.reboot = bool(config.get('reboot', False))
+    try:
+        Installer(ui=ui, config=config, target=config.get('target', "/mnt")).run()
+    except SystemExit as e:
+        ui.emit("error", message=str(e))
+        return 1
+    except Exception:
+        # Installer.run already reported the failure
+        return 1
+    return 0
+
+def run_parallel(config, disks):
+    """Install onto several disks at once; never reboots"""
+    multi = MultiInstaller(config, disks)
+    try:
+        results = multi.run()
+    except SystemExit as e:
+        HeadlessUI().emit("error", message=str(e))
+        return 1
+    except Exception:
+        # The failing target already reported the error
+        return 1
+
+    HeadlessUI().emit("summary", results={name: str(error) if error else "ok"
+                                          for name, error in results.items()})
+    return 1 if any(results.values()) else 0
+
+def main(argv=None):
     """Main function"""
+    args = parse_args(argv)
+    # Commands run on the engine's loop, unless a runner was set already (tests)
+    engine = CommandEngine() if utils.get_runner() is None else None
+    handlers = {}
+    if engine is not None:
+        engine.start()
+        utils.set_runner(engine)
+        # Ctrl-C and SIGTERM kill the commands' process groups and stop the steps
+        handlers = cancel_on_signals(engine)
     try:
-        curses.wrapper(lambda stdscr: Installer(stdscr).run())
-    except KeyboardInterrupt:
-        print("\nInstallation cancelled by user.")
-    except Exception as e:
-        print(f"Fatal error: {e}")
+        if args.config:
+            disks = args.disks.split(",") if args.disks else None
+            sys.exit(run_unattended(args.config, disks))
+
+        try:
+            curses.wrapper(lambda stdscr: Installer(stdscr, engine=engine).run())
+        except (KeyboardInterrupt, CommandCancelled):
+            print("\nInstallation cancelled by user.")
+        except Exception as e:
+            print(f"Fatal error: {e}")
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        if engine is not None:
+            utils.set_runner(None)
+            engine.close()
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,26 @@
 """GRUB configuration"""
 
-from arch_installer.utils import run
+import os
+from arch_installer.chroot import ChrootSession
+from arch_installer.bootloader.render import grub_cfg, kernel_options
 
 class Grub:
     """GRUB bootloader manager"""
-    
-    def install(self, root_partition, kernel, gpu, microcode_file=None):
-        """Install and configure GRUB"""
-        run("arch-chroot /mnt pacman -S --noconfirm grub efibootmgr")
-        run("arch-chroot /mnt grub-install --target=x86_64-efi --efi-directory=/boot --bootloader-id=GRUB")
-        
-        # Add microcode if available
-        if microcode_file:
-            run(f"arch-chroot /mnt sed -i 's/GRUB_CMDLINE_LINUX_DEFAULT=\"/GRUB_CMDLINE_LINUX_DEFAULT=\"initrd=\\\\{microcode_file} /' /etc/default/grub")
-        
-        run("arch-chroot /mnt grub-mkconfig -o /boot/grub/grub.cfg")
+
+    # Installed with the other packages rather than in a transaction of their own
+    packages = ["grub", "efibootmgr"]
+
+    def install(self, root_uuid, efi_uuid, kernel, gpu, microcode_file=None, root="/mnt", chroot=None,
+                fallback=True, filesystem="ext4"):
+        """Install GRUB and write its config directly
+
+        grub-mkconfig would run os-prober and probe every attached disk to
+        find what this installer already knows.
+        """
+        with ChrootSession.reuse(chroot, root) as session:
+            session.run("grub-install --target=x86_64-efi --efi-directory=/boot --bootloader-id=GRUB")
+
+        os.makedirs(f"{root}/boot/grub", exist_ok=True)
+        with open(f"{root}/boot/grub/grub.cfg", "w") as f:
+            f.write(grub_cfg(kernel, kernel_options(root_uuid, filesystem, gpu), efi_uuid,
+                             microcode_file, fallback))
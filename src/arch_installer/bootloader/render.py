@@ -0,0 +1,62 @@
+"""Bootloader configuration rendered from templates"""
+
+LOADER_CONF = """default arch.conf
+timeout 3
+console-mode keep
+editor no
+"""
+
+SYSTEMD_BOOT_ENTRY = """title Arch Linux ({kernel}){suffix}
+linux /vmlinuz-{kernel}
+{initrds}options {options}
+"""
+
+# Kernels, microcode and images sit on the ESP, mounted at /boot, so GRUB
+# only ever has to find that one filesystem
+GRUB_CFG = """# Generated by arch-installer
+insmod part_gpt
+insmod fat
+insmod all_video
+set default=0
+set timeout={timeout}
+set gfxpayload=keep
+search --no-floppy --fs-uuid --set=root {efi_uuid}
+{entries}"""
+
+GRUB_ENTRY = """
+menuentry 'Arch Linux ({kernel}){suffix}' {{
+    linux /vmlinuz-{kernel} {options}
+    initrd {initrds}
+}}
+"""
+
+def kernel_options(root_uuid, filesystem="ext4", gpu=None):
+    """Kernel command line finding the root by filesystem UUID"""
+    options = f"root=UUID={root_uuid} rw rootfstype={filesystem} quiet"
+    if gpu == "nvidia":
+        options += " nvidia-drm.modeset=1"
+    return options
+
+def _images(kernel, microcode_file, fallback):
+    """(title suffix, initramfs images in load order) for each entry"""
+    microcode = [f"/{microcode_file}"] if microcode_file else []
+    images = [("", microcode + [f"/initramfs-{kernel}.img"])]
+    if fallback:
+        images.append((" (fallback)", microcode + [f"/initramfs-{kernel}-fallback.img"]))
+    return images
+
+def systemd_boot_entries(kernel, options, microcode_file=None, fallback=True):
+    """{file name below loader/entries: contents}"""
+    entries = {}
+    for suffix, images in _images(kernel, microcode_file, fallback):
+        name = "arch-fallback.conf" if suffix else "arch.conf"
+        entries[name] = SYSTEMD_BOOT_ENTRY.format(
+            kernel=kernel, suffix=suffix, options=options,
+            initrds="".join(f"initrd {image}\n" for image in images))
+    return entries
+
+def grub_cfg(kernel, options, efi_uuid, microcode_file=None, fallback=True, timeout=3):
+    """grub.cfg with the entries grub-mkconfig would write for this system, without probing"""
+    entries = "".join(GRUB_ENTRY.format(kernel=kernel, suffix=suffix, options=options, initrds=" ".join(images))
+                      for suffix, images in _images(kernel, microcode_file, fallback))
+    return GRUB_CFG.format(timeout=timeout, efi_uuid=efi_uuid, entries=entries)
@@ -1,49 +1,39 @@
 """systemd-boot configuration"""
 
-from arch_installer.utils import run
-from arch_installer.microcode import MicrocodeManager
+import os
+from arch_installer.chroot import ChrootSession
+from arch_installer.bootloader.render import LOADER_CONF, kernel_options, systemd_boot_entries
 
 class SystemdBoot:
     """systemd-boot bootloader manager"""
-    
-    def install(self, root_partition, kernel, gpu, microcode_file=None):
+
+    # bootctl comes with systemd in base
+    packages = []
+
+    def install(self, root_uuid, kernel, gpu, microcode_file=None, root="/mnt", chroot=None,
+                fallback=True, filesystem="ext4"):
         """Install and configure systemd-boot"""
-        run("arch-chroot /mnt bootctl install")
-        
-        # Create loader.conf
-        loader_conf = """default arch.conf
-timeout 3
-console-mode keep
-editor no
-"""
-        with open("/mnt/boot/loader/loader.conf", "w") as f:
-            f.write(loader_conf)
-        
-        # Add microcode if available
-        microcode_initrd = ""
-        if microcode_file:
-            microcode_initrd = f"initrd /{microcode_file}\n"
-        
-        # Create main Arch Linux entry
-        options = f"root={root_partition} rw quiet"
-        if gpu == "nvidia":
-            options += " nvidia-drm.modeset=1"
-        
-        arch_entry = f"""title Arch Linux ({kernel})
-linux /vmlinuz-{kernel}
-{microcode_initrd}initrd /initramfs-{kernel}.img
-options {options}
-"""
-        import os
-        os.makedirs("/mnt/boot/loader/entries", exist_ok=True)
-        with open("/mnt/boot/loader/entries/arch.conf", "w") as f:
-            f.write(arch_entry)
-        
-        # Create fallback entry
-        arch_fallback = f"""title Arch Linux ({kernel}) (fallback)
-linux /vmlinuz-{kernel}
-{microcode_initrd}initrd /initramfs-{kernel}-fallback.img
-options {options}
-"""
-        with open("/mnt/boot/loader/entries/arch-fallback.conf", "w") as f:
-            f.write(arch_fallback)
+        self.install_loader(root, chroot)
+        self.write_entries(root_uuid, kernel, gpu, microcode_file, root, fallback, filesystem)
+
+    def install_loader(self, root="/mnt", chroot=None):
+        """Install the boot loader and its loader.conf"""
+        with ChrootSession.reuse(chroot, root) as session:
+            session.run("bootctl install")
+
+        with open(f"{root}/boot/loader/loader.conf", "w") as f:
+            f.write(LOADER_CONF)
+
+    def write_entries(self, root_uuid, kernel, gpu, microcode_file=None, root="/mnt", fallback=True,
+                      filesystem="ext4"):
+        """Write the default boot entry, and the fallback one unless its image is skipped"""
+        entries = systemd_boot_entries(kernel, kernel_options(root_uuid, filesystem, gpu),
+                                       microcode_file, fallback)
+        os.makedirs(f"{root}/boot/loader/entries", exist_ok=True)
+        for name, text in entries.items():
+            with open(f"{root}/boot/loader/entries/{name}", "w") as f:
+                f.write(text)
+
+        fallback_path = f"{root}/boot/loader/entries/arch-fallback.conf"
+        if not fallback and os.path.exists(fallback_path):
+            os.remove(fallback_path)
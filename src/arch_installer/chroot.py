@@ -0,0 +1,166 @@
+"""Persistent chroot sessions"""
+
+import contextlib
+import logging
+import os
+import re
+import subprocess
+from arch_installer.utils import run, run_lines, safe_run
+
+# Marker printed after every command of a batch, followed by its exit code
+BATCH_MARKER = "@@arch-installer-exit"
+BATCH_RE = re.compile(rf"^{BATCH_MARKER} (\d+) (\d+)$")
+
+class ChrootResult:
+    """Exit code and output of one command run in a chroot"""
+
+    def __init__(self, cmd, returncode, output):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+
+    def __repr__(self):
+        return f"ChrootResult({self.cmd!r}, {self.returncode})"
+
+class ChrootSession:
+    """Set up a chroot once and run many commands through it
+
+    Mounts the same API filesystems as arch-chroot, but only once instead
+    of for every command. Use it as a context manager so everything is
+    unmounted again, also when a command fails.
+    """
+
+    # (source, target below the root, type, options), in mount order
+    MOUNTS = [
+        ("proc", "proc", "proc", "nosuid,noexec,nodev"),
+        ("sys", "sys", "sysfs", "nosuid,noexec,nodev,ro"),
+        ("efivarfs", "sys/firmware/efi/efivars", "efivarfs", "nosuid,noexec,nodev"),
+        ("udev", "dev", "devtmpfs", "mode=0755,nosuid"),
+        ("devpts", "dev/pts", "devpts", "mode=0620,gid=5,nosuid,noexec"),
+        ("shm", "dev/shm", "tmpfs", "mode=1777,nosuid,nodev"),
+        ("/run", "run", None, "bind"),
+        ("tmp", "tmp", "tmpfs", "mode=1777,strictatime,nodev,nosuid"),
+    ]
+
+    def __init__(self, root="/mnt"):
+        self.root = root
+        self.mounts = []
+
+    @classmethod
+    def reuse(cls, session, root="/mnt"):
+        """Context manager yielding session, or a new one for root when None"""
+        if session is not None:
+            return contextlib.nullcontext(session)
+        return cls(root)
+
+    def __enter__(self):
+        self.setup()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.teardown()
+        return False
+
+    @property
+    def active(self):
+        return bool(self.mounts)
+
+    def setup(self):
+        """Mount the API filesystems and the host resolv.conf"""
+        try:
+            for source, target, fstype, options in self.MOUNTS:
+                if target.startswith("sys/firmware/efi") and not os.path.isdir("/sys/firmware/efi/efivars"):
+                    continue
+                path = os.path.join(self.root, target)
+                run(f"mkdir -p {path}")
+                if fstype:
+                    run(f"mount -t {fstype} -o {options} {source} {path}")
+                else:
+                    run(f"mount --bind {source} {path}")
+                self.mounts.append(path)
+
+            resolv = os.path.join(self.root, "etc/resolv.conf")
+            if os.path.exists("/etc/resolv.conf") and os.path.exists(resolv):
+                run(f"mount --bind /etc/resolv.conf {resolv}")
+                self.mounts.append(resolv)
+        except Exception:
+            self.teardown()
+            raise
+
+    def teardown(self):
+        """Unmount everything in reverse order, lazily if something is still busy"""
+        while self.mounts:
+            path = self.mounts.pop()
+            try:
+                run(f"umount {path}")
+            except subprocess.CalledProcessError:
+                logging.warning(f"{path} busy, detaching lazily")
+                safe_run(f"umount -l {path}")
+
+    def _command(self, script):
+        return ["chroot", self.root, "/bin/sh", "-c", script]
+
+    def run(self, cmd, check=True):
+        """Run one shell command inside the chroot"""
+        if not self.active:
+            raise Exception(f"Chroot session for {self.root} is not set up")
+        lines = []
+        returncode = run_lines(self._command(cmd), lines.append)
+        result = ChrootResult(cmd, returncode, "\n".join(lines))
+        if check and returncode != 0:
+            logging.error(f"Command failed in chroot: {cmd}\n{result.output}")
+            raise subprocess.CalledProcessError(returncode, cmd, result.output)
+        return result
+
+    def run_batch(self, cmds, check=True):
+        """Run several commands in a single chroot process
+
+        Each command runs in its own subshell; its exit code and output are
+        reported separately. With check, the batch stops at the first failure
+        and raises for it.
+        """
+        if not self.active:
+            raise Exception(f"Chroot session for {self.root} is not set up")
+
+        parts = []
+        for i, cmd in enumerate(cmds):
+            parts.append(f"( {cmd}\n) 2>&1; rc=$?; echo; echo \"{BATCH_MARKER} {i} $rc\"")
+            if check:
+                parts.append("[ $rc -eq 0 ] || exit 0")
+        lines = []
+        returncode = run_lines(self._command("\n".join(parts)), lines.append,
+                               label=self._label(cmds[0] if cmds else ""))
+
+        results = []
+        output = []
+        for line in lines:
+            match = BATCH_RE.match(line)
+            if not match:
+                output.append(line)
+                continue
+            index, returncode = int(match.group(1)), int(match.group(2))
+            # Drop the blank line printed before each marker
+            if output and output[-1] == "":
+                output.pop()
+            results.append(ChrootResult(cmds[index], returncode, "\n".join(output)))
+            output = []
+
+        for result in results:
+            if check and result.returncode != 0:
+                label = self._label(result.cmd)
+                logging.error(f"Command failed in chroot: {label}\n{result.output}")
+                raise subprocess.CalledProcessError(result.returncode, label, result.output)
+        if len(results) != len(cmds):
+            # The shell itself died, e.g. chroot could not start it
+            label = self._label(cmds[len(results)])
+            logging.error(f"Chroot batch stopped at: {label}\n" + "\n".join(output))
+            raise subprocess.CalledProcessError(returncode or 1, label, "\n".join(output))
+        return results
+
+    def _label(self, cmd):
+        """Name of a batch command for logs, traces and errors
+
+        The scripts may carry passwords, so only the first program is shown.
+        """
+        words = cmd.lstrip("( ").split()
+        return f"chroot {self.root} {words[0] if words else 'sh'}"
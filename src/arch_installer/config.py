@@ -0,0 +1,186 @@
+"""Unattended configuration loading and validation"""
+
+import json
+import re
+import sys
+from arch_installer.layout import Layout, PRESETS
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional, the sample config fits the subset parser
+    yaml = None
+
+KERNELS = ["linux", "linux-lts", "linux-zen", "None"]
+GPUS = ["intel", "amd", "nvidia", "None"]
+WMDES = ["hyprland", "bspwm", "gnome", "kde", "None"]
+BOOTLOADERS = ["systemd-boot", "grub", "None"]
+FILESYSTEMS = ["ext4", "xfs", "btrfs"]
+LAYOUTS = list(PRESETS)
+SWAP_MODES = ["swapfile", "zram", "zram+swapfile", "None"]
+# All of linux-firmware, or the split packages for the detected devices
+FIRMWARE_MODES = ["full", "detected"]
+LOCALE_KEYS = ["locale", "lang", "time_format", "number_format", "currency_format"]
+# Initramfs compressors and the levels each accepts
+COMPRESSION_LEVELS = {"zstd": (1, 19), "lz4": (1, 12), "gzip": (1, 9), "xz": (0, 9)}
+INITRAMFS_DEFAULTS = {'defer': True, 'compression': "zstd", 'level': None, 'fallback': True}
+
+DEFAULTS = {
+    'username': None,
+    'kernel': "linux",
+    'gpu': "None",
+    'wmde': "None",
+    'bootloader': "systemd-boot",
+    'filesystem': "ext4",
+    'layout': "default",
+    'firmware': "full",
+    'use_swap': True,
+    'swap': "swapfile",
+    'hibernate': False,
+    'reboot': False,
+}
+
+# Keys read from the config besides the defaults; anything else is a typo
+CONFIG_KEYS = set(DEFAULTS) | {'disk', 'rootpass', 'userpass', 'locale', 'initramfs', 'image', 'target',
+                               'trace_file', 'cache_dir', 'cache_max_gb', 'swap_size_mb'}
+
+USERNAME_RE = re.compile(r"^[a-z_][a-z0-9_-]{0,31}$")
+
+class ConfigError(Exception):
+    """Raised when an unattended configuration is invalid"""
+
+def _scalar(value):
+    """Convert a YAML scalar of the subset we support"""
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    lowered = value.lower()
+    if lowered in ("true", "yes"):
+        return True
+    if lowered in ("false", "no"):
+        return False
+    if lowered in ("null", "~", ""):
+        return None
+    if re.match(r"^-?\d+$", value):
+        return int(value)
+    return value
+
+def parse_simple_yaml(text):
+    """Parse flat mappings with one level of nesting, as in the sample config
+
+    Lists and flow collections need PyYAML and raise ConfigError here.
+    """
+    config = {}
+    section = None
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        if line.lstrip() == "-" or line.lstrip().startswith("- "):
+            raise ConfigError(f"line {number}: lists need PyYAML installed")
+        if ":" not in line:
+            raise ConfigError(f"line {number}: expected 'key: value'")
+
+        key, value = line.split(":", 1)
+        nested = line[0] in " \t"
+        key = key.strip()
+        value = value.strip()
+        if not value.startswith(("'", '"')):
+            value = value.split(" #")[0]
+        if value.startswith(("{", "[")):
+            raise ConfigError(f"line {number}: flow collections need PyYAML installed")
+        if nested:
+            if section is None:
+                raise ConfigError(f"line {number}: unexpected indentation")
+            config[section][key] = _scalar(value)
+        elif value.strip():
+            config[key] = _scalar(value)
+            section = None
+        else:
+            config[key] = {}
+            section = key
+    return config
+
+def load_config(path):
+    """Read a YAML or JSON config from a file, or stdin when path is "-" """
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r") as f:
+            text = f.read()
+
+    if text.lstrip().startswith("{"):
+        config = json.loads(text)
+    elif yaml is not None:
+        config = yaml.safe_load(text)
+    else:
+        config = parse_simple_yaml(text)
+
+    if not isinstance(config, dict):
+        raise ConfigError("configuration must be a mapping")
+    return config
+
+def _check_choice(errors, config, key, choices):
+    if config.get(key) not in choices:
+        errors.append(f"{key} must be one of {', '.join(choices)}, got {config.get(key)!r}")
+
+def validate_config(config, disks, detected=None, parallel=False):
+    """Fill defaults and check every value, raising ConfigError listing all problems
+
+    detected holds values suggested by the hardware, used where the config
+    has none. parallel is set for one of several targets installed at once,
+    which cannot share extra layout devices.
+    """
+    errors = [f"unknown key {key!r}" for key in config if key not in CONFIG_KEYS]
+    config = dict(DEFAULTS, **dict(detected or {}, **config))
+
+    if config.get('disk') not in disks:
+        errors.append(f"disk {config.get('disk')!r} is not one of the available disks: {', '.join(disks)}")
+
+    for key in ('rootpass', 'userpass'):
+        # Passwords are passed to chpasswd inside single quotes
+        if "'" in str(config.get(key) or ""):
+            errors.append(f"{key} must not contain single quotes")
+    if not config.get('rootpass'):
+        errors.append("rootpass is required")
+
+    if config['username'] is not None:
+        if not USERNAME_RE.match(str(config['username'])):
+            errors.append(f"username {config['username']!r} is not a valid login name")
+        if not config.get('userpass'):
+            errors.append("userpass is required when username is set")
+
+    _check_choice(errors, config, 'kernel', KERNELS)
+    _check_choice(errors, config, 'gpu', GPUS)
+    _check_choice(errors, config, 'wmde', WMDES)
+    _check_choice(errors, config, 'bootloader', BOOTLOADERS)
+    _check_choice(errors, config, 'filesystem', FILESYSTEMS)
+    _check_choice(errors, config, 'swap', SWAP_MODES)
+    try:
+        layout = Layout.from_config(config)
+        errors += layout.errors(disks)
+        if parallel and (len(layout.disks) > 1 or layout.raid is not None or layout.lvm):
+            errors.append("layout devices, raid and lvm cannot be used when installing onto several disks")
+    except ValueError as e:
+        errors.append(str(e))
+    _check_choice(errors, config, 'firmware', FIRMWARE_MODES)
+
+    locale = config.get('locale')
+    if locale is None:
+        config['locale'] = {key: "en_US.UTF-8" for key in LOCALE_KEYS}
+    elif not isinstance(locale, dict) or any(not locale.get(key) for key in LOCALE_KEYS):
+        errors.append(f"locale must set {', '.join(LOCALE_KEYS)}")
+
+    initramfs = config.get('initramfs') or {}
+    if not isinstance(initramfs, dict):
+        errors.append("initramfs must be a mapping")
+    else:
+        config['initramfs'] = initramfs = dict(INITRAMFS_DEFAULTS, **initramfs)
+        _check_choice(errors, initramfs, 'compression', list(COMPRESSION_LEVELS))
+        levels = COMPRESSION_LEVELS.get(initramfs['compression'])
+        level = initramfs['level']
+        if levels and level is not None and (not isinstance(level, int) or not levels[0] <= level <= levels[1]):
+            errors.append(f"initramfs level for {initramfs['compression']} must be "
+                          f"{levels[0]} to {levels[1]}, got {level!r}")
+
+    if errors:
+        raise ConfigError("invalid configuration:\n  " + "\n  ".join(errors))
+    return config
@@ -1,68 +1,120 @@
 """Disk management functions"""
 
 import os
+import shlex
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from arch_installer.inventory import Inventory, human_size
+from arch_installer.layout import Layout, backend, partition_path
+from arch_installer.tracing import tracer
 from arch_installer.utils import run, safe_run
 
+# Seconds before a hanging umount, e.g. of a dead network share, is given up
+UMOUNT_TIMEOUT = 60
+
+def _concurrently(func, items, label):
+    """func on every item at once, returning the results in order
+
+    Threads are named after the calling one and attribute their commands to
+    its step, so parallel installs keep their own logs and traces.
+    """
+    prefix = threading.current_thread().name
+    step = getattr(tracer.local, "step", None)
+
+    def call(item):
+        tracer.local.step = step
+        return func(item)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(items)), thread_name_prefix=f"{prefix}-{label}") as pool:
+        return list(pool.map(call, items))
+
 class DiskManager:
     """Manage disk operations"""
     
     @staticmethod
-    def list_disks():
+    def list_disks(inventory=None):
         """List available disks"""
-        out = subprocess.check_output("lsblk -d -n -o NAME,SIZE,TYPE", shell=True, text=True)
-        disks = []
-        for line in out.strip().split("\n"):
-            parts = line.split()
-            if len(parts) >= 3 and parts[2] == "disk":
-                name, size = parts[0], parts[1]
-                disks.append(f"/dev/{name} ({size})")
-        return disks
+        inventory = inventory or Inventory.scan()
+        return [f"{disk.path} ({human_size(disk.size)})" for disk in inventory.disks()]
+
+    @staticmethod
+    def is_disk_mounted(disk, inventory=None):
+        """Check if disk, its partitions or anything stacked on them is mounted"""
+        inventory = inventory or Inventory.scan()
+        return inventory.is_mounted(disk)
+
+    @staticmethod
+    def unmount_disk(disk, inventory=None):
+        """Unmount disk and its partitions, deepest mountpoint first
+
+        Volume groups and arrays left on the disk by an earlier install are
+        stopped too, so nothing holds the partitions sfdisk is about to replace.
+        """
+        inventory = inventory or Inventory.scan()
+        for device in inventory.swap_devices(disk):
+            safe_run(["swapoff", device.path])
+        for mount_point in inventory.mountpoints(disk):
+            try:
+                run(["umount", mount_point], timeout=UMOUNT_TIMEOUT)
+            except subprocess.SubprocessError:
+                safe_run(["umount", "-l", mount_point])
+        for group in inventory.volume_groups(disk):
+            safe_run(["vgchange", "-an", group])
+        for array in inventory.arrays(disk):
+            safe_run(["mdadm", "--stop", array.path])
+
+    @staticmethod
+    def partition_path(disk, number):
+        """Device path of a partition; NVMe, MMC and loop devices use a p separator"""
+        return partition_path(disk, number)
 
     @staticmethod
-    def is_disk_mounted(disk):
-        """Check if disk is mounted"""
-        try:
-            result = subprocess.run(f"mount | grep {disk}", shell=True, 
-                                  capture_output=True, text=True)
-            return result.returncode == 0
-        except:
-            return False
+    def partition_disk(layout):
+        """Write each disk's whole partition table in one sfdisk run, then build arrays and volumes
+
+        The disks are partitioned concurrently. Old signatures on the disks
+        and on the new partitions are wiped, so stale RAID or LVM metadata
+        cannot resurface.
+        """
+        if isinstance(layout, str):
+            layout = Layout([layout])
+        _concurrently(lambda index: DiskManager.write_table(layout, index), range(len(layout.disks)), "partition")
+        cmds = layout.assemble_commands()
+        for cmd in cmds:
+            run(cmd)
+        if cmds:
+            run(["udevadm", "settle"])
+        return layout.filesystems()
+
+    @staticmethod
+    def write_table(layout, index):
+        """Replace the partition table of the layout's disk index in one go"""
+        run(f"sfdisk --wipe always --wipe-partitions always {shlex.quote(layout.disks[index])} <<'EOF'\n"
+            f"{layout.table(index)}EOF", label=f"sfdisk {layout.disks[index]}")
+        # mdadm and the concurrent mkfs open the new partitions right away
+        run(["udevadm", "settle"])
 
     @staticmethod
-    def unmount_disk(disk):
-        """Unmount disk and its partitions"""
-        # Unmount partitions
-        try:
-            result = subprocess.run(f"lsblk -ln -o MOUNTPOINTS {disk} | grep -v '^$'", 
-                                  shell=True, capture_output=True, text=True)
-            if result.returncode == 0:
-                mount_points = result.stdout.strip().split('\n')
-                for mount_point in mount_points:
-                    if mount_point:
-                        safe_run(f"umount -f {mount_point}")
-        except:
-            pass
-        
-        # Try to unmount main disk
-        safe_run(f"umount -f {disk}* 2>/dev/null || true")
+    def format_and_mount(layout, root="/mnt", device=None):
+        """Create every filesystem of the layout at once, then mount them at root
+
+        Returns [mountpoint, filesystem name, UUID] for each, parents first.
+        """
+        entries = layout.filesystems()
+        uuids = _concurrently(lambda entry: backend(entry[1]).format(entry[2], device), entries, "mkfs")
+        DiskManager.mount_layout(layout, root, device)
+        return [[mountpoint, name, fs_uuid] for (mountpoint, name, _), fs_uuid in zip(entries, uuids)]
 
     @staticmethod
-    def partition_disk(disk):
-        """Partition disk with EFI and root partitions"""
-        run(f"wipefs -a {disk}")
-        run(f"sgdisk -Z {disk}")
-        run(f"sgdisk -o {disk}")
-        run(f"sgdisk -n 1:0:+1G -t 1:ef00 {disk}")
-        run(f"sgdisk -n 2:0:0 -t 2:8300 {disk}")
-        
-        return f"{disk}1", f"{disk}2"
+    def mount_layout(layout, root="/mnt", device=None):
+        """Mount the layout's filesystems below root, parents first"""
+        for mountpoint, name, path in layout.filesystems():
+            target = os.path.normpath(root + mountpoint)
+            run(["mkdir", "-p", target])
+            backend(name).mount(path, target, device)
 
     @staticmethod
-    def format_and_mount(efi_partition, root_partition):
-        """Format partitions and mount them"""
-        run(f"mkfs.fat -F32 {efi_partition}")
-        run(f"mkfs.ext4 -F {root_partition}")
-        run(f"mount {root_partition} /mnt")
-        run("mkdir -p /mnt/boot")
-        run(f"mount {efi_partition} /mnt/boot")
+    def write_image(image, root="/mnt"):
+        """Stream a golden image onto the mounted partitions"""
+        return image.deploy(root)
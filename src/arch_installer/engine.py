@@ -0,0 +1,249 @@
+"""asyncio command engine with timeouts, cancellation and concurrency limits"""
+
+import asyncio
+import codecs
+import collections
+import logging
+import os
+import signal
+import subprocess
+import threading
+from arch_installer import tracing
+from arch_installer.utils import MAX_LINE, command_text
+
+# Commands limited by the disks they write and by the network they download from
+DISK_COMMANDS = {"wipefs", "sgdisk", "sfdisk", "mkswap", "dd", "blkdiscard", "partprobe"}
+NETWORK_COMMANDS = {"pacstrap", "pacman", "curl", "reflector"}
+# Commands of each kind allowed to run at once
+DEFAULT_LIMITS = {"disk": 4, "network": 2}
+# Seconds before a command of a kind is killed; pacstrap may download for hours
+DEFAULT_TIMEOUTS = {"disk": 30 * 60}
+# Bytes read from a pipe at a time
+CHUNK_SIZE = 64 << 10
+
+class CommandCancelled(Exception):
+    """Raised for a command stopped by CommandEngine.cancel"""
+
+    def __init__(self, cmd):
+        super().__init__(f"Cancelled: {command_text(cmd)}")
+        self.cmd = cmd
+
+def command_kind(cmd):
+    """disk, network or None, from the program a command starts with"""
+    args = cmd.split() if isinstance(cmd, str) else cmd
+    if not args:
+        return None
+    name = os.path.basename(args[0])
+    if name in NETWORK_COMMANDS:
+        return "network"
+    if name in DISK_COMMANDS or name.startswith("mkfs"):
+        return "disk"
+    return None
+
+async def _read_lines(stream, handle):
+    """Pass each line of stream to handle; overlong lines are split as utils does"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = b""
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0 and len(buffer) < MAX_LINE:
+                break
+            cut = end + 1 if 0 <= end < MAX_LINE else MAX_LINE
+            handle(decoder.decode(buffer[:cut]).rstrip("\n"))
+            buffer = buffer[cut:]
+    if buffer:
+        handle(decoder.decode(buffer, final=True).rstrip("\n"))
+
+def cancel_on_signals(engine, signums=(signal.SIGINT, signal.SIGTERM)):
+    """Make Ctrl-C and SIGTERM cancel the engine; returns the previous handlers
+
+    Commands run in their own sessions, so a terminal's Ctrl-C never reaches
+    them, and a KeyboardInterrupt would only surface once the running steps
+    finished. A second signal raises KeyboardInterrupt for the impatient.
+    Must be called from the main thread.
+    """
+    def handler(signum, frame):
+        if engine.cancelled:
+            raise KeyboardInterrupt
+        logging.warning(f"{signal.Signals(signum).name} received, cancelling running commands")
+        engine.cancel()
+
+    return {signum: signal.signal(signum, handler) for signum in signums}
+
+class CommandEngine:
+    """Run commands on an asyncio loop of its own, callable from any thread
+
+    Shell strings go through /bin/sh, argv lists are executed directly. Every
+    command runs in its own process group with stdin closed; a timeout or
+    cancel() terminates the whole group, escalating to SIGKILL after grace
+    seconds. Disk and network commands wait for a slot of their kind, so
+    parallel steps and installs cannot pile onto one resource.
+
+    Pass it to utils.set_runner and every utils.run goes through it.
+    """
+
+    def __init__(self, limits=None, timeouts=None, grace=5.0):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.grace = grace
+        self.loop = None
+        self.thread = None
+        self.cancelled = False
+        # Highest number of commands of each kind seen running at once
+        self.peak = collections.Counter()
+        self.active = collections.Counter()
+        self._semaphores = {}
+        self._tasks = set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="command-engine", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """Stop the loop; commands still running are cancelled first"""
+        if self.loop is None:
+            return
+        self.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def cancel(self):
+        """Kill every running command; later ones fail at once until reset()"""
+        self.cancelled = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def reset(self):
+        self.cancelled = False
+
+    def _cancel_tasks(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _semaphore(self, kind):
+        # Created on the loop thread, where older Pythons bind them to the loop
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.limits.get(kind) or 1 << 16)
+        return self._semaphores[kind]
+
+    async def execute(self, cmd, on_line=None, on_error=None, timeout=None, usage=None):
+        """Run a command to completion on the loop and return its exit code
+
+        stdout lines go to on_line as they arrive, stderr lines to on_error,
+        or to on_line as well when on_error is None. A usage dict is filled
+        with the CPU time, I/O and peak RSS of the command, as tracing.wait
+        reports them.
+        """
+        kind = command_kind(cmd)
+        if timeout is None:
+            timeout = self.timeouts.get(kind)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            if self.cancelled:
+                raise CommandCancelled(cmd)
+            async with self._semaphore(kind):
+                self.active[kind] += 1
+                self.peak[kind] = max(self.peak[kind], self.active[kind])
+                try:
+                    return await self._execute(cmd, on_line, on_error, timeout,
+                                               usage if usage is not None else {})
+                finally:
+                    self.active[kind] -= 1
+        except asyncio.CancelledError:
+            raise CommandCancelled(cmd) from None
+        finally:
+            self._tasks.discard(task)
+
+    async def _execute(self, cmd, on_line, on_error, timeout, usage):
+        # Spawned with Popen rather than asyncio's subprocess helpers, whose
+        # child watcher would reap the command before wait4 gets its rusage
+        process = subprocess.Popen(cmd, shell=isinstance(cmd, str), stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE if on_error else subprocess.STDOUT,
+                                   start_new_session=True)
+        loop = asyncio.get_running_loop()
+        pipes = [(process.stdout, on_line or (lambda line: None))]
+        if on_error:
+            pipes.append((process.stderr, on_error))
+        transports = []
+        reaped = []
+
+        async def communicate():
+            readers = []
+            for pipe, handle in pipes:
+                reader = asyncio.StreamReader()
+                transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+                transports.append(transport)
+                readers.append(_read_lines(reader, handle))
+            await asyncio.gather(*readers)
+            # Like utils, reap only once the output is drained, so the wait is short
+            reaped.append(loop.run_in_executor(None, tracing.wait, process))
+            return await asyncio.shield(reaped[0])
+
+        try:
+            returncode, used = await asyncio.wait_for(communicate(), timeout)
+            usage.update(used)
+            return returncode
+        except asyncio.TimeoutError:
+            logging.error(f"Command timed out after {timeout}s: {command_text(cmd)}")
+            await self._kill(process, reaped)
+            raise subprocess.TimeoutExpired(cmd, timeout) from None
+        except asyncio.CancelledError:
+            logging.warning(f"Command cancelled: {command_text(cmd)}")
+            await self._kill(process, reaped)
+            raise
+        finally:
+            for transport in transports:
+                transport.close()
+
+    async def _kill(self, process, reaped):
+        """SIGTERM the process group, then SIGKILL whatever outlived the grace period"""
+        if not reaped:
+            reaped.append(asyncio.get_running_loop().run_in_executor(None, tracing.wait, process))
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(asyncio.shield(reaped[0]), self.grace)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await reaped[0]
+
+    def stream(self, cmd, on_line=None, on_error=None, timeout=None, usage=None):
+        """Run a command from any thread but the engine's own and return its exit code"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.execute(cmd, on_line, on_error, timeout, usage), self.loop)
+        return future.result()
+
+    def __call__(self, cmd):
+        """The plain runner interface: (returncode, output)"""
+        lines = []
+        returncode = self.stream(cmd, lines.append)
+        return returncode, "\n".join(lines)
+
+    def report(self):
+        return "Commands at once: " + ", ".join(f"{kind} {self.peak[kind]}/{self.limits[kind]}"
+                                                for kind in sorted(self.limits))
@@ -0,0 +1,162 @@
+"""Filesystem backends for the root partition"""
+
+import os
+import uuid
+from arch_installer.utils import run
+
+FSTAB_HEADER = "# Generated by arch-installer\n# <file system> <dir> <type> <options> <dump> <pass>\n"
+
+def is_ssd(device):
+    """True for flash, False for spinning disks, None when the device is unknown"""
+    if device is None:
+        return None
+    return not device.rotational
+
+class Filesystem:
+    """mkfs and mount options for one filesystem, tuned to the device under it"""
+
+    name = None
+    packages = []
+    passno = 0
+
+    def mkfs_args(self, fs_uuid, device=None):
+        raise NotImplementedError
+
+    def mount_options(self, device=None):
+        """Options written to fstab"""
+        return ["noatime"]
+
+    def install_options(self, device=None):
+        """Options while pacstrap writes, on top of the fstab ones"""
+        return []
+
+    def services(self, device=None):
+        """Units to enable in the target, e.g. periodic TRIM"""
+        if is_ssd(device):
+            return ["fstrim.timer"]
+        return []
+
+    def format(self, partition, device=None):
+        """Create the filesystem and return its UUID"""
+        fs_uuid = str(uuid.uuid4())
+        run(self.mkfs_args(fs_uuid, device) + [partition])
+        return fs_uuid
+
+    def mount(self, partition, target, device=None):
+        options = ",".join(self.mount_options(device) + self.install_options(device))
+        run(["mount", "-o", options, partition, target])
+
+    def fstab_line(self, fs_uuid, mountpoint, device=None):
+        """fstab entry; fsck checks / first, then every other volume that has a pass"""
+        passno = self.passno if mountpoint == "/" or not self.passno else 2
+        return f"UUID={fs_uuid} {mountpoint} {self.name} {','.join(self.mount_options(device))} 0 {passno}"
+
+class Ext4(Filesystem):
+    """ext4, skipping the inode table and journal zeroing flash does not need"""
+
+    name = "ext4"
+    passno = 1
+
+    def mkfs_args(self, fs_uuid, device=None):
+        args = ["mkfs.ext4", "-F", "-U", fs_uuid]
+        if is_ssd(device):
+            # Tables the discard zeroed are skipped; the rest is zeroed now
+            # instead of by ext4lazyinit during the first boot
+            args += ["-E", "discard,lazy_itable_init=0,lazy_journal_init=1"]
+        elif is_ssd(device) is False:
+            args += ["-E", "nodiscard"]
+        return args
+
+    def install_options(self, device=None):
+        # Fewer journal commits while pacstrap writes thousands of small files
+        return ["commit=60"]
+
+class Xfs(Filesystem):
+    """XFS, with larger log buffers on spinning disks"""
+
+    name = "xfs"
+    packages = ["xfsprogs"]
+
+    def mkfs_args(self, fs_uuid, device=None):
+        args = ["mkfs.xfs", "-f", "-m", f"uuid={fs_uuid}"]
+        if is_ssd(device) is False:
+            args.append("-K")
+        return args
+
+    def mount_options(self, device=None):
+        options = ["noatime"]
+        if is_ssd(device) is False:
+            options.append("logbsize=256k")
+        return options
+
+class Btrfs(Filesystem):
+    """btrfs with transparent zstd compression, so less data hits the disk"""
+
+    name = "btrfs"
+    packages = ["btrfs-progs"]
+
+    def mkfs_args(self, fs_uuid, device=None):
+        args = ["mkfs.btrfs", "-f", "-U", fs_uuid]
+        if is_ssd(device) is False:
+            args.append("-K")
+        return args
+
+    def mount_options(self, device=None):
+        options = ["noatime", "compress=zstd:1", "space_cache=v2"]
+        if is_ssd(device):
+            options += ["ssd", "discard=async"]
+        return options
+
+    def install_options(self, device=None):
+        return ["commit=60"]
+
+    def services(self, device=None):
+        # discard=async already trims
+        return []
+
+class Vfat(Filesystem):
+    """FAT32 for the EFI system partition"""
+
+    name = "vfat"
+    passno = 2
+
+    def format(self, partition, device=None):
+        volume_id = uuid.uuid4().hex[:8].upper()
+        run(["mkfs.fat", "-F32", "-i", volume_id, partition])
+        # blkid shows FAT volume ids as XXXX-XXXX
+        return f"{volume_id[:4]}-{volume_id[4:]}"
+
+    def mount_options(self, device=None):
+        return ["umask=0077"]
+
+    def services(self, device=None):
+        return []
+
+BACKENDS = {fs.name: fs for fs in (Ext4, Xfs, Btrfs)}
+
+def get_filesystem(name):
+    """Backend for a root filesystem name"""
+    if name not in BACKENDS:
+        raise Exception(f"Unsupported filesystem: {name}")
+    return BACKENDS[name]()
+
+def write_fstab(root, lines):
+    """Replace the target's fstab with UUID based entries"""
+    path = os.path.join(root, "etc/fstab")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(FSTAB_HEADER)
+        for line in lines:
+            f.write(f"{line}\n")
+
+def append_fstab(root, line):
+    """Add an entry to the target's fstab unless it is already there"""
+    path = os.path.join(root, "etc/fstab")
+    try:
+        with open(path) as f:
+            if line in f.read().splitlines():
+                return
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(f"{line}\n")
@@ -0,0 +1,239 @@
+"""Firmware packages for the hardware that is present"""
+
+import collections
+import fnmatch
+import logging
+import os
+import re
+from arch_installer.inventory import _read
+from arch_installer.ui.progress import UNITS, format_bytes
+from arch_installer.utils import run
+
+FULL_PACKAGE = "linux-firmware"
+OTHER_PACKAGE = "linux-firmware-other"
+# Split packages by where their blobs live below /usr/lib/firmware;
+# anything not listed is in linux-firmware-other
+FIRMWARE_PREFIXES = [
+    ("amdgpu/", "linux-firmware-amdgpu"),
+    ("radeon/", "linux-firmware-radeon"),
+    ("nvidia/", "linux-firmware-nvidia"),
+    ("i915/", "linux-firmware-intel"),
+    ("xe/", "linux-firmware-intel"),
+    ("intel/", "linux-firmware-intel"),
+    ("iwlwifi-", "linux-firmware-intel"),
+    ("ice/", "linux-firmware-intel"),
+    ("rtl_nic/", "linux-firmware-realtek"),
+    ("rtl_bt/", "linux-firmware-realtek"),
+    ("rtlwifi/", "linux-firmware-realtek"),
+    ("rtw88/", "linux-firmware-realtek"),
+    ("rtw89/", "linux-firmware-realtek"),
+    ("ath9k_htc/", "linux-firmware-atheros"),
+    ("ath10k/", "linux-firmware-atheros"),
+    ("ath11k/", "linux-firmware-atheros"),
+    ("ath12k/", "linux-firmware-atheros"),
+    ("ar3k/", "linux-firmware-atheros"),
+    ("qca/", "linux-firmware-atheros"),
+    ("brcm/", "linux-firmware-broadcom"),
+    ("bnx2", "linux-firmware-broadcom"),
+    ("tigon/", "linux-firmware-broadcom"),
+    ("mediatek/", "linux-firmware-mediatek"),
+    ("mt76", "linux-firmware-mediatek"),
+    ("cirrus/", "linux-firmware-cirrus"),
+    ("qcom/", "linux-firmware-qcom"),
+    ("qlogic/", "linux-firmware-qlogic"),
+    ("ql2", "linux-firmware-qlogic"),
+    ("mellanox/", "linux-firmware-mellanox"),
+    ("netronome/", "linux-firmware-nfp"),
+    ("liquidio/", "linux-firmware-liquidio"),
+]
+# Devices that usually load firmware: PCI network, display, multimedia and
+# wireless controllers, USB wireless (Bluetooth) and vendor specific interfaces
+PCI_FIRMWARE_CLASSES = ("0x02", "0x03", "0x04", "0x0d")
+USB_FIRMWARE_CLASSES = ("e0", "ff")
+
+SIZE_RE = re.compile(r"^(Download|Installed) Size\s*:\s*([\d.]+) (B|KiB|MiB|GiB|TiB)")
+DEPENDS_RE = re.compile(r"^Depends On\s*:\s*(.*)")
+
+Device = collections.namedtuple("Device", ["address", "modalias", "driver", "module", "needs_firmware"])
+
+def firmware_package(path):
+    """Split package shipping a firmware file named as modinfo lists it"""
+    for prefix, package in FIRMWARE_PREFIXES:
+        if path.startswith(prefix):
+            return package
+    return OTHER_PACKAGE
+
+def _driver(path):
+    """Driver bound to a sysfs device and the module it lives in, None when unbound or built in"""
+    driver = os.path.join(path, "driver")
+    if not os.path.islink(driver):
+        return None, None
+    module = os.path.join(driver, "module")
+    return (os.path.basename(os.readlink(driver)),
+            os.path.basename(os.readlink(module)) if os.path.islink(module) else None)
+
+def scan_devices(sysfs="/sys"):
+    """PCI functions and USB interfaces with their modalias and bound module"""
+    devices = []
+    for bus, classes in (("pci", PCI_FIRMWARE_CLASSES), ("usb", USB_FIRMWARE_CLASSES)):
+        base = os.path.join(sysfs, "bus", bus, "devices")
+        try:
+            names = sorted(os.listdir(base))
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(base, name)
+            if bus == "usb":
+                # Drivers bind to interfaces (1-4:1.0), not to the device (1-4)
+                if ":" not in name:
+                    continue
+                device_class = _read(os.path.join(path, "bInterfaceClass"), "").lower()
+            else:
+                device_class = _read(os.path.join(path, "class"), "")
+            modalias = _read(os.path.join(path, "modalias"))
+            if modalias is None:
+                continue
+            devices.append(Device(name, modalias, *_driver(path), device_class.startswith(classes)))
+    return devices
+
+def loaded_modules(procfs="/proc"):
+    """Names of the loaded modules, which include helpers such as btintel"""
+    try:
+        with open(os.path.join(procfs, "modules")) as f:
+            return [line.split()[0] for line in f if line.strip()]
+    except OSError:
+        return []
+
+def read_aliases(modules_dir):
+    """(pattern, module) for the PCI and USB lines of modules.alias"""
+    aliases = []
+    try:
+        with open(os.path.join(modules_dir, "modules.alias")) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 3 and fields[0] == "alias" and fields[1].startswith(("pci:", "usb:")):
+                    aliases.append((fields[1], fields[2]))
+    except OSError:
+        pass
+    return aliases
+
+def builtin_firmware(modules_dir):
+    """{module: firmware files} for the drivers built into the kernel"""
+    firmware = collections.defaultdict(list)
+    try:
+        with open(os.path.join(modules_dir, "modules.builtin.modinfo"), "rb") as f:
+            entries = f.read().decode(errors="replace").split("\0")
+    except OSError:
+        return firmware
+    for entry in entries:
+        module, _, value = entry.partition(".firmware=")
+        if value:
+            firmware[module].append(value)
+    return firmware
+
+def modinfo_firmware(modules):
+    """Firmware files the modules declare, from one modinfo call; None if it failed"""
+    try:
+        output = run("modinfo -F firmware " + " ".join(sorted(modules)), silent=False)
+    except Exception as e:
+        logging.warning(f"modinfo failed, keeping all firmware: {e}")
+        return None
+    return [line.strip() for line in (output or "").splitlines() if line.strip()]
+
+def package_sizes(pkgs):
+    """{package: (download bytes, installed bytes)} and the dependencies, from the sync databases"""
+    output = run("pacman -Si " + " ".join(pkgs), check=False, silent=False) or ""
+    sizes = {}
+    depends = []
+    name = None
+    for line in output.splitlines():
+        if line.startswith("Name"):
+            name = line.split(":", 1)[1].strip()
+            sizes[name] = [0, 0]
+        match = SIZE_RE.match(line)
+        if match and name:
+            sizes[name][match.group(1) == "Installed"] = int(float(match.group(2)) * UNITS[match.group(3)])
+        match = DEPENDS_RE.match(line)
+        if match and name == FULL_PACKAGE:
+            depends = [dep for dep in match.group(1).split() if dep.startswith(FULL_PACKAGE + "-")]
+    return {pkg: tuple(size) for pkg, size in sizes.items()}, depends
+
+class FirmwareSelection:
+    """Split firmware packages covering the detected devices
+
+    Each device's module is the driver bound to it, or the one modules.alias
+    names for it; modinfo lists the firmware those modules and every loaded
+    module can request, modules.builtin.modinfo that of built-in drivers, and
+    each file maps to the split package shipping it.
+    A device that usually needs firmware but has no known module, or a failed
+    modinfo, falls back to the full linux-firmware.
+    """
+
+    def __init__(self, packages, files=(), unknown=()):
+        self.packages = sorted(packages)
+        self.files = sorted(files)
+        self.unknown = list(unknown)
+
+    @classmethod
+    def detect(cls, sysfs="/sys", procfs="/proc", modules_dir=None, modinfo=modinfo_firmware):
+        modules_dir = modules_dir or f"/lib/modules/{os.uname().release}"
+        modules = set(loaded_modules(procfs))
+        files = []
+        unknown = []
+        aliases = None
+        builtin = None
+        for device in scan_devices(sysfs):
+            module = device.module
+            if module is None and device.driver is not None:
+                # Built into the kernel, so modinfo cannot be asked
+                if builtin is None:
+                    builtin = builtin_firmware(modules_dir)
+                files += builtin.get(device.driver.replace("-", "_"), [])
+                continue
+            if module is None:
+                if aliases is None:
+                    aliases = read_aliases(modules_dir)
+                module = next((name for pattern, name in aliases
+                               if fnmatch.fnmatchcase(device.modalias, pattern)), None)
+            if module is not None:
+                modules.add(module)
+            elif device.needs_firmware:
+                unknown.append(device.address)
+        if unknown:
+            return cls([FULL_PACKAGE], unknown=unknown)
+
+        declared = modinfo(modules) if modules else []
+        if declared is None:
+            return cls([FULL_PACKAGE], unknown=["modinfo"])
+        files += declared
+        return cls({firmware_package(path) for path in files}, files)
+
+    @property
+    def full(self):
+        return self.packages == [FULL_PACKAGE]
+
+    def replace(self, pkgs):
+        """Package list with linux-firmware swapped for the selection"""
+        result = []
+        for pkg in pkgs:
+            result += self.packages if pkg == FULL_PACKAGE else [pkg]
+        return result
+
+    def savings(self):
+        """(download, installed) bytes saved against the full firmware, from the sync databases"""
+        if self.full:
+            return 0, 0
+        sizes, depends = package_sizes([FULL_PACKAGE] + self.packages)
+        # The full package is a meta package over the split ones, or a monolith
+        sizes.update(package_sizes(depends)[0] if depends else {})
+        full = [FULL_PACKAGE] + depends
+        return tuple(sum(sizes.get(pkg, (0, 0))[i] for pkg in full)
+                     - sum(sizes.get(pkg, (0, 0))[i] for pkg in self.packages) for i in (0, 1))
+
+    def report(self):
+        if self.full:
+            reason = f", unknown: {', '.join(self.unknown)}" if self.unknown else ""
+            return f"Firmware: full {FULL_PACKAGE}{reason}"
+        download, installed = self.savings()
+        return (f"Firmware: {', '.join(self.packages)} for {len(self.files)} files, saving "
+                f"{format_bytes(download)} download and {format_bytes(installed)} on disk")
@@ -0,0 +1,143 @@
+"""Hardware profile, probed once at startup"""
+
+import collections
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from arch_installer.inventory import Inventory, _read
+from arch_installer.swap import memory_mb, recommended_swap_mb
+
+CPU_VENDORS = {"GenuineIntel": "intel", "AuthenticAMD": "amd"}
+PCI_VENDORS = {"0x10de": "nvidia", "0x1002": "amd", "0x8086": "intel"}
+# Paravirtual devices of QEMU/KVM, VMware, VirtualBox and Hyper-V
+VIRTUAL_VENDORS = {"0x1af4", "0x15ad", "0x80ee", "0x1414"}
+# PCI base classes, the top byte of the class file
+DISPLAY_CLASS = "0x03"
+NETWORK_CLASS = "0x02"
+# Discrete cards first, so hybrid laptops get the driver for the card that needs one
+GPU_PREFERENCE = ["nvidia", "amd", "intel"]
+
+PciDevice = collections.namedtuple("PciDevice", ["address", "vendor", "device", "pci_class", "driver"])
+
+def cpu_vendor(cpuinfo="/proc/cpuinfo"):
+    """intel, amd or None, reading only up to the first vendor_id line
+
+    cpuinfo repeats every field for every thread, megabytes on big hosts.
+    """
+    try:
+        with open(cpuinfo) as f:
+            for line in f:
+                if line.startswith("vendor_id"):
+                    return CPU_VENDORS.get(line.split(":", 1)[1].strip())
+    except OSError:
+        pass
+    return None
+
+def total_memory_mb(meminfo="/proc/meminfo"):
+    """Total RAM in MiB, 0 when meminfo cannot be read"""
+    try:
+        return memory_mb(meminfo)
+    except Exception:
+        return 0
+
+def installable_disks(inventory):
+    inventory.refresh()
+    return tuple(inventory.disks())
+
+def pci_devices(sysfs="/sys"):
+    """Every PCI function with its vendor, class and bound driver"""
+    devices = []
+    base = os.path.join(sysfs, "bus/pci/devices")
+    try:
+        addresses = sorted(os.listdir(base))
+    except OSError:
+        return ()
+    for address in addresses:
+        path = os.path.join(base, address)
+        driver = os.path.join(path, "driver")
+        devices.append(PciDevice(address, _read(os.path.join(path, "vendor")),
+                                 _read(os.path.join(path, "device")), _read(os.path.join(path, "class"), ""),
+                                 os.path.basename(os.readlink(driver)) if os.path.islink(driver) else None))
+    return tuple(devices)
+
+class HardwareProfile(collections.namedtuple(
+        "HardwareProfile", ["cpu", "gpus", "nics", "memory_mb", "efi", "disks"])):
+    """What the machine has, and the kernel, GPU driver, microcode and swap it calls for
+
+    Immutable; detect() probes every source concurrently the first time and
+    returns the same profile afterwards. The paths can point at fixture trees.
+    """
+
+    __slots__ = ()
+    _cache = {}
+
+    @classmethod
+    def detect(cls, sysfs="/sys", procfs="/proc"):
+        key = (sysfs, procfs)
+        if key not in cls._cache:
+            cls._cache[key] = cls.probe(sysfs, procfs)
+        return cls._cache[key]
+
+    @classmethod
+    def probe(cls, sysfs="/sys", procfs="/proc"):
+        """Read everything again, each source on its own thread"""
+        start = time.monotonic()
+        inventory = Inventory(sysfs, os.path.join(procfs, "self/mountinfo"), os.path.join(procfs, "swaps"))
+        with ThreadPoolExecutor(max_workers=5, thread_name_prefix="hardware") as pool:
+            cpu = pool.submit(cpu_vendor, os.path.join(procfs, "cpuinfo"))
+            pci = pool.submit(pci_devices, sysfs)
+            memory = pool.submit(total_memory_mb, os.path.join(procfs, "meminfo"))
+            efi = pool.submit(os.path.isdir, os.path.join(sysfs, "firmware/efi"))
+            disks = pool.submit(installable_disks, inventory)
+            devices = pci.result()
+            profile = cls(
+                cpu=cpu.result(),
+                gpus=tuple(d for d in devices if d.pci_class.startswith(DISPLAY_CLASS)),
+                nics=tuple(d for d in devices if d.pci_class.startswith(NETWORK_CLASS)),
+                memory_mb=memory.result(),
+                efi=efi.result(),
+                disks=disks.result(),
+            )
+        logging.info(f"Hardware probed in {(time.monotonic() - start) * 1000:.1f}ms: {profile.describe()}")
+        return profile
+
+    @property
+    def virtual(self):
+        """True in a virtual machine, judging by its paravirtual devices"""
+        return any(d.vendor in VIRTUAL_VENDORS for d in self.gpus + self.nics)
+
+    @property
+    def gpu(self):
+        """GPU choice for the detected cards, "None" without a known one"""
+        vendors = {PCI_VENDORS.get(d.vendor) for d in self.gpus}
+        return next((vendor for vendor in GPU_PREFERENCE if vendor in vendors), "None")
+
+    @property
+    def kernel(self):
+        # Virtual hardware gains nothing from the newest drivers
+        return "linux-lts" if self.virtual else "linux"
+
+    @property
+    def microcode(self):
+        """CPU vendor whose microcode package applies, or None"""
+        return self.cpu if self.cpu in ("intel", "amd") else None
+
+    def swap_mb(self, hibernate=False):
+        """Swap size for this much RAM, None when RAM is unknown"""
+        if not self.memory_mb:
+            return None
+        return recommended_swap_mb(self.memory_mb, hibernate)
+
+    def disk(self, name):
+        """Disk by name or /dev path, or None"""
+        name = name[len("/dev/"):] if name.startswith("/dev/") else name
+        return next((d for d in self.disks if d.name == name), None)
+
+    def defaults(self):
+        """Config values the hardware suggests"""
+        return {'kernel': self.kernel, 'gpu': self.gpu}
+
+    def describe(self):
+        return (f"cpu {self.cpu}, gpu {self.gpu}, {len(self.nics)} nics, {self.memory_mb} MiB, "
+                f"{'UEFI' if self.efi else 'BIOS'}, {len(self.disks)} disks")
@@ -0,0 +1,210 @@
+"""Golden images of an installed root for fleets of identical machines"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from arch_installer.layout import volume_name
+
+# Bytes read or written per checksum update
+CHUNK_SIZE = 1 << 20
+
+class ImagePart:
+    """One compressed tar stream of an image and how to unpack it"""
+
+    def __init__(self, name, directory, create_args, extract_args):
+        self.name = name
+        # Relative to the target root; /boot is its own (vfat) filesystem
+        self.directory = directory
+        self.create_args = create_args
+        self.extract_args = extract_args
+
+    @property
+    def filename(self):
+        return f"{self.name}.tar.zst"
+
+# Machine specific and disposable paths, relative to the root
+EXCLUDES = ["swapfile", "etc/machine-id", "var/cache/pacman/pkg/*", "var/log/*", "var/lib/arch-installer"]
+ROOT_CREATE_ARGS = ["--one-file-system", "--xattrs", "--xattrs-include=*", "--acls"]
+ROOT_EXTRACT_ARGS = ["-p", "--xattrs", "--xattrs-include=*", "--acls"]
+
+def image_parts(mountpoints):
+    """One part per filesystem of the layout, each leaving out the ones mounted below it"""
+    parts = []
+    for mountpoint in mountpoints:
+        directory = mountpoint.strip("/")
+        if directory == "boot":
+            parts.append(GoldenImage.PARTS[1])
+            continue
+        prefix = directory + "/" if directory else ""
+        nested = [other.strip("/") + "/*" for other in mountpoints
+                  if other != mountpoint and other.strip("/").startswith(prefix)]
+        excludes = [path[len(prefix):] for path in nested + EXCLUDES if path.startswith(prefix)]
+        parts.append(ImagePart(volume_name(mountpoint), directory,
+                               ROOT_CREATE_ARGS + [f"--exclude=./{path}" for path in excludes], ROOT_EXTRACT_ARGS))
+    return parts
+
+class GoldenImage:
+    """A fully installed root, captured once and streamed onto new disks
+
+    The image is a directory with one zstd-compressed tar per filesystem and
+    a manifest holding the package set it was built from and the sha256 of
+    every archive. Deploying pipes the archives through zstd into tar while
+    the checksum is computed on the same reads.
+    """
+
+    PARTS = [
+        ImagePart("root", "", ROOT_CREATE_ARGS + [f"--exclude=./{path}" for path in ["boot/*"] + EXCLUDES],
+                  ROOT_EXTRACT_ARGS),
+        # FAT has no owners or permissions to restore
+        ImagePart("boot", "boot", ["--one-file-system"],
+                  ["--no-same-owner", "--no-same-permissions"]),
+    ]
+
+    # Parallel installs may all try to capture the same image
+    _capture_lock = threading.Lock()
+
+    def __init__(self, path, level=3, mountpoints=None):
+        self.path = path
+        self.level = level
+        # Mountpoints of the layout's filesystems; the default is / and /boot
+        self.parts = image_parts(mountpoints) if mountpoints else self.PARTS
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self):
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def package_key(pkgs):
+        """Identify a package set regardless of order"""
+        return hashlib.sha256("\n".join(sorted(set(pkgs))).encode()).hexdigest()
+
+    def matches(self, pkgs):
+        """True if the image was built from exactly these packages"""
+        return self.manifest()["key"] == self.package_key(pkgs)
+
+    def matches_layout(self):
+        """True if the image has a part for exactly the filesystems it would be deployed to"""
+        return set(self.manifest()["parts"]) == {part.name for part in self.parts}
+
+    def capture(self, root, pkgs):
+        """Archive an installed root; returns the manifest"""
+        with self._capture_lock:
+            if self.exists() and self.matches(pkgs):
+                return self.manifest()
+            return self._capture(root, pkgs)
+
+    def _capture(self, root, pkgs):
+        start = time.monotonic()
+        tmp = self.path + ".part"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        parts = {}
+        for part in self.parts:
+            source = os.path.join(root, part.directory)
+            digest, size = self._compress(part, source, os.path.join(tmp, part.filename))
+            parts[part.name] = {"file": part.filename, "sha256": digest, "size": size}
+
+        manifest = {"key": self.package_key(pkgs), "packages": sorted(set(pkgs)),
+                    "created": int(time.time()), "parts": parts}
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(tmp, self.path)
+        total = sum(p["size"] for p in parts.values())
+        logging.info(f"Captured image {self.path}: {total >> 20} MiB in {time.monotonic() - start:.1f}s")
+        return manifest
+
+    def _compress(self, part, source, path):
+        """tar source | zstd, hashing and writing the compressed stream"""
+        logging.info(f"Archiving {source} to {path}")
+        tar = subprocess.Popen(["tar", "-c", "--numeric-owner", "-C", source] + part.create_args + ["."],
+                               stdout=subprocess.PIPE)
+        zstd = subprocess.Popen(["zstd", "-q", "-c", "-T0", f"-{self.level}"],
+                                stdin=tar.stdout, stdout=subprocess.PIPE)
+        tar.stdout.close()
+
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: zstd.stdout.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        zstd.stdout.close()
+        for name, process in (("tar", tar), ("zstd", zstd)):
+            if process.wait() != 0:
+                raise Exception(f"Capturing {source} failed: {name} exited with {process.returncode}")
+        return digest.hexdigest(), size
+
+    def deploy(self, root):
+        """Unpack every part below root at once; raises if a checksum does not match"""
+        start = time.monotonic()
+        manifest = self.manifest()
+        errors = []
+
+        def extract(part):
+            try:
+                self._extract(part, manifest["parts"][part.name], os.path.join(root, part.directory))
+            except Exception as e:
+                errors.append(e)
+
+        # The parts go to different filesystems, so their writes overlap
+        prefix = threading.current_thread().name
+        threads = [threading.Thread(target=extract, args=(part,), name=f"{prefix}-image-{part.name}")
+                   for part in self.parts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        total = sum(p["size"] for p in manifest["parts"].values())
+        elapsed = time.monotonic() - start
+        logging.info(f"Deployed image {self.path}: {total >> 20} MiB compressed in {elapsed:.1f}s")
+        return elapsed
+
+    def _extract(self, part, entry, target):
+        """Feed one archive through zstd into tar, verifying its sha256 on the way"""
+        path = os.path.join(self.path, entry["file"])
+        logging.info(f"Extracting {path} to {target}")
+        os.makedirs(target, exist_ok=True)
+        zstd = subprocess.Popen(["zstd", "-d", "-q", "-c"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        tar = subprocess.Popen(["tar", "-x", "--numeric-owner", "-C", target] + part.extract_args,
+                               stdin=zstd.stdout)
+        zstd.stdout.close()
+
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    zstd.stdin.write(chunk)
+        except BrokenPipeError:
+            # zstd or tar gave up early; their exit codes say why
+            pass
+        finally:
+            try:
+                zstd.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        for name, process in (("zstd", zstd), ("tar", tar)):
+            if process.wait() != 0:
+                raise Exception(f"Extracting {path} failed: {name} exited with {process.returncode}")
+        if digest.hexdigest() != entry["sha256"]:
+            raise Exception(f"Image {path} is corrupt: sha256 {digest.hexdigest()}, expected {entry['sha256']}")
@@ -0,0 +1,199 @@
+"""Deferred initramfs and DKMS builds"""
+
+import os
+import re
+import time
+from arch_installer.utils import add_output_handler, remove_output_handler
+
+HOOK_DIR = "etc/pacman.d/hooks"
+# pacman hooks that rebuild every image, or every DKMS module, whenever a
+# kernel, module, firmware or microcode package is installed
+DEFERRED_HOOKS = [
+    "60-mkinitcpio-remove.hook",
+    "90-mkinitcpio-install.hook",
+    "70-dkms-install.hook",
+    "70-dkms-upgrade.hook",
+    "71-dkms-remove.hook",
+]
+DROP_IN_PATH = "etc/mkinitcpio.conf.d/arch-installer.conf"
+PRESET_DIR = "etc/mkinitcpio.d"
+PRESET_TEMPLATE = "usr/share/mkinitcpio/hook.preset"
+# What the masked 90-mkinitcpio-install hook would have run
+INSTALL_SCRIPT = "/usr/share/libalpm/scripts/mkinitcpio"
+
+# mkinitcpio's udev based HOOKS; hooks a layout needs go in before filesystems
+DEFAULT_HOOKS = ["base", "udev", "autodetect", "microcode", "modconf", "kms", "keyboard", "keymap",
+                 "consolefont", "block", "filesystems", "fsck"]
+
+IMAGE_BUILD_RE = re.compile(r"==> Building image from preset")
+DKMS_BUILD_RE = re.compile(r"^Building module")
+
+def installed_kernels(root="/mnt"):
+    """(version, pkgbase) of every kernel package under usr/lib/modules"""
+    modules = os.path.join(root, "usr/lib/modules")
+    kernels = []
+    try:
+        versions = sorted(os.listdir(modules))
+    except OSError:
+        return kernels
+    for version in versions:
+        try:
+            with open(os.path.join(modules, version, "pkgbase")) as f:
+                kernels.append((version, f.read().strip()))
+        except OSError:
+            continue
+    return kernels
+
+class InitramfsBuilder:
+    """Build initramfs images and DKMS modules once, after every package is in
+
+    pacman runs mkinitcpio, default and fallback image, after each transaction
+    that touches a kernel, firmware or microcode, and DKMS after each that
+    touches headers or a module. With defer the hooks are masked in the
+    target while packages go in, and everything is built in one pass by
+    build(). Builds are counted from command output either way.
+    """
+
+    def __init__(self, root="/mnt", defer=True, compression="zstd", level=None, fallback=True, hooks=()):
+        self.root = root
+        self.defer = defer
+        self.compression = compression
+        self.level = level
+        self.fallback = fallback
+        # Extra hooks, e.g. to assemble a root on RAID or LVM
+        self.hooks = list(hooks)
+        self.images = 0
+        self.modules = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config, root="/mnt", hooks=()):
+        config = config or {}
+        return cls(root, config.get('defer', True), config.get('compression', "zstd"),
+                   config.get('level'), config.get('fallback', True), hooks)
+
+    def count(self, cmd, line):
+        """Output handler counting image and module builds in the target"""
+        if f" {self.root} " not in f" {cmd} ":
+            return
+        if IMAGE_BUILD_RE.search(line):
+            self.images += 1
+        elif DKMS_BUILD_RE.match(line):
+            self.modules += 1
+
+    def watch(self):
+        add_output_handler(self.count)
+
+    def unwatch(self):
+        remove_output_handler(self.count)
+
+    def pacman_options(self):
+        """Options making pacstrap read the target's hook overrides"""
+        if not self.defer:
+            return []
+        return ["--hookdir", os.path.join(self.root, HOOK_DIR)]
+
+    def drop_in(self):
+        """mkinitcpio.conf.d snippet for the compression profile and extra hooks"""
+        options = []
+        if self.level is not None:
+            options.append(f"-{self.level}")
+        if self.compression == "zstd":
+            options.append("-T0")
+        text = f'COMPRESSION="{self.compression}"\n'
+        if options:
+            text += f"COMPRESSION_OPTIONS=({' '.join(options)})\n"
+        if self.hooks:
+            hooks = list(DEFAULT_HOOKS)
+            hooks[hooks.index("filesystems"):hooks.index("filesystems")] = self.hooks
+            text += f"HOOKS=({' '.join(hooks)})\n"
+        return text
+
+    def prepare(self):
+        """Before pacstrap: write the compression profile and mask the hooks"""
+        path = os.path.join(self.root, DROP_IN_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.drop_in())
+        if not self.defer:
+            return
+        hooks = os.path.join(self.root, HOOK_DIR)
+        os.makedirs(hooks, exist_ok=True)
+        for name in DEFERRED_HOOKS:
+            path = os.path.join(hooks, name)
+            if not os.path.lexists(path):
+                os.symlink("/dev/null", path)
+
+    def masked(self):
+        """Hooks still masked by prepare"""
+        hooks = os.path.join(self.root, HOOK_DIR)
+        return [name for name in DEFERRED_HOOKS
+                if os.path.islink(os.path.join(hooks, name))
+                and os.readlink(os.path.join(hooks, name)) == "/dev/null"]
+
+    def unmask(self):
+        """Give pacman its hooks back, for upgrades on the installed system"""
+        for name in self.masked():
+            os.remove(os.path.join(self.root, HOOK_DIR, name))
+
+    def write_presets(self):
+        """Presets for every kernel, without the fallback image unless it is wanted
+
+        Returns the kernels. Existing presets are kept, only their fallback is
+        dropped along with an image already built for it.
+        """
+        kernels = installed_kernels(self.root)
+        template = None
+        try:
+            with open(os.path.join(self.root, PRESET_TEMPLATE)) as f:
+                template = f.read()
+        except OSError:
+            pass
+        for _, pkgbase in kernels:
+            path = os.path.join(self.root, PRESET_DIR, f"{pkgbase}.preset")
+            if os.path.exists(path):
+                with open(path) as f:
+                    text = f.read()
+            elif template is not None:
+                # What the install hook does for a kernel without a preset
+                text = template.replace("%PKGBASE%", pkgbase)
+            else:
+                continue
+            if not self.fallback:
+                text = re.sub(r"(?m)^PRESETS=.*$", "PRESETS=('default')", text)
+                image = os.path.join(self.root, "boot", f"initramfs-{pkgbase}-fallback.img")
+                if os.path.exists(image):
+                    os.remove(image)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+        return kernels
+
+    def build(self, chroot):
+        """Unmask the hooks, then build DKMS modules and every image in one pass"""
+        start = time.monotonic()
+        self.unmask()
+        kernels = self.write_presets()
+        if not self.defer or not kernels:
+            return
+        cmds = []
+        if os.path.exists(os.path.join(self.root, "usr/bin/dkms")):
+            # Modules first, the images may include them
+            cmds += [f"dkms autoinstall -k {version}" for version, _ in kernels]
+        # Copies each vmlinuz to /boot and runs its preset, as the hook would have
+        targets = "\\n".join(f"usr/lib/modules/{version}/vmlinuz" for version, _ in kernels)
+        cmds.append(f"printf '{targets}\\n' | {INSTALL_SCRIPT} install")
+        chroot.run_batch(cmds)
+        self.seconds += time.monotonic() - start
+
+    def built(self):
+        """Cheap check that build finished: hooks back and an image for every kernel"""
+        if self.masked():
+            return False
+        return all(os.path.exists(os.path.join(self.root, "boot", f"initramfs-{pkgbase}.img"))
+                   for _, pkgbase in installed_kernels(self.root))
+
+    def report(self):
+        mode = "deferred" if self.defer else "per transaction"
+        return (f"Initramfs ({mode}, {self.compression}): {self.images} images, "
+                f"{self.modules} DKMS modules built, {self.seconds:.1f}s in the final build")
@@ -1,28 +1,69 @@
 """Core installer workflow orchestration"""
 
 import logging
+import os
+import subprocess
 from arch_installer.disk import DiskManager
 from arch_installer.packages import PackageManager
 from arch_installer.bootloader.systemd_boot import SystemdBoot
 from arch_installer.bootloader.grub import Grub
 from arch_installer.locale import LocaleManager
 from arch_installer.microcode import MicrocodeManager
+from arch_installer.initramfs import InitramfsBuilder
+from arch_installer.hardware import HardwareProfile
+from arch_installer.firmware import FirmwareSelection
 from arch_installer.swap import SwapManager
-from arch_installer.utils import run, check_efi
+from arch_installer.prefetch import Prefetcher
+from arch_installer.pkgcache import PackageCache
+from arch_installer.scheduler import StepScheduler
+from arch_installer.chroot import ChrootSession
+from arch_installer.tracing import tracer
+from arch_installer.image import GoldenImage
+from arch_installer.filesystems import get_filesystem, write_fstab, FSTAB_HEADER
+from arch_installer.layout import Layout, backend
+from arch_installer.journal import StepJournal, JOURNAL_PATH
+from arch_installer.config import validate_config, KERNELS, GPUS, WMDES, BOOTLOADERS, FILESYSTEMS, LAYOUTS, SWAP_MODES
+from arch_installer.utils import run, safe_run
 from arch_installer.ui.curses_ui import CursesUI
 
 class Installer:
     """Main installer class orchestrating the installation process"""
     
-    def __init__(self, stdscr):
+    def __init__(self, stdscr=None, ui=None, config=None, target="/mnt", name="install", engine=None,
+                 parallel=False):
         self.stdscr = stdscr
         self.config = {}
-        self.ui = CursesUI(stdscr)
+        # Unattended installs pass a config dict and a non-curses UI
+        self.unattended_config = config
+        # Mount point of the new system and a label for threads and logs
+        self.target = target
+        self.name = name
+        # One of several installs running side by side
+        self.parallel = parallel
+        self.ui = ui or CursesUI(stdscr)
         self.disk_manager = DiskManager()
-        self.package_manager = PackageManager()
+        self.package_manager = PackageManager(target)
         self.locale_manager = LocaleManager()
         self.microcode_manager = MicrocodeManager()
         self.swap_manager = SwapManager()
+        self.package_cache = None
+        self.cached_files = None
+        self.prefetcher = None
+        # Golden image to capture after the first install or to deploy from
+        self.image = None
+        # Finished steps, for resuming after a crash
+        self.journal = None
+        # Shared by every step that runs commands inside the target
+        self.chroot = None
+        # Probed once, preselects choices and picks filesystem options
+        self.hardware = None
+        # Inventory entry of the target disk
+        self.target_device = None
+        # Split firmware packages, when only the detected devices' firmware goes in
+        self.firmware = None
+        self.initramfs = None
+        # CommandEngine running the commands, so ESC can kill them
+        self.engine = engine
         
         # Setup logging
         logfile = "/tmp/arch-install.log"
@@ -36,22 +77,84 @@ class Installer:
     def run(self):
         """Run the complete installation process"""
         try:
-            self._pre_install_checks()
-            self._gather_configuration()
-            self._confirm_installation()
-            self._execute_installation()
-            self._post_installation()
+            self.prepare()
+            self.install()
         except Exception as e:
             self.logger.error(f"Installation failed: {e}")
             self.ui.show_error(f"Installation failed: {e}")
             raise
 
+    def prepare(self):
+        """Check the host and settle the configuration; nothing is written yet"""
+        self.hardware = HardwareProfile.detect()
+        self._pre_install_checks()
+        if self.unattended_config is not None:
+            self._load_configuration()
+        else:
+            self._gather_configuration()
+        self._check_image()
+        self._confirm_installation()
+
+    def install(self):
+        """Install onto the configured disk"""
+        tracer.start()
+        try:
+            self._open_journal()
+            self._start_prefetch()
+            self._execute_installation()
+            self.journal.remove()
+        finally:
+            tracer.stop()
+            self._write_trace()
+        self._post_installation()
+
+    def _open_journal(self):
+        """Pick up the journal of an interrupted install of the same configuration"""
+        path = os.path.join(self.target, JOURNAL_PATH)
+        key = StepJournal.config_key(self.config)
+        if not os.path.exists(path):
+            self._mount_previous(path)
+        self.journal = StepJournal.load(path, key)
+        if self.journal is None:
+            self.journal = StepJournal(key)
+        elif self.journal.steps:
+            self.logger.info(f"Resuming from {path}: {', '.join(self.journal.steps)} already done")
+            self.ui.show_step("Resuming previous installation...")
+
+    def _mount_previous(self, path):
+        """After a reboot, mount the filesystems of an earlier attempt to look for its journal"""
+        layout = self.layout()
+        if os.path.ismount(self.target) or not all(os.path.exists(device) for _, _, device in layout.filesystems()):
+            return
+        try:
+            self.disk_manager.mount_layout(layout, self.target, self._target_device())
+        except subprocess.CalledProcessError:
+            safe_run(["umount", "-R", self.target])
+            return
+        if not os.path.exists(path):
+            safe_run(["umount", "-R", self.target])
+
+    def _write_trace(self):
+        """Save the timeline of steps and commands and log where the time went"""
+        path = self.config.get('trace_file', "/tmp/arch-install-trace.json")
+        try:
+            tracer.write(path, prefix=self.name)
+        except OSError as e:
+            self.logger.warning(f"Could not write trace {path}: {e}")
+        self.logger.info(f"Timing summary, trace in {path}:\n{tracer.summary(prefix=self.name)}")
+
     def _pre_install_checks(self):
         """Perform pre-installation checks"""
-        if not check_efi():
+        if not self.hardware.efi:
             self.ui.show_error("System does not support UEFI! UEFI only supported.")
             raise SystemExit("UEFI not supported")
 
+    def _load_configuration(self):
+        """Validate an unattended configuration before anything touches the disk"""
+        disks = [disk.split()[0] for disk in self.disk_manager.list_disks()]
+        self.config = validate_config(self.unattended_config, disks, self.hardware.defaults(),
+                                      parallel=self.parallel)
+
     def _gather_configuration(self):
         """Gather all configuration from user"""
         # Disk selection
@@ -73,14 +176,19 @@ class Installer:
         self.config['rootpass'] = self.ui.input("Enter root password:", self.config, "Root Password", hidden=True)
 
         # System configuration
-        self.config['kernel'] = self.ui.menu("Select Kernel", ["linux", "linux-lts", "linux-zen","None"], self.config, "Kernel")
-        self.config['gpu'] = self.ui.menu("Select GPU Driver", ["intel", "amd", "nvidia","None"], self.config, "GPU")
-        self.config['wmde'] = self.ui.menu("Select WM/DE", ["hyprland","bspwm",  "gnome", "kde","None"], self.config, "WM/DE")
-        self.config['bootloader'] = self.ui.menu("Select Bootloader", ["systemd-boot", "grub","None"], self.config, "Bootloader")
+        self.config['kernel'] = self.ui.menu("Select Kernel", KERNELS, self.config, "Kernel",
+                                             default=self.hardware.kernel)
+        self.config['gpu'] = self.ui.menu("Select GPU Driver", GPUS, self.config, "GPU",
+                                          default=self.hardware.gpu)
+        self.config['wmde'] = self.ui.menu("Select WM/DE", WMDES, self.config, "WM/DE")
+        self.config['bootloader'] = self.ui.menu("Select Bootloader", BOOTLOADERS, self.config, "Bootloader")
+        self.config['filesystem'] = self.ui.menu("Select Filesystem", FILESYSTEMS, self.config, "Filesystem")
+        self.config['layout'] = self.ui.menu("Select Partition Layout", LAYOUTS, self.config, "Layout")
 
         # Swap configuration
-        swap_choice = self.ui.menu("Create swap file?", ["Yes", "No"], self.config, "Swap file")
-        self.config['use_swap'] = (swap_choice == "Yes")
+        swap_choice = self.ui.menu("Select swap", SWAP_MODES, self.config, "Swap")
+        self.config['swap'] = swap_choice
+        self.config['use_swap'] = (swap_choice != "None")
 
         # Locale configuration
         locale_choice = self.ui.menu("Configure locale?", ["Yes", "No"], self.config, "Configure locale?")
@@ -89,101 +197,376 @@ class Installer:
         else:
             self.config['locale'] = self.locale_manager.get_default_locale_config()
 
+    def _check_image(self):
+        """Refuse a golden image built from a different package selection or layout"""
+        if not self.config.get('image'):
+            return
+        self.image = GoldenImage(self.config['image'],
+                                 mountpoints=[mountpoint for mountpoint, _, _ in self.layout().filesystems()])
+        if self.image.exists() and not self.image.matches(self.package_list()):
+            raise Exception(f"Image {self.image.path} was built for a different package selection")
+        if self.image.exists() and not self.image.matches_layout():
+            raise Exception(f"Image {self.image.path} was captured from a different partition layout")
+
+    def deploys_image(self):
+        """True if the root comes from an existing golden image instead of pacstrap"""
+        return self.image is not None and self.image.exists()
+
     def _confirm_installation(self):
         """Show configuration summary and confirm installation"""
         if not self.ui.confirm_installation(self.config):
             raise SystemExit("Installation cancelled by user")
 
+    def _start_prefetch(self):
+        """Rank mirrors and download packages while the disk is prepared"""
+        if self.prefetcher is not None or self.cached_files:
+            # Already started for several installs at once
+            return
+        if self.deploys_image():
+            self.logger.info(f"Installing from image {self.image.path}, skipping downloads")
+            return
+
+        pkgs = self.package_list()
+        self.package_cache = self.create_package_cache()
+        if self.journal is not None and self.journal.done("packages"):
+            self.logger.info("Packages were installed by an earlier attempt, skipping downloads")
+            return
+        self.cached_files = self.package_cache.prepare(pkgs)
+        if self.cached_files:
+            self.logger.info("All packages are in the package cache, skipping downloads")
+            return
+
+        self.prefetcher = Prefetcher(self.package_manager, pkgs, cachedir=self.package_cache.pkgdir,
+                                     name=f"{self.name}-prefetch", cache=self.package_cache)
+        self.prefetcher.start()
+
+    def cache_dir(self):
+        """Host directory for downloads and other reusable build results"""
+        return self.config.get('cache_dir', "/var/cache/arch-installer")
+
+    def create_package_cache(self):
+        """Open the host package cache configured for this install"""
+        return PackageCache(self.cache_dir(), int(self.config.get('cache_max_gb', 20)) << 30)
+
+    def package_list(self):
+        """Packages for the selected kernel, GPU and WM/DE"""
+        pkgs = self.package_manager.get_package_list(
+            self.config['kernel'], self.config['gpu'], self.config['wmde'])
+        if "zram" in self._swap_mode():
+            pkgs.append("zram-generator")
+        pkgs += self.layout().packages()
+        if self.bootloader() is not None:
+            pkgs += self.bootloader().packages
+        # In the same transaction, so it is prefetched and cached with the rest
+        if self.hardware is not None and MicrocodeManager.package(self.hardware.microcode):
+            pkgs.append(MicrocodeManager.package(self.hardware.microcode))
+        if self.config.get('firmware') == "detected":
+            if self.firmware is None:
+                self.firmware = FirmwareSelection.detect()
+            pkgs = self.firmware.replace(pkgs)
+        return pkgs
+
+    def layout(self):
+        """Partitions, arrays and volumes to create"""
+        return Layout.from_config(self.config)
+
+    def filesystem(self):
+        """Backend for the root filesystem"""
+        return get_filesystem(self.layout().root.filesystem)
+
+    def _target_device(self):
+        """Inventory entry of the target disk, None if sysfs does not know it"""
+        if self.target_device is None:
+            self.target_device = self.hardware.disk(self.config['disk'])
+        return self.target_device
+
+    def _swap_mode(self):
+        """Selected swap mode; older configs only carry use_swap"""
+        if not self.config.get('use_swap'):
+            return "None"
+        return self.config.get('swap', "swapfile")
+
     def _execute_installation(self):
         """Execute the installation steps"""
-        # Unmount disk
-        self.ui.show_step("Unmounting disk...")
-        self.disk_manager.unmount_disk(self.config['disk'])
-
-        # Partitioning
-        self.ui.show_step("Partitioning disk...")
-        efi_partition, root_partition = self.disk_manager.partition_disk(self.config['disk'])
-        self.config['efi_partition'] = efi_partition
-        self.config['root_partition'] = root_partition
-
-        # Format and mount
-        self.ui.show_step("Formatting and mounting partitions...")
-        self.disk_manager.format_and_mount(efi_partition, root_partition)
-
-        # Optimize mirrorlist
-        self.ui.show_step("Optimizing mirrorlist...")
-        self.package_manager.optimize_mirrorlist()
-
-        # Install base packages
-        self.ui.show_step("Installing base packages...")
-        self.package_manager.install_base_packages(
-            self.ui, 
-            self.config['kernel'], 
-            self.config['gpu'], 
-            self.config['wmde']
-        )
+        self.initramfs = InitramfsBuilder.from_config(self.config.get('initramfs'), self.target,
+                                                      self.layout().hooks())
+        self.package_manager.options = self.initramfs.pacman_options()
+        scheduler = self._build_steps()
+        self.initramfs.watch()
+        try:
+            scheduler.run()
+        finally:
+            self.initramfs.unwatch()
+            if self.chroot is not None:
+                self.chroot.teardown()
+            self.logger.info(scheduler.report())
+            self.logger.info(self.initramfs.report())
+            if self.engine is not None:
+                self.logger.info(self.engine.report())
+
+    def _poll_cancel(self):
+        """Kill the running commands once the user presses ESC"""
+        if not self.engine.cancelled and self.ui.cancel_requested():
+            self.logger.warning("Installation cancelled by user")
+            self.ui.show_step("Cancelling...")
+            self.engine.cancel()
 
-        # Setup swap if selected
-        if self.config['use_swap']:
-            self.ui.show_step("Setting up swap file...")
-            self.swap_manager.setup_swapfile()
+    def _chroot(self):
+        """Chroot session on the target, set up on first use once packages are in place"""
+        if self.chroot is None:
+            self.chroot = ChrootSession(self.target)
+        if not self.chroot.active:
+            self.chroot.setup()
+        return self.chroot
 
-        # Configure locale
-        self.ui.show_step("Configuring locale...")
-        self.locale_manager.setup_locale(self.config['locale'])
+    def _build_steps(self):
+        """Declare the installation steps and their dependencies"""
+        scheduler = StepScheduler(max_workers=4, on_start=lambda step: self.ui.show_step(step.title),
+                                  name=f"{self.name}-step", journal=self.journal,
+                                  poll=self._poll_cancel if self.engine else None)
+        add = scheduler.add
 
-        # Basic system configuration
-        self.ui.show_step("Configuring system...")
-        self._configure_system()
+        add("unmount", self._step_unmount, outputs=["disk_free"],
+            title="Unmounting disk...")
+        add("partition", self._step_partition, inputs=["disk_free"],
+            outputs=["partitions"], title="Partitioning disk...")
+        add("format", self._step_format, inputs=["partitions"],
+            outputs=["root_mounted", "root_uuid", "efi_uuid", "filesystems"],
+            title="Formatting and mounting partitions...",
+            verify=lambda inputs: bool(self.journal.path) and os.path.exists(self.journal.path))
+        if self.deploys_image():
+            add("image", self._step_image, inputs=["root_mounted"],
+                outputs=["base_system"], resources=["chroot"], title="Writing system image...")
+        else:
+            add("prefetch", self._step_prefetch, outputs=["package_cache"],
+                title="Waiting for package downloads...")
+            add("packages", self._step_packages, inputs=["root_mounted", "package_cache"],
+                outputs=["base_system"], resources=["chroot"], title="Installing base packages...",
+                verify=lambda inputs: self._packages_present())
+        add("cpu", lambda inputs: self.hardware.microcode,
+            outputs=["cpu_type"], title="Detecting CPU...")
+        add("microcode", lambda inputs: self.microcode_manager.add_microcode(inputs['cpu_type']),
+            inputs=["base_system", "cpu_type"], outputs=["microcode_file"],
+            title="Checking microcode...",
+            verify=lambda inputs: inputs['cpu_type'] not in ("intel", "amd") or os.path.exists(
+                f"{self.target}/boot/{inputs['cpu_type']}-ucode.img"))
 
-        # Install bootloader
-        self.ui.show_step("Installing bootloader...")
-        self._install_bootloader()
+        # An image carries its initramfs, so only a pacstrap install builds one
+        boot = [] if self.deploys_image() else ["initramfs"]
+        if boot:
+            add("initramfs", self._step_initramfs, inputs=["base_system", "microcode_file"],
+                outputs=["initramfs"], resources=["chroot"], title="Building initramfs...",
+                verify=lambda inputs: self.initramfs.built())
 
-        # Set passwords
-        self.ui.show_step("Setting passwords...")
-        self._set_passwords()
+        # Capture the installed packages before anything machine specific is written
+        base = "base_system"
+        if self.image is not None and not self.deploys_image():
+            add("capture", self._step_capture,
+                inputs=["base_system", "microcode_file"] + boot, outputs=["image_captured"],
+                resources=["chroot"], title="Capturing system image...")
+            base = "image_captured"
+
+        # Everything below only needs the populated root
+        add("fstab", self._step_fstab, inputs=[base, "filesystems"], outputs=["fstab"],
+            title="Writing fstab...", verify=lambda inputs: self._fstab_written())
+        if self._swap_mode() != "None":
+            # Appends to the fstab written above
+            add("swap", lambda inputs: self._setup_swap(),
+                inputs=[base, "fstab"], title="Setting up swap...", verify=lambda inputs: self._swap_present())
+        add("locale", lambda inputs: self.locale_manager.setup_locale(
+                self.config['locale'], self.target, self._chroot(), os.path.join(self.cache_dir(), "locales")),
+            inputs=[base], resources=["chroot"], title="Configuring locale...")
+        add("system", lambda inputs: self._configure_system(),
+            inputs=[base], resources=["chroot"], title="Configuring system...")
+        self._add_bootloader_steps(add, base)
+        add("passwords", lambda inputs: self._set_passwords(),
+            inputs=[base], outputs=["users"], resources=["chroot"],
+            title="Setting passwords...", resumable=False)
 
         # Configure user locale if user exists
         if self.config['username']:
-            self.ui.show_step("Configuring user settings...")
-            self.locale_manager.setup_user_locale(self.config['username'], self.config['locale'])
+            add("user_locale", lambda inputs: self.locale_manager.setup_user_locale(
+                    self.config['username'], self.config['locale'], self.target, self._chroot()),
+                inputs=["users"], resources=["chroot"], title="Configuring user settings...",
+                resumable=False)
+
+        return scheduler
+
+    def bootloader(self):
+        """Manager for the selected bootloader, None without one"""
+        if self.config['bootloader'] == "systemd-boot":
+            return SystemdBoot()
+        if self.config['bootloader'] == "grub":
+            return Grub()
+        return None
+
+    def _add_bootloader_steps(self, add, base="base_system"):
+        """Declare bootloader installation and, for systemd-boot, its entry files"""
+        bootloader = self.bootloader()
+        if bootloader is None:
+            return
+        # Entries find the root by the UUID it was formatted with
+        filesystem = self.filesystem().name
+        if isinstance(bootloader, SystemdBoot):
+            add("bootloader", lambda inputs: bootloader.install_loader(self.target, self._chroot()),
+                inputs=[base], outputs=["loader"], resources=["chroot"],
+                title="Installing bootloader...",
+                verify=lambda inputs: os.path.exists(f"{self.target}/boot/loader/loader.conf"))
+            add("boot_entries", lambda inputs: bootloader.write_entries(
+                    inputs['root_uuid'], self.config['kernel'], self.config['gpu'], inputs['microcode_file'],
+                    self.target, self.initramfs.fallback, filesystem),
+                inputs=["loader", "root_uuid", "microcode_file"],
+                title="Writing boot entries...",
+                verify=lambda inputs: os.path.exists(f"{self.target}/boot/loader/entries/arch.conf"))
+        else:
+            add("bootloader", lambda inputs: bootloader.install(
+                    inputs['root_uuid'], inputs['efi_uuid'], self.config['kernel'], self.config['gpu'],
+                    inputs['microcode_file'], self.target, self._chroot(), self.initramfs.fallback, filesystem),
+                inputs=[base, "root_uuid", "efi_uuid", "microcode_file"],
+                resources=["chroot"], title="Installing bootloader...",
+                verify=lambda inputs: os.path.exists(f"{self.target}/boot/grub/grub.cfg"))
+
+    def _packages_present(self):
+        """Cheap check that pacstrap got as far as base and the kernel"""
+        local = os.path.join(self.target, "var/lib/pacman/local")
+        try:
+            names = {entry.rsplit("-", 2)[0] for entry in os.listdir(local)}
+        except OSError:
+            return False
+        required = {"base"}
+        kernel = self.config.get('kernel')
+        if kernel and kernel != "None":
+            required.add(kernel)
+        return required <= names
+
+    def _swap_present(self):
+        """Cheap check that the selected swap is configured"""
+        mode = self._swap_mode()
+        if "swapfile" in mode and not os.path.exists(f"{self.target}/swapfile"):
+            return False
+        if "zram" in mode and not os.path.exists(f"{self.target}/etc/systemd/zram-generator.conf"):
+            return False
+        return True
+
+    def _setup_swap(self):
+        """Create swap and log how long allocation took"""
+        hibernate = self.config.get('hibernate', False)
+        result = self.swap_manager.setup(self._swap_mode(), hibernate,
+                                         self.config.get('swap_size_mb') or self.hardware.swap_mb(hibernate),
+                                         self.target, self.layout().root.filesystem)
+        if result:
+            self.logger.info(f"Swap file: {result['size_mb']} MiB via {result['method']} "
+                             f"in {result['seconds']:.2f}s")
+
+    def _step_unmount(self, inputs):
+        """Unmount every disk of the layout"""
+        for disk in self.layout().disks:
+            self.disk_manager.unmount_disk(disk)
+        return True
+
+    def _step_partition(self, inputs):
+        """Partition the disks and build the arrays and volumes of the layout"""
+        layout = self.layout()
+        self.logger.info(f"Layout: {layout.describe()}")
+        return [list(entry) for entry in self.disk_manager.partition_disk(layout)]
+
+    def _step_format(self, inputs):
+        """Format every new filesystem at once, then mount them"""
+        filesystems = self.disk_manager.format_and_mount(self.layout(), self.target, self._target_device())
+        # From here on finished steps survive a crash
+        self.journal.attach(os.path.join(self.target, JOURNAL_PATH))
+        uuids = {mountpoint: fs_uuid for mountpoint, _, fs_uuid in filesystems}
+        return {'root_uuid': uuids["/"], 'efi_uuid': uuids["/boot"], 'filesystems': filesystems,
+                'root_mounted': True}
+
+    def _step_fstab(self, inputs):
+        """Mount the new filesystems by UUID with the options picked for the disk"""
+        write_fstab(self.target, [backend(name).fstab_line(fs_uuid, mountpoint, self._target_device())
+                                  for mountpoint, name, fs_uuid in inputs['filesystems']])
+        return True
+
+    def _fstab_written(self):
+        """Cheap check that the fstab is ours rather than the one pacstrap ships"""
+        try:
+            with open(f"{self.target}/etc/fstab") as f:
+                return f.read().startswith(FSTAB_HEADER)
+        except OSError:
+            return False
+
+    def _step_prefetch(self, inputs):
+        """Wait for mirror ranking and downloads started after confirmation"""
+        if self.prefetcher is None:
+            return self.package_cache.pkgdir
+
+        waited = self.prefetcher.wait()
+        saved = self.prefetcher.duration - waited
+        self.logger.info(
+            f"Prefetch took {self.prefetcher.duration:.1f}s, waited {waited:.1f}s, "
+            f"overlap saved {saved:.1f}s")
+        return self.prefetcher.cachedir
+
+    def _step_image(self, inputs):
+        """Stream the golden image onto the new filesystems"""
+        seconds = self.disk_manager.write_image(self.image, self.target)
+        self.ui.show_package_message(f"System image written in {seconds:.1f}s")
+        return True
+
+    def _step_initramfs(self, inputs):
+        """Build the images and DKMS modules the deferred hooks skipped"""
+        self.initramfs.build(self._chroot())
+        self.ui.show_package_message(self.initramfs.report())
+        return True
+
+    def _step_capture(self, inputs):
+        """Save the freshly installed root as the golden image"""
+        self.image.capture(self.target, self.package_list())
+        return True
+
+    def _step_packages(self, inputs):
+        """Install base packages from the package cache"""
+        pkgs = self.package_list()
+        self.initramfs.prepare()
+        if self.cached_files:
+            self.package_manager.install_files(self.ui, pkgs, self.cached_files)
+        else:
+            self.package_manager.cachedirs.append(inputs['package_cache'])
+            self.package_manager.install_packages(self.ui, pkgs)
+
+        report = self.package_cache.finish(self.target, pkgs)
+        self.ui.show_package_message(
+            f"Package cache: {report['hits']} hits, {report['misses']} misses")
+        if self.firmware is not None:
+            self.ui.show_package_message(self.firmware.report())
+        return True
 
     def _configure_system(self):
         """Configure basic system settings"""
-        run("arch-chroot /mnt ln -sf /usr/share/zoneinfo/Asia/Ho_Chi_Minh /etc/localtime")
-        run("arch-chroot /mnt hwclock --systohc")
-        run("arch-chroot /mnt systemctl enable NetworkManager")
+        cmds = [
+            "ln -sf /usr/share/zoneinfo/Asia/Ho_Chi_Minh /etc/localtime",
+            "hwclock --systohc",
+            "systemctl enable NetworkManager",
+        ]
 
         # Enable display manager based on WM/DE
         if self.config['wmde'] == "gnome":
-            run("arch-chroot /mnt systemctl enable gdm")
+            cmds.append("systemctl enable gdm")
         elif self.config['wmde'] == "kde":
-            run("arch-chroot /mnt systemctl enable sddm")
-
-    def _install_bootloader(self):
-        """Install and configure bootloader"""
-        if self.config['bootloader'] == "systemd-boot":
-            bootloader = SystemdBoot()
-        else:
-            bootloader = Grub()
-        
-        microcode_file = self.microcode_manager.add_microcode()
-        bootloader.install(
-            self.config['root_partition'],
-            self.config['kernel'],
-            self.config['gpu'],
-            microcode_file
-        )
+            cmds.append("systemctl enable sddm")
+        cmds += [f"systemctl enable {unit}" for unit in self.filesystem().services(self._target_device())]
+        self._chroot().run_batch(cmds)
 
     def _set_passwords(self):
         """Set root and user passwords"""
-        run(f"arch-chroot /mnt bash -c \"echo 'root:{self.config['rootpass']}' | chpasswd\"")
+        cmds = [f"echo 'root:{self.config['rootpass']}' | chpasswd"]
         
+        # Safe to repeat when resuming an interrupted install
         if self.config['username']:
-            run(f"arch-chroot /mnt useradd -m -G wheel -s /bin/bash {self.config['username']}")
-            run(f"arch-chroot /mnt bash -c \"echo '{self.config['username']}:{self.config['userpass']}' | chpasswd\"")
-            run("arch-chroot /mnt bash -c \"echo '%wheel ALL=(ALL:ALL) ALL' >> /etc/sudoers\"")
+            cmds.append(f"id -u {self.config['username']} >/dev/null 2>&1 || "
+                        f"useradd -m -G wheel -s /bin/bash {self.config['username']}")
+            cmds.append(f"echo '{self.config['username']}:{self.config['userpass']}' | chpasswd")
+            cmds.append("grep -qxF '%wheel ALL=(ALL:ALL) ALL' /etc/sudoers || "
+                        "echo '%wheel ALL=(ALL:ALL) ALL' >> /etc/sudoers")
+        self._chroot().run_batch(cmds)
 
     def _post_installation(self):
         """Post-installation steps"""
@@ -0,0 +1,243 @@
+"""Block device inventory read from sysfs and mountinfo"""
+
+import os
+import re
+
+# Whole devices that are never installation targets
+VIRTUAL_PREFIXES = ("loop", "ram", "zram", "fd")
+# Device-mapper names of LVM volumes are <vg>-<lv>, with dashes inside either doubled
+LVM_NAME_RE = re.compile(r"^((?:[^-]|--)+)-")
+
+def _read(path, default=None):
+    """Contents of a small sysfs file without the trailing newline"""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+def _unescape(path):
+    """Undo the octal escapes mountinfo uses for spaces, tabs and newlines"""
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), path)
+
+def human_size(size):
+    """Size the way lsblk prints it, e.g. 20G or 931.5G"""
+    for unit in ("B", "K", "M", "G", "T", "P"):
+        if size < 1024 or unit == "P":
+            break
+        size /= 1024
+    text = f"{size:.1f}".rstrip("0").rstrip(".")
+    return f"{text}{unit}"
+
+class BlockDevice:
+    """A disk, partition or virtual block device"""
+
+    def __init__(self, name, devno, size, kind, parent=None):
+        self.name = name
+        self.devno = devno
+        self.size = size
+        self.kind = kind
+        self.parent = parent
+        self.rotational = False
+        self.removable = False
+        self.transport = None
+        self.model = None
+        self.partitions = []
+        self.holders = []
+        self.mountpoints = []
+        self.swap = False
+        # Device-mapper name and UUID, e.g. vg-root and LVM-...
+        self.dm_name = None
+        self.dm_uuid = None
+
+    @property
+    def path(self):
+        return f"/dev/{self.name}"
+
+    def __repr__(self):
+        return f"BlockDevice({self.name!r})"
+
+class Inventory:
+    """Every block device with its partitions, holders and mountpoints
+
+    Built once from a handful of small reads per device and indexed by name,
+    device number and /dev path, so queries never run a command or match
+    substrings (/dev/sda is not /dev/sdaa). The paths can point at a fake
+    tree for tests.
+    """
+
+    def __init__(self, sysfs="/sys", mountinfo="/proc/self/mountinfo", swaps="/proc/swaps"):
+        self.sysfs = sysfs
+        self.mountinfo = mountinfo
+        self.swaps = swaps
+        self.devices = {}
+        self.by_devno = {}
+
+    @classmethod
+    def scan(cls, **paths):
+        inventory = cls(**paths)
+        inventory.refresh()
+        return inventory
+
+    def refresh(self):
+        """Read sysfs, mountinfo and swaps again"""
+        self.devices = {}
+        self.by_devno = {}
+        block = os.path.join(self.sysfs, "block")
+        try:
+            entries = list(os.scandir(block))
+        except OSError:
+            entries = []
+        for entry in entries:
+            self._read_device(entry.path, entry.name)
+        for device in self.devices.values():
+            self.by_devno[device.devno] = device
+        self._read_mounts()
+        self._read_swaps()
+
+    def _read_device(self, path, name):
+        kind = self._kind(path, name)
+        disk = BlockDevice(name, _read(os.path.join(path, "dev")), self._size(path), kind)
+        disk.rotational = _read(os.path.join(path, "queue/rotational")) == "1"
+        disk.removable = _read(os.path.join(path, "removable")) == "1"
+        disk.model = _read(os.path.join(path, "device/model"))
+        disk.transport = self._transport(path, name)
+        disk.holders = self._holders(path)
+        if kind == "dm":
+            disk.dm_name = _read(os.path.join(path, "dm/name"))
+            disk.dm_uuid = _read(os.path.join(path, "dm/uuid"))
+        self.devices[name] = disk
+
+        for entry in os.scandir(path):
+            if entry.is_dir(follow_symlinks=False) and os.path.exists(os.path.join(entry.path, "partition")):
+                part = BlockDevice(entry.name, _read(os.path.join(entry.path, "dev")),
+                                   self._size(entry.path), "part", parent=name)
+                part.rotational = disk.rotational
+                part.transport = disk.transport
+                part.holders = self._holders(entry.path)
+                disk.partitions.append(part)
+                self.devices[entry.name] = part
+        disk.partitions.sort(key=lambda part: int(_read(os.path.join(path, part.name, "partition"), "0")))
+
+    @staticmethod
+    def _size(path):
+        """Bytes; sysfs counts 512-byte sectors whatever the logical block size"""
+        return int(_read(os.path.join(path, "size"), "0")) * 512
+
+    @staticmethod
+    def _holders(path):
+        try:
+            return sorted(os.listdir(os.path.join(path, "holders")))
+        except OSError:
+            return []
+
+    @staticmethod
+    def _kind(path, name):
+        if os.path.isdir(os.path.join(path, "dm")):
+            return "dm"
+        if os.path.isdir(os.path.join(path, "md")):
+            return "md"
+        if os.path.isdir(os.path.join(path, "loop")) or name.startswith("loop"):
+            return "loop"
+        if _read(os.path.join(path, "device/type")) == "5":
+            return "rom"
+        return "disk"
+
+    @staticmethod
+    def _transport(path, name):
+        """Bus the disk hangs off, from where its sysfs entry links to"""
+        if name.startswith("nvme"):
+            return "nvme"
+        target = os.path.realpath(path)
+        for marker, transport in (("/usb", "usb"), ("/ata", "sata"), ("/virtio", "virtio"),
+                                  ("/mmc", "mmc"), ("/end_device-", "sas")):
+            if marker in target:
+                return transport
+        return None
+
+    def _read_mounts(self):
+        """Attach mountpoints by device number, or by source path for btrfs and friends"""
+        names = {}
+        for device in self.devices.values():
+            if device.dm_name:
+                names[f"/dev/mapper/{device.dm_name}"] = device
+            names[device.path] = device
+
+        try:
+            with open(self.mountinfo) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10 or "-" not in fields:
+                continue
+            source = fields[fields.index("-") + 2]
+            device = self.by_devno.get(fields[2]) or names.get(source)
+            if device is not None:
+                device.mountpoints.append(_unescape(fields[4]))
+
+    def _read_swaps(self):
+        try:
+            with open(self.swaps) as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            return
+        for line in lines:
+            device = self.get(line.split()[0]) if line.strip() else None
+            if device is not None:
+                device.swap = True
+
+    def get(self, disk):
+        """Device by name or /dev path, or None"""
+        if disk.startswith("/dev/"):
+            disk = disk[len("/dev/"):]
+        return self.devices.get(disk)
+
+    def disks(self):
+        """Physical disks that can be installed to, by name"""
+        return sorted((d for d in self.devices.values()
+                       if d.kind == "disk" and d.parent is None and not d.name.startswith(VIRTUAL_PREFIXES)),
+                      key=lambda d: d.name)
+
+    def tree(self, disk):
+        """The device, its partitions and everything stacked on top of them"""
+        device = self.get(disk) if isinstance(disk, str) else disk
+        if device is None:
+            return []
+        seen = []
+        todo = [device]
+        while todo:
+            current = todo.pop(0)
+            if current in seen:
+                continue
+            seen.append(current)
+            todo.extend(current.partitions)
+            todo.extend(self.devices[name] for name in current.holders if name in self.devices)
+        return seen
+
+    def mountpoints(self, disk):
+        """Every mountpoint on the disk, its partitions and holders, deepest first"""
+        points = [point for device in self.tree(disk) for point in device.mountpoints]
+        return sorted(set(points), key=lambda point: (-point.count("/"), point))
+
+    def swap_devices(self, disk):
+        return [device for device in self.tree(disk) if device.swap]
+
+    def arrays(self, disk):
+        """md arrays built on the disk, outermost first"""
+        return [device for device in reversed(self.tree(disk)) if device.kind == "md"]
+
+    def volume_groups(self, disk):
+        """Names of the LVM volume groups with a volume on the disk"""
+        groups = []
+        for device in self.tree(disk):
+            match = LVM_NAME_RE.match(device.dm_name or "")
+            if (device.dm_uuid or "").startswith("LVM-") and match:
+                group = match.group(1).replace("--", "-")
+                if group not in groups:
+                    groups.append(group)
+        return groups
+
+    def is_mounted(self, disk):
+        return bool(self.mountpoints(disk)) or bool(self.swap_devices(disk))
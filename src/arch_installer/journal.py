@@ -0,0 +1,90 @@
+"""Step journal for resuming interrupted installs"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+# Relative to the target root, so the journal lives and dies with the new system
+JOURNAL_PATH = "var/lib/arch-installer/journal.json"
+
+# Settings that do not change what ends up on the disk
+HOST_KEYS = ("trace_file", "cache_dir", "cache_max_gb", "reboot")
+# Never written to the disk, not even hashed
+SECRET_KEYS = ("rootpass", "userpass")
+
+def digest(value):
+    """Stable hash of a JSON-like value"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+class StepJournal:
+    """Finished steps with a hash of their inputs and the outputs they produced
+
+    Until the target filesystem is mounted the journal only lives in memory;
+    attach() gives it its file, after which every finished step is saved
+    atomically. A journal only applies to the configuration it was written
+    for.
+    """
+
+    def __init__(self, config_key, path=None):
+        self.config_key = config_key
+        self.path = path
+        self.steps = {}
+
+    @staticmethod
+    def config_key(config):
+        """Hash of everything in the config that shapes the installed system"""
+        return digest({k: v for k, v in config.items() if k not in HOST_KEYS + SECRET_KEYS})
+
+    @classmethod
+    def load(cls, path, config_key):
+        """The journal at path, or None if there is none for this configuration"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("config") != config_key:
+            logging.info(f"Ignoring journal {path}, it belongs to another configuration")
+            return None
+        journal = cls(config_key, path)
+        journal.steps = data.get("steps", {})
+        return journal
+
+    def attach(self, path):
+        """Start saving to path, e.g. once the target root is mounted"""
+        self.path = path
+        self.save()
+
+    def done(self, name):
+        return name in self.steps
+
+    def completed(self, name, inputs):
+        """Outputs of step name if it finished with the same inputs, else None"""
+        entry = self.steps.get(name)
+        if entry is None or entry["inputs"] != digest(inputs):
+            return None
+        return entry["outputs"]
+
+    def record(self, name, inputs, outputs):
+        self.steps[name] = {"inputs": digest(inputs), "outputs": outputs, "finished": round(time.time(), 3)}
+        self.save()
+
+    def save(self):
+        """Write the journal atomically so a crash leaves the old or the new copy"""
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"config": self.config_key, "steps": self.steps}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        """Forget the journal once the install is complete"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.steps = {}
@@ -0,0 +1,242 @@
+"""Declarative partition layouts, optionally on software RAID and LVM"""
+
+import collections
+import os
+import re
+from arch_installer.filesystems import BACKENDS, Vfat, get_filesystem
+
+ESP_SIZE_MB = 1024
+# Prefix of the volume group and arrays, which are named after the first disk
+VOLUME_GROUP = "arch"
+# Supported md levels and the disks each needs
+RAID_LEVELS = {0: 2, 1: 2, 5: 3, 10: 4}
+# Volumes besides the ESP as (mountpoint, MiB); None takes the rest of the disk
+PRESETS = {
+    "default": [("/", None)],
+    "home": [("/", 40 << 10), ("/home", None)],
+    "server": [("/", 30 << 10), ("/var", 20 << 10), ("/scratch", 16 << 10), ("/home", None)],
+}
+SIZE_UNITS = {"M": 1, "G": 1 << 10, "T": 1 << 20}
+SIZE_RE = re.compile(r"^(\d+)\s*([MGT])(?:i?B)?$", re.IGNORECASE)
+# sfdisk type aliases
+ESP_TYPE = "U"
+LINUX_TYPE = "L"
+RAID_TYPE = "R"
+LVM_TYPE = "V"
+
+Volume = collections.namedtuple("Volume", ["name", "mountpoint", "size_mb", "filesystem"])
+
+def partition_path(disk, number):
+    """Device path of a partition; NVMe, MMC and loop devices use a p separator"""
+    if disk[-1].isdigit():
+        return f"{disk}p{number}"
+    return f"{disk}{number}"
+
+def parse_size(value):
+    """MiB from a number of MiB or a string like "512M" or "40G"; None for the rest of the disk"""
+    if value is None or value == "rest":
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    match = SIZE_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"invalid size {value!r}, expected e.g. 512M or 40G")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2).upper()]
+
+def volume_name(mountpoint):
+    """Partition, array and logical volume name for a mountpoint, e.g. var_log for /var/log"""
+    return mountpoint.strip("/").replace("/", "_") or "root"
+
+def backend(name):
+    """Filesystem backend by name, including the ESP's vfat"""
+    return Vfat() if name == "vfat" else get_filesystem(name)
+
+class Layout:
+    """Partitions of one or more disks, and the arrays and volumes built on them
+
+    The ESP is the first partition of the first disk. Without raid or lvm
+    every volume is a partition of that disk. With raid every disk gets the
+    same table and each volume is an md array over its partition on all of
+    them. With lvm each disk gets a single partition, and the physical volumes
+    on them, or one array over them with raid too, form a volume group with a
+    logical volume per volume.
+    """
+
+    def __init__(self, disks, volumes=None, raid=None, lvm=False, esp_mb=ESP_SIZE_MB):
+        self.disks = list(disks)
+        self.volumes = list(volumes or [Volume("root", "/", None, "ext4")])
+        self.raid = raid
+        self.lvm = lvm
+        self.esp_mb = esp_mb
+
+    @classmethod
+    def from_config(cls, config):
+        """Layout for config: a preset name, or a mapping with preset or partitions
+
+        Raises ValueError for a layout that cannot be read at all; errors()
+        reports the rest.
+        """
+        layout = config.get('layout') or "default"
+        if isinstance(layout, str):
+            layout = {'preset': layout}
+        if not isinstance(layout, dict):
+            raise ValueError("layout must be a preset name or a mapping")
+        filesystem = config.get('filesystem') or "ext4"
+        partitions = layout.get('partitions')
+        if partitions is None:
+            preset = layout.get('preset') or "default"
+            if preset not in PRESETS:
+                raise ValueError(f"layout must be one of {', '.join(PRESETS)}, got {preset!r}")
+            partitions = [{'mountpoint': mountpoint, 'size': size} for mountpoint, size in PRESETS[preset]]
+        if not isinstance(partitions, list) or not all(isinstance(p, dict) and p.get('mountpoint')
+                                                       for p in partitions):
+            raise ValueError("layout partitions must be a list of mappings with a mountpoint")
+        volumes = [Volume(volume_name(p['mountpoint']), p['mountpoint'], parse_size(p.get('size')),
+                          p.get('filesystem') or filesystem) for p in partitions]
+
+        devices = layout.get('devices') or []
+        if isinstance(devices, str):
+            # The flat config format has no lists
+            devices = [device for device in devices.split(",") if device]
+        disks = [config.get('disk')] + [device for device in devices if device != config.get('disk')]
+        return cls(disks, volumes, layout.get('raid'), bool(layout.get('lvm')),
+                   parse_size(layout.get('esp_size', ESP_SIZE_MB)))
+
+    def errors(self, available=None):
+        """Everything wrong with the layout, given the disks that can be used"""
+        errors = []
+        mountpoints = [volume.mountpoint for volume in self.volumes]
+        if "/" not in mountpoints:
+            errors.append("layout needs a / partition")
+        if len(set(mountpoints)) != len(mountpoints):
+            errors.append("layout mountpoints must be unique")
+        for volume in self.volumes:
+            if not volume.mountpoint.startswith("/") or volume.mountpoint == "/boot":
+                errors.append(f"layout mountpoint {volume.mountpoint!r} must be absolute and not /boot, the ESP")
+            if volume.filesystem not in BACKENDS:
+                errors.append(f"layout filesystem for {volume.mountpoint} must be one of "
+                              f"{', '.join(BACKENDS)}, got {volume.filesystem!r}")
+            if volume.size_mb is not None and volume.size_mb <= 0:
+                errors.append(f"layout size for {volume.mountpoint} must be positive")
+        if any(volume.size_mb is None for volume in self.volumes[:-1]):
+            errors.append("only the last layout partition can take the rest of the disk")
+        if available is not None:
+            for disk in self.disks[1:]:
+                if disk not in available:
+                    errors.append(f"layout device {disk!r} is not one of the available disks")
+        if len(set(self.disks)) != len(self.disks):
+            errors.append("layout devices must be different disks")
+        if self.raid is not None:
+            if self.raid not in RAID_LEVELS:
+                errors.append(f"layout raid must be one of {', '.join(map(str, RAID_LEVELS))}, got {self.raid!r}")
+            elif len(self.disks) < RAID_LEVELS[self.raid]:
+                errors.append(f"raid {self.raid} needs {RAID_LEVELS[self.raid]} disks, got {len(self.disks)}")
+        elif len(self.disks) > 1 and not self.lvm:
+            errors.append("layout devices need raid or lvm to be used")
+        return errors
+
+    @property
+    def root(self):
+        return next(volume for volume in self.volumes if volume.mountpoint == "/")
+
+    def _partitions(self, index):
+        """(name, MiB or None, sfdisk type) of each partition on disk index, in order"""
+        partitions = []
+        # With raid the tables match, so every disk carries an ESP sized slot
+        if index == 0 or self.raid is not None:
+            partitions.append(("esp", self.esp_mb, ESP_TYPE))
+        data_type = RAID_TYPE if self.raid is not None else LVM_TYPE if self.lvm else LINUX_TYPE
+        if self.lvm:
+            partitions.append(("lvm", None, data_type))
+        else:
+            partitions += [(volume.name, volume.size_mb, data_type) for volume in self.volumes]
+        return partitions
+
+    def table(self, index):
+        """sfdisk script with the whole GPT of disk index"""
+        lines = ["label: gpt"]
+        for name, size, kind in self._partitions(index):
+            lines.append((f"size={size}MiB, " if size else "") + f"type={kind}, name={name}")
+        return "\n".join(lines) + "\n"
+
+    def members(self, name):
+        """Partition called name on every disk that has one"""
+        members = []
+        for index, disk in enumerate(self.disks):
+            names = [partition[0] for partition in self._partitions(index)]
+            if name in names:
+                members.append(partition_path(disk, names.index(name) + 1))
+        return members
+
+    @property
+    def esp(self):
+        return partition_path(self.disks[0], 1)
+
+    @property
+    def volume_group(self):
+        """e.g. arch_sda, so no two targets or a host's own group share a name"""
+        return f"{VOLUME_GROUP}_{os.path.basename(self.disks[0])}"
+
+    def array(self, name):
+        """md array for a volume, or for lvm, e.g. /dev/md/sda_root"""
+        return f"/dev/md/{os.path.basename(self.disks[0])}_{name}"
+
+    def devices(self):
+        """(volume, block device holding its filesystem) for every volume"""
+        if self.lvm:
+            return [(volume, f"/dev/{self.volume_group}/{volume.name}") for volume in self.volumes]
+        if self.raid is not None:
+            return [(volume, self.array(volume.name)) for volume in self.volumes]
+        return [(volume, self.members(volume.name)[0]) for volume in self.volumes]
+
+    def assemble_commands(self):
+        """Commands creating the arrays and logical volumes once the tables are written"""
+        cmds = []
+        arrays = [] if self.raid is None else ["lvm"] if self.lvm else [volume.name for volume in self.volumes]
+        for name in arrays:
+            members = self.members(name)
+            cmds.append(["mdadm", "--create", self.array(name), "--run", "--metadata=1.2",
+                         f"--level={self.raid}", f"--raid-devices={len(members)}"] + members)
+        if self.lvm:
+            physical = [self.array("lvm")] if self.raid is not None else self.members("lvm")
+            cmds.append(["pvcreate", "-ff", "--yes"] + physical)
+            cmds.append(["vgcreate", self.volume_group] + physical)
+            for volume in self.volumes:
+                size = ["-L", f"{volume.size_mb}m"] if volume.size_mb else ["-l", "100%FREE"]
+                cmds.append(["lvcreate", "--yes", "-W", "y", "-n", volume.name] + size + [self.volume_group])
+        return cmds
+
+    def filesystems(self):
+        """(mountpoint, filesystem name, device) of the ESP and every volume, parents first"""
+        entries = [(volume.mountpoint, volume.filesystem, device) for volume, device in self.devices()]
+        entries.append(("/boot", "vfat", self.esp))
+        return sorted(entries, key=lambda entry: (entry[0] != "/", entry[0].count("/"), entry[0]))
+
+    def packages(self):
+        """Tools the installed system needs for these filesystems, arrays and volumes"""
+        pkgs = []
+        for volume in self.volumes:
+            pkgs += [pkg for pkg in get_filesystem(volume.filesystem).packages if pkg not in pkgs]
+        if self.raid is not None:
+            pkgs.append("mdadm")
+        if self.lvm:
+            pkgs.append("lvm2")
+        return pkgs
+
+    def hooks(self):
+        """mkinitcpio hooks that assemble the root before it is mounted"""
+        hooks = []
+        if self.raid is not None:
+            hooks.append("mdadm_udev")
+        if self.lvm:
+            hooks.append("lvm2")
+        return hooks
+
+    def describe(self):
+        text = ", ".join(f"{volume.mountpoint} {volume.filesystem} "
+                         + (f"{volume.size_mb} MiB" if volume.size_mb else "rest") for volume in self.volumes)
+        if self.raid is not None:
+            text += f" on raid{self.raid}"
+        if self.lvm:
+            text += " on lvm"
+        return f"{text} across {', '.join(self.disks)}"
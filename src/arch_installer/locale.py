@@ -1,14 +1,79 @@
 """Locale configuration management"""
 
+import hashlib
+import logging
+import os
+import shutil
 import subprocess
-from arch_installer.utils import run
+import tempfile
+import time
+from arch_installer.chroot import ChrootSession
+from arch_installer.config import LOCALE_KEYS
+
+SUPPORTED_PATH = "usr/share/i18n/SUPPORTED"
+ARCHIVE_PATH = "usr/lib/locale/locale-archive"
+# Key of the locale set the archive was built for
+STAMP_PATH = "usr/lib/locale/.arch-installer-locales"
+# Compiled into glibc, nothing to generate
+BUILTIN_LOCALES = ("C", "POSIX", "C.UTF-8", "C.utf8")
+
+def locale_key(name):
+    """Lookup key under which en_US.utf8 and en_US.UTF-8 are the same locale"""
+    base, dot, codeset = name.partition(".")
+    if not dot:
+        return name
+    codeset, at, modifier = codeset.partition("@")
+    return f"{base}.{codeset.lower().replace('-', '')}{at}{modifier}"
+
+class SupportedLocales:
+    """Locales a glibc can generate, from its SUPPORTED list, indexed by name"""
+
+    # Parsed lists by path, reused while the file is unchanged
+    _loaded = {}
+
+    def __init__(self, entries):
+        self.names = [name for name, _ in entries]
+        self.index = {locale_key(name): (name, charset) for name, charset in entries}
+
+    @classmethod
+    def load(cls, root="/"):
+        """The list shipped in root, or None when glibc's locale sources are missing"""
+        path = os.path.join(root, SUPPORTED_PATH)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = cls._loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        entries = []
+        with open(path) as f:
+            for line in f:
+                # Installed lists read "en_US.UTF-8 UTF-8", glibc's source tree "en_US.UTF-8/UTF-8 \"
+                fields = line.replace("/", " ").rstrip(" \\\n").split()
+                if len(fields) == 2 and not line.startswith(("#", "SUPPORTED-LOCALES")):
+                    entries.append((fields[0], fields[1]))
+        supported = cls(entries)
+        cls._loaded[path] = (mtime, supported)
+        return supported
+
+    def entry(self, name):
+        """The locale.gen line for name, or None if glibc cannot build it"""
+        found = self.index.get(locale_key(name))
+        if found is None:
+            return None
+        return f"{found[0]} {found[1]}"
 
 class LocaleManager:
     """Manage locale configuration"""
     
     @staticmethod
-    def get_available_locales():
-        """Get list of available locales"""
+    def get_available_locales(root="/"):
+        """Get list of locales glibc can generate, or the host's when its list is missing"""
+        supported = SupportedLocales.load(root)
+        if supported is not None and supported.names:
+            return supported.names
         try:
             result = subprocess.run("locale -a", shell=True, capture_output=True, text=True)
             return result.stdout.strip().split('\n')
@@ -42,27 +107,76 @@ class LocaleManager:
         }
     
     @staticmethod
-    def setup_locale(locale_conf):
-        """Configure system locale"""
-        # Configure locale.gen
-        locales_to_enable = [
-            "en_US.UTF-8 UTF-8",
-            "vi_VN.UTF-8 UTF-8",
-            locale_conf['locale'] + " UTF-8"
-        ]
-        
-        # Remove duplicates
-        unique_locales = list(set(locales_to_enable))
-        
-        with open("/mnt/etc/locale.gen", "r") as f:
-            content = f.read()
-        
-        for locale in unique_locales:
-            # Uncomment locale if needed
-            content = content.replace(f"#{locale}", locale)
-        
-        with open("/mnt/etc/locale.gen", "w") as f:
-            f.write(content)
+    def locale_gen_entries(locale_conf, root="/mnt"):
+        """locale.gen lines for exactly the locales the configuration uses"""
+        supported = SupportedLocales.load(root)
+        entries = []
+        for key in LOCALE_KEYS:
+            name = locale_conf[key]
+            if name in BUILTIN_LOCALES:
+                continue
+            if supported is not None:
+                entry = supported.entry(name)
+                if entry is None:
+                    raise Exception(f"Locale {name} is not in {SUPPORTED_PATH}")
+            else:
+                entry = f"{name} {name.partition('.')[2] or 'UTF-8'}"
+            if entry not in entries:
+                entries.append(entry)
+        return entries
+
+    @staticmethod
+    def write_locale_gen(entries, root="/mnt"):
+        """Enable exactly entries in locale.gen, commenting out any others"""
+        path = f"{root}/etc/locale.gen"
+        try:
+            with open(path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+
+        missing = list(entries)
+        out = []
+        for line in lines:
+            # "#  en_US.UTF-8 UTF-8" in the header is an example, "#en_US.UTF-8 UTF-8" an entry
+            if line.startswith("#") and not line[1:2].strip():
+                out.append(line)
+                continue
+            entry = " ".join(line.lstrip("#").split())
+            if entry in missing:
+                out.append(entry)
+                missing.remove(entry)
+            elif line.strip() and not line.startswith("#"):
+                out.append(f"#{line}")
+            else:
+                out.append(line)
+        with open(path, "w") as f:
+            f.write("\n".join(out + missing) + "\n")
+
+    @staticmethod
+    def glibc_version(root="/mnt"):
+        """Version of glibc installed in root, from pacman's local database"""
+        try:
+            names = os.listdir(os.path.join(root, "var/lib/pacman/local"))
+        except OSError:
+            return None
+        for name in names:
+            package, _, version = name.partition("-")
+            if package == "glibc" and version[:1].isdigit():
+                return version
+        return None
+
+    @staticmethod
+    def archive_key(entries, glibc):
+        """Cache key of a compiled archive; archives only fit the glibc that built them"""
+        return hashlib.sha256("\n".join([glibc] + sorted(entries)).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def setup_locale(locale_conf, root="/mnt", chroot=None, cache_dir=None):
+        """Configure system locale, reusing a cached archive for the same locales and glibc"""
+        start = time.monotonic()
+        entries = LocaleManager.locale_gen_entries(locale_conf, root)
+        LocaleManager.write_locale_gen(entries, root)
         
         # Create locale.conf
         locale_content = f"""LANG={locale_conf['lang']}
@@ -70,14 +184,38 @@ LC_TIME={locale_conf['time_format']}
 LC_NUMERIC={locale_conf['number_format']}
 LC_MONETARY={locale_conf['currency_format']}
 """
-        with open("/mnt/etc/locale.conf", "w") as f:
+        with open(f"{root}/etc/locale.conf", "w") as f:
             f.write(locale_content)
         
-        # Generate locales
-        run("arch-chroot /mnt locale-gen")
+        glibc = LocaleManager.glibc_version(root)
+        key = LocaleManager.archive_key(entries, glibc) if glibc else None
+        archive = os.path.join(root, ARCHIVE_PATH)
+        stamp = os.path.join(root, STAMP_PATH)
+        cached = os.path.join(cache_dir, key, "locale-archive") if cache_dir and key else None
+
+        if key and os.path.exists(archive) and _read_stamp(stamp) == key:
+            how = "already built"
+        elif cached and os.path.exists(cached):
+            _copy_atomic(cached, archive)
+            how = "from cache"
+        elif entries:
+            # locale-gen compiles only what locale.gen enables, now exactly entries
+            with ChrootSession.reuse(chroot, root) as session:
+                session.run("locale-gen")
+            how = "generated"
+            if cached and os.path.exists(archive):
+                _copy_atomic(archive, cached)
+        else:
+            how = "built into glibc"
+
+        if key and os.path.exists(archive):
+            with open(stamp, "w") as f:
+                f.write(f"{key}\n")
+        logging.info(f"Locales {', '.join(entries) or 'C.UTF-8'} {how} in {time.monotonic() - start:.2f}s")
+        return how
     
     @staticmethod
-    def setup_user_locale(username, locale_conf):
+    def setup_user_locale(username, locale_conf, root="/mnt", chroot=None):
         """Create locale configuration for user"""
         if not username:
             return
@@ -89,11 +227,31 @@ LC_NUMERIC={locale_conf['number_format']}
 LC_MONETARY={locale_conf['currency_format']}
 """
 
-        import os
-        temp_path = f"/mnt/home/{username}/.config"
+        temp_path = f"{root}/home/{username}/.config"
         os.makedirs(temp_path, exist_ok=True)
         with open(f"{temp_path}/locale.conf", "w") as f:
             f.write(locale_content)
 
         # Ensure user owns the file
-        run(f"arch-chroot /mnt chown -R {username}:{username} /home/{username}/.config")
+        with ChrootSession.reuse(chroot, root) as session:
+            session.run(f"chown -R {username}:{username} /home/{username}/.config")
+
+def _read_stamp(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _copy_atomic(source, target):
+    """Copy so readers, or a parallel install, never see a partial archive"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".locale-archive.")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,6 +1,6 @@
 """Microcode detection and installation"""
 
-from arch_installer.utils import run
+from arch_installer.hardware import HardwareProfile
 
 class MicrocodeManager:
     """Manage CPU microcode installation"""
@@ -8,28 +8,20 @@ class MicrocodeManager:
     @staticmethod
     def detect_cpu_type():
         """Detect CPU type (Intel/AMD)"""
-        try:
-            with open("/proc/cpuinfo", "r") as f:
-                cpuinfo = f.read()
-            
-            if "GenuineIntel" in cpuinfo:
-                return "intel"
-            elif "AuthenticAMD" in cpuinfo:
-                return "amd"
-        except Exception as e:
-            print(f"Could not determine CPU type: {e}")
-        
-        return None
+        return HardwareProfile.detect().microcode
+
+    @staticmethod
+    def package(cpu_type):
+        """Microcode package for the CPU type, None if there is none"""
+        if cpu_type not in ("intel", "amd"):
+            return None
+        return f"{cpu_type}-ucode"
     
-    def add_microcode(self):
-        """Add appropriate microcode package"""
-        cpu_type = self.detect_cpu_type()
-        
-        if cpu_type == "intel":
-            run("pacstrap /mnt intel-ucode")
-            return "intel-ucode.img"
-        elif cpu_type == "amd":
-            run("pacstrap /mnt amd-ucode")
-            return "amd-ucode.img"
+    def add_microcode(self, cpu_type=None):
+        """Image of the microcode package, which comes with the base packages"""
+        if cpu_type is None:
+            cpu_type = self.detect_cpu_type()
         
-        return None
+        if self.package(cpu_type) is None:
+            return None
+        return f"{cpu_type}-ucode.img"
@@ -0,0 +1,177 @@
+"""Concurrent mirror ranking"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import ssl
+import time
+import urllib.parse
+import urllib.request
+
+# Small file every mirror carries; the core database is a few hundred KiB
+PROBE_FILE = "core.db"
+PROBE_REPO = "core"
+PROBE_ARCH = "x86_64"
+
+SERVER_RE = re.compile(r"^\s*#?\s*Server\s*=\s*(\S+)", re.M)
+
+def load_candidates(path="/etc/pacman.d/mirrorlist"):
+    """Read Server lines from a mirrorlist, including commented ones"""
+    try:
+        with open(path, "r") as f:
+            return SERVER_RE.findall(f.read())
+    except OSError:
+        return []
+
+def fetch_candidates(countries, protocol="https"):
+    """Download the official mirrorlist for the given country codes"""
+    query = urllib.parse.urlencode([("country", c) for c in countries] + [("protocol", protocol)])
+    url = f"https://archlinux.org/mirrorlist/?{query}"
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return SERVER_RE.findall(response.read().decode())
+
+class MirrorRanker:
+    """Rank mirrors by probing them concurrently
+
+    Every candidate gets a time-to-first-byte probe; the fastest ``top``
+    then download the probe file to measure throughput. Results are cached
+    on disk for ``ttl`` seconds, keyed by the candidate set.
+    """
+
+    # Transfer size the score estimates, roughly a mid-sized package
+    SCORE_BYTES = 4 << 20
+
+    def __init__(self, candidates, cache_path="/var/cache/arch-installer/mirrors.json",
+                 ttl=6 * 3600, concurrency=32, timeout=5.0, top=16):
+        # Keep the first occurrence of every mirror
+        self.candidates = list(dict.fromkeys(candidates))
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.top = top
+
+    def cache_key(self):
+        return hashlib.sha256("\n".join(sorted(self.candidates)).encode()).hexdigest()
+
+    def _load_cache(self):
+        """Return cached results if they are fresh and for the same candidates"""
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cache.get("key") != self.cache_key() or time.time() - cache.get("time", 0) > self.ttl:
+            return None
+        return cache["results"]
+
+    def _save_cache(self, results):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump({"key": self.cache_key(), "time": time.time(), "results": results}, f)
+
+    def rank(self):
+        """Return probe results sorted best first, using the cache when fresh"""
+        results = self._load_cache()
+        if results is not None:
+            logging.info(f"Using cached mirror ranking from {self.cache_path}")
+            return results
+
+        start = time.monotonic()
+        results = asyncio.run(self._rank())
+        logging.info(f"Probed {len(self.candidates)} mirrors in {time.monotonic() - start:.1f}s")
+        if results:
+            self._save_cache(results)
+        return results
+
+    async def _rank(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(server, full):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self.probe(server, full), self.timeout)
+                except (OSError, asyncio.TimeoutError, ValueError) as e:
+                    logging.info(f"Mirror {server} failed: {e}")
+                    return None
+
+        # Phase 1: latency only, for every candidate
+        latency = await asyncio.gather(*(probe(s, False) for s in self.candidates))
+        alive = sorted((r for r in latency if r), key=lambda r: r["ttfb"])
+
+        # Phase 2: throughput for the lowest-latency mirrors
+        measured = await asyncio.gather(*(probe(r["server"], True) for r in alive[:self.top]))
+        results = [r for r in measured if r]
+        for result in results:
+            result["score"] = result["ttfb"] + self.SCORE_BYTES / max(result["throughput"], 1)
+        return sorted(results, key=lambda r: r["score"])
+
+    @staticmethod
+    def probe_url(server):
+        """Expand a Server line into the probe file URL"""
+        base = server.replace("$repo", PROBE_REPO).replace("$arch", PROBE_ARCH)
+        return f"{base.rstrip('/')}/{PROBE_FILE}"
+
+    async def probe(self, server, full=True):
+        """Measure time to first byte and, if full, throughput of one mirror"""
+        url = urllib.parse.urlsplit(self.probe_url(server))
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported scheme {url.scheme}")
+        secure = url.scheme == "https"
+        port = url.port or (443 if secure else 80)
+
+        start = time.monotonic()
+        reader, writer = await asyncio.open_connection(
+            url.hostname, port, ssl=ssl.create_default_context() if secure else None)
+        try:
+            path = url.path + (f"?{url.query}" if url.query else "")
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {url.hostname}\r\n"
+                         f"User-Agent: arch-installer\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+
+            status = await reader.readline()
+            ttfb = time.monotonic() - start
+            parts = status.split()
+            if len(parts) < 2 or parts[1] != b"200":
+                raise ValueError(f"HTTP status {status.decode(errors='replace').strip()}")
+
+            result = {"server": server, "ttfb": ttfb, "throughput": 0.0, "bytes": 0}
+            if not full:
+                return result
+
+            # Skip headers, then time the body
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body_start = time.monotonic()
+            size = 0
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+            elapsed = max(time.monotonic() - body_start, 1e-6)
+            result.update(throughput=size / elapsed, bytes=size)
+            return result
+        finally:
+            writer.close()
+
+    def write_mirrorlist(self, path="/etc/pacman.d/mirrorlist", count=10):
+        """Rank mirrors and write the best ones as a pacman mirrorlist"""
+        results = self.rank()
+        if not results:
+            raise Exception("No mirror responded, keeping the existing mirrorlist")
+
+        lines = ["# Generated by arch-installer mirror ranking"]
+        for result in results[:count]:
+            lines.append(f"# ttfb {result['ttfb'] * 1000:.0f} ms, "
+                         f"{result['throughput'] / 1048576:.1f} MiB/s")
+            lines.append(f"Server = {result['server']}")
+
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+        return results[:count]
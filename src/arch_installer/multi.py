@@ -0,0 +1,109 @@
+"""Parallel installs onto several disks from one host"""
+
+import logging
+import os
+import threading
+from arch_installer.installer import Installer
+from arch_installer.prefetch import Prefetcher
+from arch_installer.ui.headless import HeadlessUI
+
+class ThreadPrefixFilter(logging.Filter):
+    """Pass records logged by one install's threads"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.prefix = name
+
+    def filter(self, record):
+        return record.threadName == self.prefix or record.threadName.startswith(self.prefix + "-")
+
+class MultiInstaller:
+    """Install one configuration onto several disks concurrently
+
+    Every disk gets its own mount point under ``mount_base``, its own log
+    file and events tagged with its name, while mirror ranking, downloads
+    and the package cache are shared.
+    """
+
+    def __init__(self, config, disks, stream=None, mount_base="/mnt/arch-installer",
+                 log_dir="/tmp"):
+        self.config = config
+        self.disks = disks
+        self.stream = stream
+        self.mount_base = mount_base
+        self.log_dir = log_dir
+        self.installers = []
+        self.errors = {}
+
+    @staticmethod
+    def target_name(disk):
+        """Short label of a disk, e.g. sdb for /dev/sdb"""
+        return os.path.basename(disk.rstrip("/"))
+
+    def run(self):
+        """Install onto all disks; returns a dict of disk name to error or None"""
+        for disk in self.disks:
+            name = self.target_name(disk)
+            ui = HeadlessUI(self.stream, target=name)
+            trace_file = os.path.join(self.log_dir, f"arch-install-{name}-trace.json")
+            self.installers.append(Installer(ui=ui, config=dict(self.config, disk=disk, trace_file=trace_file),
+                                             target=os.path.join(self.mount_base, name), name=name,
+                                             parallel=True))
+
+        # Validate every target before any disk is touched
+        for installer in self.installers:
+            try:
+                installer.prepare()
+            except Exception as e:
+                installer.ui.show_error(f"Installation failed: {e}")
+                raise
+
+        cache = self._start_shared_downloads()
+        threads = [threading.Thread(target=self._install, args=(installer,), name=installer.name)
+                   for installer in self.installers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if cache is not None:
+            cache.evict()
+            cache.save()
+        return {installer.name: self.errors.get(installer.name) for installer in self.installers}
+
+    def _start_shared_downloads(self):
+        """Rank mirrors and download once for all targets; None when they deploy an image"""
+        first = self.installers[0]
+        if first.deploys_image():
+            return None
+        pkgs = first.package_list()
+        cache = first.create_package_cache()
+        cache.defer_eviction = True
+
+        cached_files = cache.prepare(pkgs)
+        prefetcher = None
+        if not cached_files:
+            prefetcher = Prefetcher(first.package_manager, pkgs, cachedir=cache.pkgdir, cache=cache)
+            prefetcher.start()
+
+        for installer in self.installers:
+            installer.package_cache = cache
+            installer.cached_files = cached_files
+            installer.prefetcher = prefetcher
+        return cache
+
+    def _install(self, installer):
+        """Run one install with its own log file"""
+        handler = logging.FileHandler(os.path.join(self.log_dir, f"arch-install-{installer.name}.log"))
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        handler.addFilter(ThreadPrefixFilter(installer.name))
+        logging.getLogger().addHandler(handler)
+        try:
+            installer.install()
+        except BaseException as e:
+            logging.error(f"Installation failed: {e}")
+            installer.ui.show_error(f"Installation failed: {e}")
+            self.errors[installer.name] = e
+        finally:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
@@ -1,17 +1,46 @@
 """Package management"""
 
-import subprocess
-import curses
-from arch_installer.utils import run
+import logging
+import os
+import re
+import shutil
+from arch_installer.utils import run_lines
+from arch_installer.ui.progress import PacmanProgress
+from arch_installer.mirrors import MirrorRanker, load_candidates, fetch_candidates
+
+# pacman prints "(3/25) installing foo" for every package of a transaction
+# when its output is not a terminal
+PACMAN_ACTION_RE = re.compile(r"^\(\s*(\d+)/(\d+)\) (?:installing|reinstalling|upgrading) (\S+)")
 
 class PackageManager:
     """Manage package installation"""
-    
+
+    # Packages per pacstrap run when a single transaction fails
+    CHUNK_SIZE = 8
+
+    def __init__(self, root="/mnt"):
+        self.root = root
+        # Extra package caches pacstrap reads before downloading
+        self.cachedirs = []
+        # Extra pacman options, e.g. the hook directory of the target
+        self.options = []
+
     @staticmethod
-    def optimize_mirrorlist():
-        """Optimize pacman mirrorlist"""
-        run("pacman -S --noconfirm reflector")
-        run("reflector --country Vietnam --age 12 --protocol https --sort rate --save /etc/pacman.d/mirrorlist")
+    def optimize_mirrorlist(countries=None, mirrorlist="/etc/pacman.d/mirrorlist"):
+        """Rank mirrors concurrently and keep the fastest in the mirrorlist"""
+        # Rank against the original list, not the previous run's top ten
+        original = mirrorlist + ".orig"
+        if not os.path.exists(original):
+            shutil.copyfile(mirrorlist, original)
+
+        candidates = load_candidates(original)
+        if countries:
+            try:
+                candidates = fetch_candidates(countries) + candidates
+            except OSError as e:
+                logging.warning(f"Could not fetch mirrors for {countries}: {e}")
+
+        MirrorRanker(candidates).write_mirrorlist(mirrorlist)
     
     @staticmethod
     def get_package_list(kernel, gpu, wmde):
@@ -42,115 +71,81 @@ class PackageManager:
 
         return pkgs
     
-    def install_base_packages(self, ui, kernel, gpu, wmde):
-        """Install base packages with progress display - fixed version"""
+    def install_base_packages(self, ui, kernel, gpu, wmde, batch=True):
+        """Install base packages with progress display"""
         pkgs = self.get_package_list(kernel, gpu, wmde)
-        
-        # Initialize UI for package installation
-        stdscr = ui.stdscr  # Get the curses window
-        
-        curses.start_color()
-        curses.init_pair(1, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-        curses.init_pair(2, curses.COLOR_GREEN, curses.COLOR_BLACK)
-        curses.init_pair(3, curses.COLOR_RED, curses.COLOR_BLACK)
-
-        stdscr.clear()
-        stdscr.addstr("[STEP] Installing base packages...\n", curses.A_BOLD)
-        stdscr.refresh()
-
-        h, w = stdscr.getmaxyx()
-        left_col_w = 30
-        right_col_w = w - left_col_w - 2
-
-        # Draw separator column
-        for i in range(h-1):
-            try:
-                stdscr.addstr(i, left_col_w + 2, "│")
-            except curses.error:
-                pass
-        
-        try:
-            stdscr.addstr(h-1, 0, "─" * (w-1))
-        except curses.error:
-            pass
-
-        # Show package names in left column
-        for i, pkg in enumerate(pkgs):
-            if i + 2 < h-1:
-                try:
-                    stdscr.addstr(i+2, 2, pkg[:left_col_w-2])
-                except curses.error:
-                    pass
-        stdscr.refresh()
-
-        # Install each package
-        for i, pkg in enumerate(pkgs):
-            if i + 2 >= h-1:
-                break
-
-            cmd = f"pacstrap -K /mnt {pkg}"
-            
-            # Clear status area and show starting message
-            try:
-                stdscr.addstr(i+2, left_col_w+4, " " * (right_col_w-4))
-                stdscr.addstr(i+2, left_col_w+4, "Starting...", curses.color_pair(1))
-                stdscr.refresh()
-            except curses.error:
-                pass
-
-            process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, 
-                                     stderr=subprocess.STDOUT, text=True, bufsize=1)
-
-            # Simulate progress bar
-            progress_width = 20
-            lines_seen = 0
-            
-            # Read output in real-time and update progress
-            for line in process.stdout:
-                line = line.strip()
-                lines_seen += 1
-                done = min(progress_width, lines_seen)
-                bar = "█" * done + " " * (progress_width - done)
-                percent = int(done / progress_width * 100)
-                
-                try:
-                    stdscr.addstr(i+2, left_col_w+4, " " * (right_col_w-4))
-                    stdscr.addstr(i+2, left_col_w+4, f"[{bar}] {percent}%".ljust(right_col_w-4), curses.color_pair(1))
-                    stdscr.refresh()
-                except curses.error:
-                    pass
-
-            # Process has finished at this point, no need for wait()
-            # Get the return code
-            returncode = process.poll()
-            if returncode is None:
-                # Process is still running (shouldn't happen with our loop)
-                process.wait()
-                returncode = process.returncode
-
-            # Show final status
-            if returncode == 0:
-                final_status = "✓ Installed successfully"
-                color = curses.color_pair(2)
-            else:
-                final_status = "✗ Installation failed"
-                color = curses.color_pair(3)
-            
-            try:
-                stdscr.addstr(i+2, left_col_w+4, " " * (right_col_w-4))
-                stdscr.addstr(i+2, left_col_w+4, final_status[:right_col_w-4], color)
-                stdscr.refresh()
-            except curses.error:
-                pass
-            
-            # If installation failed, raise exception
-            if returncode != 0:
-                raise Exception(f"Failed to install package: {pkg}")
-
-        # Show completion message
-        try:
-            msg = "Installation completed."
-            stdscr.addstr(h-1, 2, msg[:w-3])
-            stdscr.refresh()
-        except curses.error:
-            pass
+        self.install_packages(ui, pkgs, batch=batch)
+
+    def install_packages(self, ui, pkgs, batch=True):
+        """Install packages into the target root, in one transaction when batch is set"""
+        ui.show_package_installation(pkgs)
+
+        if batch:
+            self._install_batched(ui, pkgs)
+        else:
+            for pkg in pkgs:
+                if not self._install_each(ui, pkg):
+                    raise Exception(f"Failed to install package: {pkg}")
+
+        ui.show_package_message("Installation completed.")
+
+    def install_files(self, ui, pkgs, files):
+        """Install an already downloaded package closure without the network"""
+        ui.show_package_installation(pkgs)
+        if not self._pacstrap(ui, pkgs, files=files):
+            raise Exception("Failed to install packages from the package cache")
+        ui.show_package_message("Installation completed.")
+
+    def _install_batched(self, ui, pkgs):
+        """Install all packages in one transaction, falling back to chunks"""
+        if self._pacstrap(ui, pkgs):
+            return
+
+        # Narrow down the failing package: chunks first, then one by one
+        for start in range(0, len(pkgs), self.CHUNK_SIZE):
+            chunk = pkgs[start:start + self.CHUNK_SIZE]
+            if self._pacstrap(ui, chunk):
+                continue
+            for pkg in chunk:
+                if not self._install_each(ui, pkg):
+                    raise Exception(f"Failed to install package: {pkg}")
+
+    def _install_each(self, ui, pkg):
+        """Install a single package, showing its transaction's progress bar"""
+        return self._pacstrap(ui, [pkg], per_package=True)
+
+    def _pacstrap(self, ui, pkgs, per_package=False, files=None):
+        """Run one pacstrap transaction and map its output to status rows"""
+        for pkg in pkgs:
+            ui.update_package_status(pkg, "running")
+
+        if files:
+            cmd = ["pacstrap", "-K", "-U", self.root] + self.options + list(files)
+        else:
+            cachedirs = [arg for path in self.cachedirs for arg in ("--cachedir", path)]
+            cmd = ["pacstrap", "-K", self.root] + self.options + cachedirs + list(pkgs)
+        pending = set(pkgs)
+        progress = PacmanProgress()
+
+        def on_line(line):
+            if progress.feed(line):
+                ui.show_transaction_progress(progress)
+            match = PACMAN_ACTION_RE.match(line.strip())
+            if not match:
+                return
+            current, total, name = match.groups()
+            if per_package:
+                # Dependencies come along, so the transaction counter is the real progress
+                ui.update_package_progress(pkgs[0], int(current), int(total))
+            elif name in pending:
+                pending.discard(name)
+                ui.update_package_status(name, f"installing ({current}/{total})")
+
+        returncode = run_lines(cmd, on_line)
+        # Groups (gnome, plasma) and already satisfied packages never show
+        # up as "installing" lines, so they inherit the transaction result
+        for pkg in pkgs:
+            ui.update_package_status(pkg, "done" if returncode == 0 else "failed")
+        progress.finish()
+        ui.show_transaction_progress(progress)
+        return returncode == 0
@@ -0,0 +1,224 @@
+"""Persistent host-side package cache"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+PACKAGE_SUFFIXES = (".pkg.tar.zst", ".pkg.tar.xz", ".pkg.tar.gz", ".pkg.tar")
+
+def parse_package_filename(filename):
+    """Split name-pkgver-pkgrel-arch.pkg.tar.zst into (name, version)"""
+    stem = filename
+    for suffix in PACKAGE_SUFFIXES:
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+            break
+    else:
+        return None
+
+    parts = stem.rsplit("-", 3)
+    if len(parts) != 4:
+        return None
+    name, pkgver, pkgrel, _arch = parts
+    return name, f"{pkgver}-{pkgrel}"
+
+def sha256sum(path):
+    """Hash a file in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class PackageCache:
+    """Content-addressed package cache shared by every install on this host
+
+    pacstrap reads from and downloads into ``pkgdir``. The index maps each
+    file's sha256 to its name, version and last use, and remembers the full
+    package closure installed for every requested package set so a repeat
+    install of the same set can skip the network entirely.
+    """
+
+    def __init__(self, path="/var/cache/arch-installer", max_bytes=20 << 30):
+        self.path = path
+        self.pkgdir = os.path.join(path, "pkg")
+        self.index_path = os.path.join(path, "index.json")
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.profiles = {}
+        self.known = set()
+        # Several installs may finish against the same cache at once; their
+        # owner then defers eviction so no file is removed while still in use
+        self._lock = threading.RLock()
+        self.defer_eviction = False
+        self.load()
+
+    def load(self):
+        """Read the index, starting empty when there is none"""
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.entries = index.get("entries", {})
+            self.profiles = index.get("profiles", {})
+        except (OSError, ValueError):
+            self.entries = {}
+            self.profiles = {}
+
+    def save(self):
+        """Write the index atomically"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"entries": self.entries, "profiles": self.profiles}, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    @staticmethod
+    def profile_key(pkgs):
+        """Key a requested package set independent of its order"""
+        return hashlib.sha256(" ".join(sorted(set(pkgs))).encode()).hexdigest()
+
+    def _by_filename(self):
+        return {entry["filename"]: digest for digest, entry in self.entries.items()}
+
+    def _add(self, filename):
+        """Hash a file in pkgdir and index it"""
+        parsed = parse_package_filename(filename)
+        if not parsed:
+            return None
+        path = os.path.join(self.pkgdir, filename)
+        digest = sha256sum(path)
+        self.entries[digest] = {
+            "name": parsed[0],
+            "version": parsed[1],
+            "filename": filename,
+            "size": os.path.getsize(path),
+            "last_used": time.time(),
+        }
+        return digest
+
+    def _remove(self, digest):
+        entry = self.entries.pop(digest)
+        try:
+            os.remove(os.path.join(self.pkgdir, entry["filename"]))
+        except OSError:
+            pass
+
+    def verify(self, digests):
+        """Drop entries whose file is missing or no longer matches its hash"""
+        for digest in list(digests):
+            entry = self.entries.get(digest)
+            if entry is None:
+                continue
+            path = os.path.join(self.pkgdir, entry["filename"])
+            if not os.path.exists(path) or sha256sum(path) != digest:
+                logging.warning(f"Package cache: dropping corrupt {entry['filename']}")
+                self._remove(digest)
+
+    def verify_files(self, filenames):
+        """verify() the indexed files among filenames, e.g. the closure pacman is about to reuse"""
+        with self._lock:
+            indexed = self._by_filename()
+            self.verify(indexed[filename] for filename in filenames if filename in indexed)
+            self.save()
+
+    def prepare(self, pkgs):
+        """Check the cache before an install
+
+        Returns the file paths of the complete closure when this package set
+        was installed from the cache before, otherwise None.
+        """
+        with self._lock:
+            return self._prepare(pkgs)
+
+    def _prepare(self, pkgs):
+        os.makedirs(self.pkgdir, exist_ok=True)
+
+        # Leftovers from an interrupted download are never trusted
+        for path in glob.glob(os.path.join(self.pkgdir, "*.part")):
+            os.remove(path)
+
+        # Hashing the whole cache would hold up the downloads; a new package
+        # set has its closure verified by the prefetcher instead
+        profile = self.profiles.get(self.profile_key(pkgs))
+        if profile:
+            self.verify(profile)
+
+        # Files pacman wrote during a run that never reached finish()
+        indexed = self._by_filename()
+        for filename in os.listdir(self.pkgdir):
+            if filename not in indexed and parse_package_filename(filename):
+                self._add(filename)
+
+        self.known = set(self.entries)
+        self.save()
+
+        if profile and all(digest in self.entries for digest in profile):
+            return [os.path.join(self.pkgdir, self.entries[d]["filename"]) for d in profile]
+        return None
+
+    def finish(self, root, pkgs):
+        """Index new downloads, record hits and misses, and evict old files"""
+        with self._lock:
+            return self._finish(root, pkgs)
+
+    def _finish(self, root, pkgs):
+        installed = set()
+        for desc in glob.glob(os.path.join(root, "var/lib/pacman/local/*/desc")):
+            installed.add(os.path.basename(os.path.dirname(desc)))
+
+        indexed = self._by_filename()
+        hits, misses, used = [], [], []
+        for filename in sorted(os.listdir(self.pkgdir)):
+            parsed = parse_package_filename(filename)
+            if not parsed or f"{parsed[0]}-{parsed[1]}" not in installed:
+                continue
+
+            digest = indexed.get(filename)
+            if digest in self.known:
+                hits.append(digest)
+            else:
+                digest = self._add(filename)
+                misses.append(digest)
+            self.entries[digest]["last_used"] = time.time()
+            used.append(digest)
+
+        self.profiles[self.profile_key(pkgs)] = used
+        if not self.defer_eviction:
+            self.evict(keep=used)
+        self.save()
+
+        report = {
+            "hits": len(hits),
+            "misses": len(misses),
+            "hit_bytes": sum(self.entries[d]["size"] for d in hits if d in self.entries),
+            "miss_bytes": sum(self.entries[d]["size"] for d in misses if d in self.entries),
+        }
+        logging.info(f"Package cache: {report['hits']} hits ({report['hit_bytes']} bytes), "
+                     f"{report['misses']} misses ({report['miss_bytes']} bytes)")
+        return report
+
+    def size(self):
+        """Total bytes of all cached files"""
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def evict(self, keep=()):
+        """Remove least recently used files until the cache fits max_bytes"""
+        keep = set(keep)
+        total = self.size()
+        by_age = sorted(self.entries.items(), key=lambda item: item[1]["last_used"])
+        for digest, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if digest in keep:
+                continue
+            total -= entry["size"]
+            self._remove(digest)
+
+        # Profiles pointing at evicted files can no longer skip the network
+        for key, digests in list(self.profiles.items()):
+            if not all(digest in self.entries for digest in digests):
+                del self.profiles[key]
@@ -0,0 +1,80 @@
+"""Background package prefetching"""
+
+import logging
+import os
+import re
+import threading
+import time
+from arch_installer.utils import run
+
+class Prefetcher:
+    """Download the package set into a staging cache while the disk is prepared"""
+
+    def __init__(self, package_manager, pkgs, cachedir="/tmp/arch-installer/pkg",
+                 parallel_downloads=8, name="prefetch", cache=None):
+        self.package_manager = package_manager
+        self.pkgs = pkgs
+        self.cachedir = cachedir
+        # PackageCache owning cachedir, whose files pacman will reuse
+        self.cache = cache
+        self.parallel_downloads = parallel_downloads
+        self.duration = 0.0
+        self.error = None
+        self._thread = threading.Thread(target=self._prefetch, name=name, daemon=True)
+
+    def start(self):
+        """Start mirror ranking and downloads in the background"""
+        self._thread.start()
+
+    def wait(self):
+        """Wait for the downloads and return the seconds spent waiting"""
+        start = time.monotonic()
+        self._thread.join()
+        waited = time.monotonic() - start
+
+        if self.error:
+            raise Exception(f"Package prefetch failed: {self.error}")
+        return waited
+
+    def _prefetch(self):
+        """Rank mirrors, then download the full dependency closure"""
+        start = time.monotonic()
+        try:
+            self.package_manager.optimize_mirrorlist()
+            self.download()
+        except Exception as e:
+            logging.error(f"Prefetch failed: {e}")
+            self.error = e
+        self.duration = time.monotonic() - start
+
+    def download(self):
+        """Fetch the packages with an empty database so all dependencies are included"""
+        dbpath = os.path.join(os.path.dirname(self.cachedir), "db")
+        os.makedirs(self.cachedir, exist_ok=True)
+        os.makedirs(dbpath, exist_ok=True)
+
+        config = self.write_pacman_conf(os.path.join(os.path.dirname(self.cachedir), "pacman.conf"))
+        options = f"--noconfirm --config {config} --dbpath {dbpath} --cachedir {self.cachedir} "
+        if self.cache is None:
+            run(f"pacman -Syw {options}" + " ".join(self.pkgs))
+            return
+
+        # Verify only the cached files of the closure pacman resolves, not the whole cache
+        run(f"pacman -Sy {options}")
+        output = run(f"pacman -Sp --print-format %f {options}" + " ".join(self.pkgs), silent=False) or ""
+        self.cache.verify_files(output.split())
+        run(f"pacman -Sw {options}" + " ".join(self.pkgs))
+
+    def write_pacman_conf(self, path, source="/etc/pacman.conf"):
+        """Copy the host pacman.conf with ParallelDownloads enabled"""
+        with open(source, "r") as f:
+            content = f.read()
+
+        setting = f"ParallelDownloads = {self.parallel_downloads}"
+        content, count = re.subn(r"^#?\s*ParallelDownloads\s*=.*$", setting, content, flags=re.M)
+        if not count:
+            content = content.replace("[options]", f"[options]\n{setting}", 1)
+
+        with open(path, "w") as f:
+            f.write(content)
+        return path
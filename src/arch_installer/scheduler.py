@@ -0,0 +1,242 @@
+"""Dependency-graph step scheduler"""
+
+import logging
+import time
+from arch_installer.tracing import tracer
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+class Step:
+    """An installation step with named inputs and outputs"""
+
+    def __init__(self, name, func, inputs=(), outputs=(), resources=(), title=None,
+                 verify=None, resumable=True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        # Steps sharing a resource (e.g. the chroot) never run at the same time
+        self.resources = tuple(resources)
+        self.title = title or name
+        # Cheap check, given the inputs, that a journaled step's work is still there
+        self.verify = verify
+        # Steps that must run again on every resume, e.g. because their inputs are secret
+        self.resumable = resumable
+        self.start = None
+        self.end = None
+        self.skipped = False
+
+    @property
+    def duration(self):
+        """Wall time of the step in seconds, 0 if it did not run"""
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+class StepScheduler:
+    """Run steps concurrently as soon as their inputs are available
+
+    Step functions receive a dict with their inputs and return None, the
+    value of their only output, or a dict with all of their outputs.
+    """
+
+    # Seconds between poll calls while steps run
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, max_workers=4, on_start=None, name="step", journal=None, poll=None):
+        self.max_workers = max_workers
+        self.on_start = on_start
+        # Called from the waiting thread while steps run, e.g. to watch for a cancel key
+        self.poll = poll
+        # Steps finished by an earlier, interrupted run are skipped
+        self.journal = journal
+        # Worker threads are named after this, so logs can be told apart
+        self.name = name
+        self.steps = []
+        self.initial = set()
+        self.values = {}
+
+    def add(self, name, func, inputs=(), outputs=(), resources=(), title=None,
+            verify=None, resumable=True):
+        """Declare a step, returning it"""
+        if any(step.name == name for step in self.steps):
+            raise ValueError(f"Duplicate step: {name}")
+        step = Step(name, func, inputs, outputs, resources, title, verify, resumable)
+        self.steps.append(step)
+        return step
+
+    def producers(self):
+        """Map every output name to the step producing it"""
+        producers = {}
+        for step in self.steps:
+            for output in step.outputs:
+                if output in producers:
+                    raise ValueError(f"Output {output} produced by {producers[output].name} and {step.name}")
+                producers[output] = step
+        return producers
+
+    def order(self):
+        """Return the steps in dependency order, rejecting missing inputs and cycles"""
+        producers = self.producers()
+        available = set(self.initial)
+        remaining = list(self.steps)
+        order = []
+
+        for step in self.steps:
+            for name in step.inputs:
+                if name not in producers and name not in available:
+                    raise ValueError(f"Step {step.name} needs {name}, which no step produces")
+
+        # Dry run; anything left over is part of a cycle
+        while remaining:
+            ready = [s for s in remaining if all(i in available for i in s.inputs)]
+            if not ready:
+                raise ValueError("Dependency cycle between steps: " +
+                                 ", ".join(s.name for s in remaining))
+            for step in ready:
+                available.update(step.outputs)
+                remaining.remove(step)
+                order.append(step)
+        return order
+
+    def run(self, values=None):
+        """Run all steps and return the produced values
+
+        Once a step fails no new steps are started, running ones are allowed
+        to finish, and the error of the failed step declared first is raised.
+        With a journal, steps it records as finished with the same inputs are
+        skipped unless a step they depend on had to run again.
+        """
+        self.values = dict(values or {})
+        self.initial = set(self.values)
+        self.order()
+        producers = self.producers()
+
+        pending = list(self.steps)
+        running = {}
+        failures = {}
+        executed = set()
+        started_inputs = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as pool:
+            while pending or running:
+                resumed = not failures
+                while resumed:
+                    resumed = False
+                    for step in self._ready(pending, running.values()):
+                        pending.remove(step)
+                        inputs = {name: self.values[name] for name in step.inputs}
+                        upstream = {producers[name] for name in step.inputs if name in producers}
+                        if not upstream & executed and self._resume(step, inputs):
+                            resumed = True
+                            continue
+                        if self.on_start:
+                            self.on_start(step)
+                        step.start = time.monotonic()
+                        started_inputs[step] = inputs
+                        running[pool.submit(self._call, step, inputs)] = step
+
+                if not running:
+                    break
+
+                done, _ = wait(running, timeout=self.POLL_INTERVAL if self.poll else None,
+                               return_when=FIRST_COMPLETED)
+                if self.poll:
+                    self.poll()
+                for future in done:
+                    step = running.pop(future)
+                    step.end = time.monotonic()
+                    executed.add(step)
+                    try:
+                        self._store(step, future.result())
+                        logging.info(f"Step {step.name} finished in {step.duration:.1f}s")
+                        if self.journal is not None and step.resumable:
+                            self.journal.record(step.name, started_inputs[step],
+                                                {name: self.values[name] for name in step.outputs})
+                    except BaseException as e:
+                        logging.error(f"Step {step.name} failed: {e}")
+                        failures[step] = e
+
+        if failures:
+            first = min(failures, key=self.steps.index)
+            raise failures[first]
+        return self.values
+
+    def _resume(self, step, inputs):
+        """Take a step's outputs from the journal if it already finished; True if skipped"""
+        if self.journal is None or not step.resumable:
+            return False
+        outputs = self.journal.completed(step.name, inputs)
+        if outputs is None:
+            return False
+        if step.verify and not step.verify(inputs):
+            logging.info(f"Step {step.name} is journaled but its result is gone, running it again")
+            return False
+        self._store(step, outputs)
+        step.skipped = True
+        logging.info(f"Step {step.name} already done, skipping")
+        return True
+
+    @staticmethod
+    def _call(step, inputs):
+        """Run a step function on a worker thread"""
+        with tracer.span(step.name, "step"):
+            return step.func(inputs)
+
+    def _ready(self, pending, running):
+        """Pending steps that can start now, in declaration order"""
+        running = list(running)
+        busy = {r for step in running for r in step.resources}
+        ready = []
+        for step in pending:
+            if len(running) + len(ready) >= self.max_workers:
+                break
+            if not all(name in self.values for name in step.inputs):
+                continue
+            if busy.intersection(step.resources):
+                continue
+            busy.update(step.resources)
+            ready.append(step)
+        return ready
+
+    def _store(self, step, result):
+        """Record the outputs returned by a step"""
+        if not step.outputs:
+            return
+        if len(step.outputs) == 1 and not isinstance(result, dict):
+            result = {step.outputs[0]: result}
+        missing = [name for name in step.outputs if name not in result]
+        if missing:
+            raise ValueError(f"Step {step.name} did not produce {', '.join(missing)}")
+        for name in step.outputs:
+            self.values[name] = result[name]
+
+    def critical_path(self):
+        """Return the chain of dependent steps with the longest total duration"""
+        producers = self.producers()
+        finish = {}
+        previous = {}
+
+        for step in self.order():
+            deps = [producers[name] for name in step.inputs if name in producers]
+            best = max(deps, key=lambda dep: finish[dep], default=None)
+            finish[step] = step.duration + (finish[best] if best else 0.0)
+            previous[step] = best
+
+        if not finish:
+            return []
+        step = max(finish, key=finish.get)
+        path = []
+        while step:
+            path.append(step)
+            step = previous[step]
+        return list(reversed(path))
+
+    def report(self):
+        """Describe the critical path for the log"""
+        path = self.critical_path()
+        total = sum(step.duration for step in path)
+        chain = " -> ".join(f"{step.name} ({step.duration:.1f}s)" for step in path)
+        return f"Critical path {total:.1f}s: {chain}"
@@ -1,17 +1,114 @@
 """Swap file management"""
 
+import ctypes
+import ctypes.util
+import errno
+import logging
+import math
+import os
+import time
+from arch_installer.filesystems import append_fstab
 from arch_installer.utils import run
 
+# zram-generator config; the device size is evaluated at boot from real RAM
+ZRAM_CONF = """[zram0]
+zram-size = {size}
+compression-algorithm = {algorithm}
+swap-priority = 100
+"""
+
+def memory_mb(meminfo="/proc/meminfo"):
+    """Total RAM in MiB"""
+    with open(meminfo, "r") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024
+    raise Exception(f"MemTotal missing from {meminfo}")
+
+def recommended_swap_mb(ram_mb, hibernate=False):
+    """Swap size for the given RAM, large enough to hold RAM when hibernating"""
+    if hibernate:
+        # RAM plus headroom of sqrt(RAM) GiB for the rest of the image
+        return ram_mb + int(math.sqrt(ram_mb / 1024) * 1024)
+    if ram_mb <= 2048:
+        return 2 * ram_mb
+    if ram_mb <= 8192:
+        return ram_mb
+    return max(4096, min(ram_mb // 2, 32768))
+
+def _fallocate(fd, size):
+    """Preallocate with fallocate(2); False when the filesystem cannot"""
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    fallocate = getattr(libc, "fallocate64", None) or getattr(libc, "fallocate", None)
+    if fallocate is None:
+        return False
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    if fallocate(fd, 0, 0, size) == 0:
+        return True
+
+    err = ctypes.get_errno()
+    if err in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+        return False
+    raise OSError(err, os.strerror(err))
+
+def allocate_file(path, size_mb, block_mb=4):
+    """Create a fully allocated file, returning the method used"""
+    size = size_mb << 20
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        if _fallocate(fd, size):
+            return "fallocate"
+
+        # Swap cannot use holes, so write every block
+        block = b"\0" * (block_mb << 20)
+        written = 0
+        while written < size:
+            written += os.write(fd, block[:min(len(block), size - written)])
+        os.fsync(fd)
+        return "zero-fill"
+    finally:
+        os.close(fd)
+
 class SwapManager:
     """Manage swap file creation and configuration"""
-    
+
     @staticmethod
-    def setup_swapfile(size_mb=2048):
-        """Create and configure swap file"""
-        # Create swap file
-        run(f"dd if=/dev/zero of=/mnt/swapfile bs=1M count={size_mb} status=progress")
-        run("chmod 600 /mnt/swapfile")
-        run("mkswap /mnt/swapfile")
-        
-        # Add to fstab
-        run("echo '/swapfile none swap defaults 0 0' >> /mnt/etc/fstab")
+    def setup_swapfile(size_mb=None, hibernate=False, root="/mnt", filesystem="ext4"):
+        """Create and configure swap file, sized from RAM unless size_mb is given"""
+        if size_mb is None:
+            size_mb = recommended_swap_mb(memory_mb(), hibernate)
+
+        start = time.monotonic()
+        if filesystem == "btrfs":
+            # swapon refuses copy-on-write or compressed files; mkswapfile makes
+            # a NOCOW, fully allocated one and formats it
+            run(["btrfs", "filesystem", "mkswapfile", "--size", f"{size_mb}m", f"{root}/swapfile"])
+            method = "mkswapfile"
+        else:
+            method = allocate_file(f"{root}/swapfile", size_mb)
+        elapsed = time.monotonic() - start
+        logging.info(f"Allocated {size_mb} MiB swap file with {method} in {elapsed:.2f}s")
+
+        run(["chmod", "600", f"{root}/swapfile"])
+        if method != "mkswapfile":
+            run(["mkswap", f"{root}/swapfile"])
+
+        # Safe to repeat when resuming an interrupted install
+        append_fstab(root, "/swapfile none swap defaults 0 0")
+        return {"size_mb": size_mb, "method": method, "seconds": elapsed}
+
+    @staticmethod
+    def setup_zram(size="min(ram / 2, 8192)", algorithm="zstd", root="/mnt"):
+        """Configure compressed swap in RAM via zram-generator"""
+        os.makedirs(f"{root}/etc/systemd", exist_ok=True)
+        with open(f"{root}/etc/systemd/zram-generator.conf", "w") as f:
+            f.write(ZRAM_CONF.format(size=size, algorithm=algorithm))
+
+    def setup(self, mode, hibernate=False, size_mb=None, root="/mnt", filesystem="ext4"):
+        """Set up swap for a mode of "swapfile", "zram" or "zram+swapfile" on a root filesystem"""
+        result = {}
+        if "zram" in mode:
+            self.setup_zram(root=root)
+        if "swapfile" in mode:
+            result = self.setup_swapfile(size_mb, hibernate, root=root, filesystem=filesystem)
+        return result
@@ -0,0 +1,209 @@
+"""Timing of commands and installation steps"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Counters read from /proc/<pid>/io
+IO_FIELDS = ("rchar", "wchar", "read_bytes", "write_bytes")
+
+def read_io(path):
+    """Parse a /proc io file, or return None if it cannot be read"""
+    try:
+        with open(path) as f:
+            fields = dict(line.split(": ", 1) for line in f.read().splitlines())
+    except (OSError, ValueError):
+        return None
+    return {name: int(fields.get(name, 0)) for name in IO_FIELDS}
+
+def exit_code(status):
+    """Exit code as Popen reports it, negative for a signal"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def wait(process):
+    """Reap a child, returning its exit code and resource usage
+
+    The I/O counters are read while the child is a zombie, after waitid with
+    WNOWAIT, as /proc/<pid> disappears once it is reaped. Both they and the
+    rusage from wait4 include the child's own reaped children, i.e. the
+    commands a shell ran.
+    """
+    os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    io = read_io(f"/proc/{process.pid}/io") or {}
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = exit_code(status)
+    usage = {"user": rusage.ru_utime, "sys": rusage.ru_stime, "max_rss_kb": rusage.ru_maxrss}
+    usage.update(io)
+    return process.returncode, usage
+
+class Span:
+    """One timed command or step"""
+
+    def __init__(self, name, category, start, end, thread, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = end
+        self.thread = thread
+        self.args = args
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+class Tracer:
+    """Collect spans of commands and steps for a trace file and a summary
+
+    Recording is off until start() is called, so code that runs commands
+    outside an install pays nothing. Spans carry the name of the thread they
+    ran on, which lets parallel installs pick out their own.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.origin = time.monotonic()
+        self.users = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.users > 0
+
+    def start(self):
+        with self.lock:
+            self.users += 1
+
+    def stop(self):
+        with self.lock:
+            self.users = max(0, self.users - 1)
+
+    def record(self, name, category, start, end, **args):
+        """Add a finished span; commands are attributed to the step running them"""
+        step = getattr(self.local, "step", None)
+        if step and category == "command":
+            args["step"] = step
+        span = Span(name, category, start, end, threading.current_thread().name, args)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, category="step"):
+        """Time the body, including CPU time and I/O of the calling thread itself"""
+        if not self.enabled:
+            yield
+            return
+        previous = getattr(self.local, "step", None)
+        self.local.step = name
+        io_path = f"/proc/self/task/{threading.get_native_id()}/io"
+        io_before = read_io(io_path)
+        cpu_before = time.thread_time()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.local.step = previous
+            args = {"thread_cpu": time.thread_time() - cpu_before}
+            io_after = read_io(io_path) if io_before else None
+            if io_after:
+                args.update({f"thread_{field}": io_after[field] - io_before[field] for field in IO_FIELDS})
+            self.record(name, category, start, end, **args)
+
+    def select(self, prefix=None):
+        """Spans recorded on threads named prefix or prefix-*"""
+        with self.lock:
+            spans = list(self.spans)
+        if prefix is None:
+            return spans
+        return [s for s in spans if s.thread == prefix or s.thread.startswith(prefix + "-")]
+
+    def trace_events(self, prefix=None):
+        """Chrome trace-event list, viewable in chrome://tracing or Perfetto"""
+        spans = self.select(prefix)
+        tids = {}
+        events = []
+        for span in spans:
+            tid = tids.setdefault(span.thread, len(tids) + 1)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": span.args,
+            })
+        for thread, tid in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                           "args": {"name": thread}})
+        return events
+
+    def write(self, path, prefix=None):
+        """Write the Chrome trace JSON to path"""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(prefix), "displayTimeUnit": "ms"}, f)
+
+    def step_totals(self, prefix=None):
+        """Per step: wall time, and CPU, I/O and peak RSS of the step and its commands"""
+        spans = self.select(prefix)
+        totals = {}
+        for span in spans:
+            if span.category != "step":
+                continue
+            totals[span.name] = {
+                "wall": span.duration,
+                "user": 0.0,
+                "sys": 0.0,
+                "cpu": span.args.get("thread_cpu", 0.0),
+                "read": span.args.get("thread_rchar", 0),
+                "write": span.args.get("thread_wchar", 0),
+                "max_rss_kb": 0,
+                "commands": 0,
+            }
+        for span in spans:
+            total = totals.get(span.args.get("step")) if span.category == "command" else None
+            if total is None:
+                continue
+            total["commands"] += 1
+            total["user"] += span.args.get("user", 0.0)
+            total["sys"] += span.args.get("sys", 0.0)
+            total["read"] += span.args.get("rchar", 0)
+            total["write"] += span.args.get("wchar", 0)
+            total["max_rss_kb"] = max(total["max_rss_kb"], span.args.get("max_rss_kb", 0))
+        return totals
+
+    def summary(self, prefix=None, commands=5):
+        """Table of steps by wall time and the slowest commands, for the log"""
+        lines = [f"{'step':16} {'wall':>8} {'user':>8} {'sys':>8} {'self':>7} "
+                 f"{'read':>10} {'written':>10} {'peak RSS':>10} {'cmds':>5}"]
+        totals = self.step_totals(prefix)
+        for name, t in sorted(totals.items(), key=lambda item: -item[1]["wall"]):
+            lines.append(f"{name:16} {t['wall']:7.2f}s {t['user']:7.2f}s {t['sys']:7.2f}s {t['cpu']:6.2f}s "
+                         f"{_size(t['read']):>10} {_size(t['write']):>10} "
+                         f"{_size(t['max_rss_kb'] << 10):>10} {t['commands']:>5}")
+
+        slowest = sorted((s for s in self.select(prefix) if s.category == "command"),
+                         key=lambda s: -s.duration)[:commands]
+        if slowest:
+            lines.append("Slowest commands:")
+            for span in slowest:
+                lines.append(f"  {span.duration:7.2f}s  {span.name[:100]}")
+        return "\n".join(lines)
+
+def _size(count):
+    """Human readable byte count"""
+    for unit in ("B", "KiB", "MiB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GiB"
+
+# Shared by every install in the process; see Tracer.select for telling them apart
+tracer = Tracer()
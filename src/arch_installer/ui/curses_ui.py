@@ -1,13 +1,32 @@
 """Curses-based user interface"""
 
 import curses
-from arch_installer.ui.progress import ProgressBar
+import functools
+import threading
+from arch_installer.ui.listview import ListView
+from arch_installer.ui.progress import ProgressBar, Spinner, FrameLimiter
+
+def _locked(method):
+    """Hold the screen lock for a whole draw or key read"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class CursesUI:
     """Curses-based user interface handler"""
+
+    # Curses is not thread-safe; the scheduler polls for ESC while step
+    # workers and the command engine loop draw progress
+    _lock = threading.Lock()
     
     def __init__(self, stdscr):
         self.stdscr = stdscr
+        self.package_rows = {}
+        # Terminal updates of the package screen are coalesced to this rate
+        self.frames = FrameLimiter(fps=10)
+        self.spinner = Spinner()
         self._init_colors()
         curses.curs_set(0)  # Hide cursor by default
     
@@ -20,43 +39,32 @@ class CursesUI:
         curses.init_pair(4, curses.COLOR_RED, curses.COLOR_BLACK)    # error
         curses.init_pair(5, curses.COLOR_YELLOW, curses.COLOR_BLACK) # warning
     
-    def menu(self, title, options, config, keyname):
-        """Display a menu and return selected option"""
+    @_locked
+    def menu(self, title, options, config, keyname, default=None):
+        """Display a menu and return selected option, starting on default"""
         curses.curs_set(0)
         h, w = self.stdscr.getmaxyx()
-        current = 0
+        self.stdscr.clear()
+        self.stdscr.attron(curses.color_pair(1))
+        self.stdscr.addstr(0, 2, f"[ {title} ]")
+        self.stdscr.attroff(curses.color_pair(1))
+        self._draw_summary(config)
 
+        # The list gets the left half, the summary stays on the right
+        view = ListView(self.stdscr, options, width=w//2 - 2, highlight=curses.color_pair(2))
+        if default in view.options:
+            view.move(view.options.index(default))
         while True:
-            self.stdscr.clear()
-            self.stdscr.attron(curses.color_pair(1))
-            self.stdscr.addstr(0, 2, f"[ {title} ]")
-            self.stdscr.attroff(curses.color_pair(1))
-
-            # Display options
-            for idx, option in enumerate(options):
-                x = 2
-                y = h//2 - len(options)//2 + idx
-                if 0 <= y < h-1:
-                    if idx == current:
-                        self.stdscr.attron(curses.color_pair(2))
-                        self.stdscr.addstr(y, x, f"> {option}")
-                        self.stdscr.attroff(curses.color_pair(2))
-                    else:
-                        self.stdscr.addstr(y, x, f"  {option}")
-
-            self._draw_summary(config)
-
-            key = self.stdscr.getch()
-            if key == curses.KEY_UP and current > 0:
-                current -= 1
-            elif key == curses.KEY_DOWN and current < len(options)-1:
-                current += 1
-            elif key in [curses.KEY_ENTER, 10, 13]:
-                config[keyname] = options[current]
-                return options[current]
-            elif key == 27:  # ESC key
+            view.draw()
+            self.stdscr.refresh()
+            action = view.handle(self.stdscr.getch())
+            if action == "select":
+                config[keyname] = view.selected
+                return view.selected
+            elif action == "cancel":
                 raise SystemExit("Installation cancelled")
     
+    @_locked
     def input(self, prompt, config, keyname, hidden=False, default=""):
         """Get input from user"""
         curses.curs_set(1)  # Show cursor
@@ -131,6 +139,7 @@ class CursesUI:
                 self.stdscr.addstr(y, x, f"{key}: {value_str}")
             y += 1
     
+    @_locked
     def confirm_installation(self, config):
         """Show final confirmation before installation"""
         self.stdscr.clear()
@@ -148,12 +157,23 @@ class CursesUI:
         key = self.stdscr.getch()
         return key not in [27]  # Not ESC
     
+    @_locked
+    def cancel_requested(self):
+        """True if ESC was pressed, without waiting for a key"""
+        self.stdscr.nodelay(True)
+        try:
+            return self.stdscr.getch() == 27
+        finally:
+            self.stdscr.nodelay(False)
+
+    @_locked
     def show_step(self, message):
         """Show current installation step"""
         self.stdscr.clear()
         self.stdscr.addstr(0, 2, f"STEP: {message}", curses.A_BOLD)
         self.stdscr.refresh()
     
+    @_locked
     def show_error(self, message):
         """Show error message"""
         self.stdscr.clear()
@@ -164,6 +184,7 @@ class CursesUI:
         self.stdscr.refresh()
         self.stdscr.getch()
     
+    @_locked
     def show_success(self, message):
         """Show success message"""
         self.stdscr.clear()
@@ -172,6 +193,7 @@ class CursesUI:
         self.stdscr.attroff(curses.color_pair(3))
         self.stdscr.refresh()
     
+    @_locked
     def prompt_reboot(self):
         """Prompt for reboot"""
         self.stdscr.addstr(2, 2, "Press Enter to reboot or ESC to skip reboot...")
@@ -180,18 +202,102 @@ class CursesUI:
         key = self.stdscr.getch()
         return key not in [27]  # Not ESC
     
+    # Status column layout of the package installation screen
+    PACKAGE_COLUMN_WIDTH = 30
+    PACKAGE_STATUS = {
+        "running": ("Starting...", 5),
+        "done": ("✓ Installed successfully", 3),
+        "failed": ("✗ Installation failed", 4),
+    }
+
+    @_locked
     def show_package_installation(self, packages):
-        """Simple wrapper to show package installation start"""
+        """Draw the package list with an empty status column"""
+        self.package_rows = {}
         self.stdscr.clear()
-        self.stdscr.addstr(0, 2, "PREPARING PACKAGE INSTALLATION...", curses.A_BOLD)
+        self.stdscr.addstr(0, 0, "[STEP] Installing base packages...", curses.A_BOLD)
+
+        h, w = self.stdscr.getmaxyx()
+        left_col_w = self.PACKAGE_COLUMN_WIDTH
+
+        # Draw separator column
+        for i in range(h-1):
+            try:
+                self.stdscr.addstr(i, left_col_w + 2, "│")
+            except curses.error:
+                pass
+        try:
+            self.stdscr.addstr(h-1, 0, "─" * (w-1))
+        except curses.error:
+            pass
+
+        # Show package names in left column, above the progress line
+        for i, pkg in enumerate(packages):
+            if i + 2 < h-2:
+                self.package_rows[pkg] = i + 2
+                try:
+                    self.stdscr.addstr(i+2, 2, pkg[:left_col_w-2])
+                except curses.error:
+                    pass
         self.stdscr.refresh()
-    
+
+    def _draw_package_row(self, package, text, color):
+        """Replace the status column of a package row"""
+        row = self.package_rows.get(package)
+        if row is None:
+            return
+        h, w = self.stdscr.getmaxyx()
+        x = self.PACKAGE_COLUMN_WIDTH + 4
+        width = w - x - 2
+        try:
+            self.stdscr.addstr(row, x, " " * width)
+            self.stdscr.addstr(row, x, text[:width], curses.color_pair(color))
+        except curses.error:
+            pass
+        self._flush()
+
+    def _flush(self, force=False):
+        """Send what was drawn to the terminal, at most at the frame rate"""
+        self.stdscr.noutrefresh()
+        if self.frames.ready(force):
+            curses.doupdate()
+
+    @_locked
     def update_package_status(self, package, status):
         """Update status for a specific package"""
-        # Find package index (simplified - in real implementation would track indices)
-        pass
-    
+        text, color = self.PACKAGE_STATUS.get(status, (status, 5))
+        self._draw_package_row(package, text, color)
+
+    @_locked
     def update_package_progress(self, package, current, total):
         """Update progress for a specific package"""
-        # Update progress bar for package (simplified)
-        pass
+        fraction = min(1.0, current / max(total, 1))
+        bar = ProgressBar.render(20, fraction)
+        self._draw_package_row(package, f"[{bar}] {int(fraction * 100)}% ({current}/{total})", 5)
+
+    @_locked
+    def show_transaction_progress(self, progress):
+        """Draw the phase, bar, rate and ETA of the running transaction above the message line"""
+        h, w = self.stdscr.getmaxyx()
+        fraction = progress.fraction
+        if progress.finished:
+            prefix = "[" + ProgressBar.render(20, 1.0) + "] 100%"
+        elif fraction is None:
+            prefix = self.spinner.next()
+        else:
+            prefix = f"[{ProgressBar.render(20, fraction)}] {int(fraction * 100):3d}%"
+        try:
+            self.stdscr.addstr(h-2, 2, f"{prefix} {progress.describe()}"[:w-3].ljust(w-3))
+        except curses.error:
+            pass
+        self._flush(force=progress.finished)
+
+    @_locked
+    def show_package_message(self, message):
+        """Show a message on the bottom line of the package screen"""
+        h, w = self.stdscr.getmaxyx()
+        try:
+            self.stdscr.addstr(h-1, 2, message[:w-3])
+            self.stdscr.refresh()
+        except curses.error:
+            pass
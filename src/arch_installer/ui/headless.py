@@ -0,0 +1,81 @@
+"""Non-interactive UI emitting machine-readable progress events"""
+
+import json
+import sys
+import threading
+import time
+from arch_installer.ui.progress import FrameLimiter
+
+class HeadlessUI:
+    """Drop-in replacement for CursesUI that prints one JSON event per line"""
+
+    # Shared so events of parallel installs never interleave mid-line
+    _lock = threading.Lock()
+
+    def __init__(self, stream=None, reboot=False, target=None):
+        self.stdscr = None
+        self.stream = stream or sys.stdout
+        self.reboot = reboot
+        # Disk the events belong to when several installs run at once
+        self.target = target
+        self.frames = FrameLimiter(fps=2)
+
+    def emit(self, event, **fields):
+        """Write a single event; safe to call from step worker threads"""
+        record = {"event": event, "time": round(time.time(), 3)}
+        if self.target:
+            record["target"] = self.target
+        record.update(fields)
+        with self._lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+
+    def menu(self, title, options, config, keyname, default=None):
+        raise SystemExit(f"Unattended install needs a value for {keyname}")
+
+    def input(self, prompt, config, keyname, hidden=False, default=""):
+        raise SystemExit(f"Unattended install needs a value for {keyname}")
+
+    def confirm_installation(self, config):
+        """Emit the summary; unattended installs are confirmed by the config file"""
+        hidden = ("rootpass", "userpass")
+        self.emit("config", config={k: ("***" if k in hidden else v) for k, v in config.items()})
+        return True
+
+    def cancel_requested(self):
+        # Unattended installs are stopped with a signal
+        return False
+
+    def show_step(self, message):
+        self.emit("step", message=message)
+
+    def show_error(self, message):
+        self.emit("error", message=message)
+
+    def show_success(self, message):
+        self.emit("success", message=message)
+
+    def prompt_reboot(self):
+        return self.reboot
+
+    def show_package_installation(self, packages):
+        self.emit("packages", packages=list(packages))
+
+    def update_package_status(self, package, status):
+        self.emit("package", package=package, status=status)
+
+    def update_package_progress(self, package, current, total):
+        self.emit("package_progress", package=package, current=current, total=total)
+
+    def show_transaction_progress(self, progress):
+        """Emit the transaction's progress, at most twice a second"""
+        if not self.frames.ready(force=progress.finished):
+            return
+        fraction, rate, eta = progress.fraction, progress.rate(), progress.eta()
+        self.emit("progress", phase=progress.phase, current=progress.current, total=progress.total,
+                  percent=None if fraction is None else round(fraction * 100, 1),
+                  rate=None if rate is None else round(rate, 1),
+                  eta=None if eta is None else round(eta, 1), finished=progress.finished)
+
+    def show_package_message(self, message):
+        self.emit("message", message=message)
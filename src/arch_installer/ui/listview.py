@@ -0,0 +1,150 @@
+"""Windowed, filterable option list"""
+
+import curses
+
+# Shorter lists are cheaper to scan than to index
+INDEX_MIN = 2000
+
+class ListView:
+    """Show the part of a long option list that fits, filtered as the user types
+
+    Only visible rows are drawn, and after a keypress only rows whose text
+    or highlight changed are written again. Long lists get an index of every
+    two character substring when the menu opens, so narrowing the filter
+    scans only the options sharing its rarest pair, and a keypress costs
+    about the same for five options or fifty thousand.
+    """
+
+    def __init__(self, win, options, top=2, left=2, width=None, bottom=1, highlight=curses.A_REVERSE):
+        self.win = win
+        self.options = list(options)
+        self.top = top
+        self.left = left
+        self.width = width
+        self.bottom = bottom
+        self.highlight = highlight
+        self.keys = [str(option).lower() for option in self.options]
+        self.grams = self._build_index(self.keys) if len(self.keys) >= INDEX_MIN else None
+        self.query = ""
+        # Matches for every prefix of the query, so backspace costs nothing
+        self.history = []
+        self.matches = range(len(self.options))
+        self.current = 0
+        self.offset = 0
+        self.drawn = {}
+
+    @staticmethod
+    def _build_index(keys):
+        """Positions of the options containing each two character substring"""
+        grams = {}
+        for i, key in enumerate(keys):
+            for gram in {key[j:j + 2] for j in range(len(key) - 1)}:
+                grams.setdefault(gram, []).append(i)
+        return grams
+
+    @property
+    def height(self):
+        h, _ = self.win.getmaxyx()
+        return max(1, h - self.top - self.bottom)
+
+    @property
+    def selected(self):
+        if not self.matches:
+            return None
+        return self.options[self.matches[self.current]]
+
+    def filter(self, query):
+        """Show only options containing query, ignoring case"""
+        query = query.lower()
+        if query.startswith(self.query) and query != self.query:
+            self.history.append((self.query, self.matches))
+            candidates = self.matches
+        else:
+            self.history = []
+            candidates = range(len(self.options))
+
+        if len(query) > 1 and self.grams is not None:
+            posting = min((self.grams.get(query[j:j + 2], []) for j in range(len(query) - 1)), key=len)
+            if len(posting) < len(candidates):
+                candidates = posting
+        if query:
+            candidates = [i for i in candidates if query in self.keys[i]]
+        self.query = query
+        self.matches = candidates
+        self.current = 0
+        self.offset = 0
+
+    def backspace(self):
+        if not self.query:
+            return
+        if self.history:
+            self.query, self.matches = self.history.pop()
+            self.current = 0
+            self.offset = 0
+        else:
+            self.filter(self.query[:-1])
+
+    def move(self, delta):
+        """Move the highlight, scrolling the window to keep it visible"""
+        if not self.matches:
+            return
+        self.current = max(0, min(len(self.matches) - 1, self.current + delta))
+        if self.current < self.offset:
+            self.offset = self.current
+        elif self.current >= self.offset + self.height:
+            self.offset = self.current - self.height + 1
+
+    def handle(self, key):
+        """Apply a keypress; returns "select", "cancel" or None"""
+        if key in (curses.KEY_ENTER, 10, 13):
+            return "select" if self.matches else None
+        if key == 27:  # ESC clears the filter first
+            if not self.query:
+                return "cancel"
+            self.filter("")
+        elif key == curses.KEY_UP:
+            self.move(-1)
+        elif key == curses.KEY_DOWN:
+            self.move(1)
+        elif key == curses.KEY_PPAGE:
+            self.move(-self.height)
+        elif key == curses.KEY_NPAGE:
+            self.move(self.height)
+        elif key == curses.KEY_HOME:
+            self.move(-len(self.matches))
+        elif key == curses.KEY_END:
+            self.move(len(self.matches))
+        elif key in (curses.KEY_BACKSPACE, 127, 8):
+            self.backspace()
+        elif 32 <= key <= 126:
+            self.filter(self.query + chr(key))
+        return None
+
+    def _put(self, y, text, attr=0):
+        """Write a row unless it already shows exactly this"""
+        if self.drawn.get(y) == (text, attr):
+            return
+        self.drawn[y] = (text, attr)
+        try:
+            self.win.addstr(y, self.left, text, attr)
+        except curses.error:
+            pass
+
+    def draw(self):
+        """Paint the status line and the visible rows that changed"""
+        _, w = self.win.getmaxyx()
+        width = max(1, (self.width or w - self.left) - 1)
+
+        status = f"Filter: {self.query}" if self.query else "Type to filter"
+        status += f"  ({self.current + 1 if self.matches else 0}/{len(self.matches)})"
+        self._put(self.top - 1, status[:width].ljust(width))
+
+        for row in range(self.height):
+            position = self.offset + row
+            if position < len(self.matches):
+                option = str(self.options[self.matches[position]])
+                marker = "> " if position == self.current else "  "
+                attr = self.highlight if position == self.current else 0
+                self._put(self.top + row, (marker + option)[:width].ljust(width), attr)
+            else:
+                self._put(self.top + row, " " * width)
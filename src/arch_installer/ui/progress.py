@@ -1,17 +1,35 @@
 """Progress bar utilities"""
 
 import curses
+import re
+import time
+
+UNITS = {"B": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30, "TiB": 1 << 40}
+
+# pacman output when it is not writing to a terminal
+PACKAGES_RE = re.compile(r"^Packages \((\d+)\)")
+DOWNLOAD_SIZE_RE = re.compile(r"^Total Download Size:\s+([\d.]+) (B|KiB|MiB|GiB|TiB)")
+RETRIEVING_RE = re.compile(r"^:: Retrieving packages")
+DOWNLOADING_RE = re.compile(r"^(\S+) downloading\.\.\.$")
+COUNTER_RE = re.compile(r"^\(\s*(\d+)/(\d+)\) (.*)")
+ACTION_RE = re.compile(r"^(?:installing|reinstalling|upgrading) (\S+)")
+HOOKS_RE = re.compile(r"^:: Running post-transaction hooks")
 
 class ProgressBar:
     """Simple progress bar for curses"""
-    
+
+    @staticmethod
+    def render(width, progress):
+        """Bar of width cells for a fraction between 0 and 1"""
+        filled = int(width * max(0.0, min(1.0, progress)))
+        return "█" * filled + " " * (width - filled)
+
     @staticmethod
     def draw(stdscr, y, x, width, progress, label=""):
         """Draw a progress bar"""
-        filled = int(width * progress)
-        bar = "█" * filled + " " * (width - filled)
+        bar = ProgressBar.render(width, progress)
         percent = int(progress * 100)
-        
+
         try:
             stdscr.addstr(y, x, f"{label} [{bar}] {percent}%")
         except curses.error:
@@ -19,13 +37,166 @@ class ProgressBar:
 
 class Spinner:
     """Simple spinner for indeterminate progress"""
-    
+
     def __init__(self):
         self.frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
         self.current = 0
-    
+
     def next(self):
         """Get next spinner frame"""
         frame = self.frames[self.current]
         self.current = (self.current + 1) % len(self.frames)
         return frame
+
+class FrameLimiter:
+    """Let a redraw through at most fps times a second"""
+
+    def __init__(self, fps=10, clock=time.monotonic):
+        self.interval = 1.0 / fps
+        self.clock = clock
+        self.last = None
+
+    def ready(self, force=False):
+        now = self.clock()
+        if force or self.last is None or now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+        size /= 1024
+    return f"{size:.1f} {unit}"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+class PacmanProgress:
+    """Where a pacman or pacstrap transaction is, from its output lines
+
+    Phases are download, verify, install and hooks, each with its own
+    counter. Without a terminal pacman prints no byte counters while
+    downloading, so downloaded bytes are estimated from the packages started
+    and the total download size it announces.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.phase = None
+        self.started = None
+        # Counter when the phase started, so the rate only counts work seen happening
+        self.base = 0
+        self.current = 0
+        self.total = 0
+        self.package = None
+        self.packages = 0
+        self.download_size = 0
+        self.finished = False
+
+    def _enter(self, phase, total=0, current=0):
+        if phase != self.phase:
+            self.phase = phase
+            self.started = self.clock()
+            self.base = self.current = current
+        self.total = total
+
+    def feed(self, line):
+        """Update from one output line; True if anything shown changed"""
+        line = line.strip()
+        match = COUNTER_RE.match(line)
+        if match:
+            current, total, rest = int(match.group(1)), int(match.group(2)), match.group(3)
+            action = ACTION_RE.match(rest)
+            if action:
+                self._enter("install", total, current)
+                self.package = action.group(1)
+            elif self.phase != "hooks":
+                self._enter("verify", total, current)
+                self.package = rest
+            else:
+                self.total = total
+                self.package = rest
+            self.current = current
+            return True
+
+        if self.phase == "download":
+            match = DOWNLOADING_RE.match(line)
+            if match:
+                self.current += 1
+                self.package = match.group(1)
+                return True
+        if RETRIEVING_RE.match(line):
+            self._enter("download", self.packages)
+            return True
+        if HOOKS_RE.match(line):
+            self._enter("hooks")
+            return True
+        match = PACKAGES_RE.match(line)
+        if match:
+            self.packages = int(match.group(1))
+            return False
+        match = DOWNLOAD_SIZE_RE.match(line)
+        if match:
+            self.download_size = int(float(match.group(1)) * UNITS[match.group(2)])
+        return False
+
+    def finish(self):
+        self.finished = True
+
+    @property
+    def fraction(self):
+        """Share of the current phase done, None when pacman gave no counter"""
+        if not self.total:
+            return None
+        return min(1.0, self.current / self.total)
+
+    @property
+    def downloaded(self):
+        """Estimated bytes downloaded so far"""
+        if self.phase != "download" or not self.download_size or self.fraction is None:
+            return None
+        return int(self.download_size * self.fraction)
+
+    def rate(self):
+        """Bytes per second while downloading, otherwise items per second"""
+        elapsed = self.clock() - self.started if self.started is not None else 0
+        if elapsed <= 0 or self.current <= self.base:
+            return None
+        if self.downloaded is not None:
+            return self.downloaded / elapsed
+        return (self.current - self.base) / elapsed
+
+    def eta(self):
+        """Seconds left in the current phase at the current rate"""
+        rate = self.rate()
+        if rate is None or self.fraction is None:
+            return None
+        if self.downloaded is not None:
+            return (self.download_size - self.downloaded) / rate
+        return (self.total - self.current) / rate
+
+    def describe(self):
+        """One line for the current phase, e.g. "Installing 12/150 8.0/s ETA 0:17 linux" """
+        label = {"download": "Downloading", "verify": "Checking", "install": "Installing",
+                 "hooks": "Running hooks"}.get(self.phase, "Preparing")
+        if self.finished:
+            return "Done"
+        if self.fraction is None:
+            return label
+        text = f"{label} {self.current}/{self.total}"
+        rate = self.rate()
+        if self.downloaded is not None:
+            text += f" {format_bytes(self.downloaded)}/{format_bytes(self.download_size)}"
+            if rate is not None:
+                text += f" {format_bytes(rate)}/s"
+        elif rate is not None:
+            text += f" {rate:.1f}/s"
+        text += f" ETA {format_eta(self.eta())}"
+        if self.package:
+            text += f" {self.package}"
+        return text
@@ -1,30 +1,164 @@
 """Utility functions"""
 
+import codecs
+import collections
 import os
+import shlex
+import signal
+import sys
 import subprocess
 import logging
+import threading
+import time
+from arch_installer import tracing
 
-def run(cmd, check=True, capture_output=True, silent=True):
-    """Run a shell command with logging"""
-    print(f"[RUN] {cmd}")
-    logging.info(f"Running: {cmd}")
-    try:
-        # Nếu silent=True, chuyển hướng output để không làm hỏng curses
-        if silent:
-            result = subprocess.run(cmd, shell=True, check=check, 
-                                  capture_output=True, text=True)
+# Optional replacement for the shell, see set_runner
+_runner = None
+# Subscribers to command output, see add_output_handler
+_handlers = []
+# Command output goes to the log line by line as it arrives
+_output_log = logging.getLogger("arch_installer.output")
+
+# Output lines kept to report with a failed command
+TAIL_LINES = 200
+# Longer lines are split, so output without newlines cannot grow the tail
+MAX_LINE = 4 << 10
+
+def set_runner(runner):
+    """Route commands through runner(cmd) -> (returncode, output), or None for the shell
+
+    Used to drive the installer without touching the system, e.g. in tests.
+    A runner with a stream(cmd, on_line, on_error, timeout, usage) method,
+    such as engine.CommandEngine, gets the command as given and passes output
+    lines as they arrive instead, filling usage for the trace.
+    """
+    global _runner
+    _runner = runner
+
+def get_runner():
+    return _runner
+
+def command_text(cmd):
+    """A shell string or argv list as one line, for logs and output handlers"""
+    return cmd if isinstance(cmd, str) else shlex.join(cmd)
+
+def add_output_handler(handler):
+    """Call handler(cmd, line) for every output line of every command, e.g. to parse progress"""
+    _handlers.append(handler)
+
+def remove_output_handler(handler):
+    if handler in _handlers:
+        _handlers.remove(handler)
+
+def _stream(cmd, on_line=None, keep_output=False, timeout=None, label=None):
+    """Run a shell string or argv list, handling its output line by line as it arrives
+
+    Only the last TAIL_LINES lines are kept, for error reports, so memory stays
+    flat however much a command prints. With keep_output stdout is collected
+    in full and stderr goes to the tail only. After timeout seconds the
+    command is killed and subprocess.TimeoutExpired raised. label stands in
+    for the command in the trace and for output handlers.
+    Returns (returncode, stdout or None, tail).
+    """
+    text = command_text(cmd)
+    name = label or text
+    tail = collections.deque(maxlen=TAIL_LINES)
+    kept = [] if keep_output else None
+    lock = threading.Lock()
+
+    def handle(line, is_stdout=True):
+        with lock:
+            _output_log.info(line)
+            tail.append(line)
+            if kept is not None and is_stdout:
+                kept.append(line)
+            if on_line:
+                on_line(line)
+            for handler in list(_handlers):
+                handler(name, line)
+
+    start = time.monotonic()
+    if _runner is not None:
+        usage = {}
+        if hasattr(_runner, "stream"):
+            returncode = _runner.stream(cmd, handle, (lambda line: handle(line, False)) if keep_output else None,
+                                        timeout, usage)
         else:
-            result = subprocess.run(cmd, shell=True, check=check, 
-                                  capture_output=capture_output, text=True)
-        
-        if capture_output and not silent:
-            return result.stdout
-        return None
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Command failed: {cmd} - Error: {e}")
+            returncode, output = _runner(text)
+            for line in (output or "").splitlines():
+                handle(line)
+        if tracing.tracer.enabled:
+            tracing.tracer.record(name, "command", start, time.monotonic(), returncode=returncode, **usage)
+        return returncode, None if kept is None else "\n".join(kept), "\n".join(tail)
+
+    # With a timeout the command gets its own process group, so its children die with it
+    process = subprocess.Popen(cmd, shell=isinstance(cmd, str), stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE if keep_output else subprocess.STDOUT,
+                               start_new_session=timeout is not None)
+    timer = None
+    expired = threading.Event()
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill_group, args=(process, expired))
+        timer.start()
+    drain = None
+    if keep_output:
+        # Read stderr alongside so neither pipe can fill up and block the command
+        drain = threading.Thread(target=_read_lines, args=(process.stderr, lambda line: handle(line, False)),
+                                 daemon=True)
+        drain.start()
+    _read_lines(process.stdout, handle)
+    if drain:
+        drain.join()
+    if tracing.tracer.enabled:
+        returncode, usage = tracing.wait(process)
+        tracing.tracer.record(name, "command", start, time.monotonic(), returncode=returncode, **usage)
+    else:
+        returncode = process.wait()
+    if timer is not None:
+        timer.cancel()
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, "\n".join(tail))
+    return returncode, None if kept is None else "\n".join(kept), "\n".join(tail)
+
+def _kill_group(process, expired):
+    """Timer callback killing a command that ran past its timeout"""
+    if process.returncode is not None:
+        return
+    expired.set()
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def _read_lines(pipe, handle):
+    """Pass each line of pipe to handle; overlong lines are split so reads stay bounded"""
+    # Binary reads, as text-mode readline buffers a whole line whatever its limit
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter(lambda: pipe.readline(MAX_LINE), b""):
+        handle(decoder.decode(chunk).rstrip("\n"))
+
+def run(cmd, check=True, capture_output=True, silent=True, on_line=None, timeout=None, label=None):
+    """Run a shell command, or an argv list without a shell, with logging
+
+    Commands carrying secrets or long scripts pass a short label to log and
+    trace instead.
+    """
+    # stderr keeps stdout free for machine-readable progress in unattended mode
+    print(f"[RUN] {label or command_text(cmd)}", file=sys.stderr)
+    logging.info(f"Running: {label or command_text(cmd)}")
+    keep_output = capture_output and not silent
+    returncode, output, tail = _stream(cmd, on_line, keep_output, timeout, label)
+    if check and returncode != 0:
+        logging.error(f"Command failed: {label or command_text(cmd)} - exit status {returncode}\n{tail}")
         if not silent:
-            print(f"ERROR: {e.stderr}")
-        raise
+            print(f"ERROR: {tail}", file=sys.stderr)
+        raise subprocess.CalledProcessError(returncode, cmd, tail)
+    return output
+
+def run_lines(cmd, on_line, timeout=None, label=None):
+    """Run a shell command or argv list, passing each output line to on_line, and return its exit code"""
+    logging.info(f"Running: {label or command_text(cmd)}")
+    return _stream(cmd, on_line, timeout=timeout, label=label)[0]
 
 def safe_run(cmd):
     """Run a command but don't raise exception on failure"""
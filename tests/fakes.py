@@ -0,0 +1,240 @@
+"""Shared fakes for tests that drive the installer without touching the system"""
+
+import os
+import re
+import shlex
+from arch_installer.chroot import BATCH_MARKER
+from arch_installer.hardware import HardwareProfile
+
+# A UEFI machine with an Intel CPU, no GPU worth a driver and 4 GiB of RAM
+HARDWARE = HardwareProfile(cpu="intel", gpus=(), nics=(), memory_mb=4096, efi=True, disks=())
+
+# Packages whose pacman hooks rebuild every initramfs
+INITRAMFS_TRIGGERS = ("linux", "linux-lts", "linux-zen", "linux-firmware", "nvidia-dkms")
+
+class StubRunner:
+    """Record commands and fake the parts of the system the installer needs
+
+    pacstrap creates a minimal root with the files later steps edit, and
+    mkdir runs for real so target roots can live in a temporary directory.
+    Kernels get a modules directory, and unless the mkinitcpio hook is
+    masked, pacstrap prints and writes an image for every preset, as does the
+    install script run in the chroot.
+    """
+
+    def __init__(self, fail_on=None):
+        self.commands = []
+        self.fail_on = fail_on
+
+    def __call__(self, cmd):
+        self.commands.append(cmd)
+        if self.fail_on and self.fail_on in cmd:
+            return 1, "error: simulated failure"
+
+        args = shlex.split(cmd)
+        if args[0] == "mkdir":
+            for path in args[2:]:
+                os.makedirs(path, exist_ok=True)
+        elif args[0] == "pacstrap":
+            return 0, self.pacstrap(args)
+        elif args[0] == "chroot":
+            return 0, self.chroot(args[1], args[-1])
+        return 0, ""
+
+    @staticmethod
+    def chroot(root, script):
+        """Pretend every command of a chroot script succeeded"""
+        if "bootctl install" in script:
+            os.makedirs(os.path.join(root, "boot/loader"), exist_ok=True)
+        lines = []
+        if "libalpm/scripts/mkinitcpio install" in script:
+            lines += StubRunner.mkinitcpio(root)
+        batch = re.findall(rf'"{BATCH_MARKER} (\d+) \$rc"', script)
+        return "\n".join(lines + [f"{BATCH_MARKER} {i} 0" for i in batch])
+
+    @staticmethod
+    def mkinitcpio(root):
+        """Build every preset of every kernel, as the mkinitcpio hook does"""
+        lines = []
+        modules = os.path.join(root, "usr/lib/modules")
+        os.makedirs(os.path.join(root, "boot"), exist_ok=True)
+        for version in sorted(os.listdir(modules)) if os.path.isdir(modules) else []:
+            with open(os.path.join(modules, version, "pkgbase")) as f:
+                pkgbase = f.read().strip()
+            presets = ["default", "fallback"]
+            try:
+                with open(os.path.join(root, "etc/mkinitcpio.d", f"{pkgbase}.preset")) as f:
+                    presets = re.findall(r"'(\w+)'", re.search(r"PRESETS=\((.*)\)", f.read()).group(1))
+            except OSError:
+                pass
+            for preset in presets:
+                suffix = "" if preset == "default" else f"-{preset}"
+                open(os.path.join(root, "boot", f"initramfs-{pkgbase}{suffix}.img"), "w").close()
+                lines.append(f"==> Building image from preset: /etc/mkinitcpio.d/{pkgbase}.preset: '{preset}'")
+        return lines
+
+    @staticmethod
+    def pacstrap(args):
+        """Populate the root and print pacman's install lines"""
+        root = next(arg for arg in args[1:] if not arg.startswith("-"))
+        pkgs = [arg for arg in args[args.index(root) + 1:]
+                if not arg.startswith("-") and not arg.startswith("/")]
+        os.makedirs(os.path.join(root, "etc"), exist_ok=True)
+        for name, content in (("locale.gen", "#en_US.UTF-8 UTF-8\n"), ("fstab", "")):
+            path = os.path.join(root, "etc", name)
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(content)
+        for pkg in pkgs:
+            os.makedirs(os.path.join(root, "var/lib/pacman/local", f"{pkg}-1-1"), exist_ok=True)
+            if pkg.endswith("-ucode"):
+                os.makedirs(os.path.join(root, "boot"), exist_ok=True)
+                open(os.path.join(root, "boot", f"{pkg}.img"), "w").close()
+            if pkg in INITRAMFS_TRIGGERS[:3]:
+                modules = os.path.join(root, "usr/lib/modules", f"6.9.1-{pkg}")
+                os.makedirs(modules, exist_ok=True)
+                with open(os.path.join(modules, "pkgbase"), "w") as f:
+                    f.write(pkg)
+        lines = [f"({i}/{len(pkgs)}) installing {pkg}" for i, pkg in enumerate(pkgs, 1)]
+
+        hookdir = args[args.index("--hookdir") + 1] if "--hookdir" in args else None
+        masked = hookdir and os.path.islink(os.path.join(hookdir, "90-mkinitcpio-install.hook"))
+        if not masked and any(pkg in INITRAMFS_TRIGGERS or pkg.endswith("-ucode") for pkg in pkgs):
+            lines.append(":: Running post-transaction hooks...")
+            lines += StubRunner.mkinitcpio(root)
+        return "\n".join(lines)
+
+    def index(self, pattern):
+        """Position of the first command matching a regular expression"""
+        return next(i for i, cmd in enumerate(self.commands) if re.search(pattern, cmd))
+
+    def count(self, pattern):
+        return sum(1 for cmd in self.commands if re.search(pattern, cmd))
+
+# Where each bus puts its disks under /sys/devices
+BUS_PATHS = {
+    "sata": "pci0000:00/0000:00:17.0/ata{n}/host{n}/target{n}:0:0/{n}:0:0:0",
+    "usb": "pci0000:00/0000:00:14.0/usb1/1-{n}/1-{n}:1.0/host{n}/target{n}:0:0/{n}:0:0:0",
+    "virtio": "pci0000:00/0000:00:04.0/virtio{n}",
+    "nvme": "pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme{n}",
+}
+
+class FakeSysfs:
+    """/sys and /proc trees for block devices, mounts, PCI devices, CPU and RAM under a directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.sysfs = os.path.join(root, "sys")
+        self.procfs = os.path.join(root, "proc")
+        self.mountinfo = os.path.join(self.procfs, "self/mountinfo")
+        self.swaps = os.path.join(self.procfs, "swaps")
+        self.mounts = []
+        self.swap_devices = []
+        self.minors = {}
+        os.makedirs(os.path.join(self.sysfs, "block"), exist_ok=True)
+        os.makedirs(os.path.dirname(self.mountinfo), exist_ok=True)
+
+    @staticmethod
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(f"{content}\n")
+
+    def devno(self, major):
+        minor = self.minors.get(major, 0)
+        self.minors[major] = minor + 1
+        return f"{major}:{minor}"
+
+    def disk(self, name, size, bus="sata", rotational=False, model=None, major=8, kind=None):
+        """Add a whole device of size bytes and return its sysfs directory"""
+        n = len(os.listdir(os.path.join(self.sysfs, "block")))
+        path = os.path.join(self.sysfs, "devices", BUS_PATHS.get(bus, "virtual").format(n=n), "block", name)
+        os.makedirs(path)
+        os.symlink(os.path.relpath(path, os.path.join(self.sysfs, "block")),
+                   os.path.join(self.sysfs, "block", name))
+        devno = self.devno(major)
+        self.write(os.path.join(path, "dev"), devno)
+        self.write(os.path.join(path, "size"), size // 512)
+        self.write(os.path.join(path, "queue/rotational"), int(rotational))
+        self.write(os.path.join(path, "removable"), int(bus == "usb"))
+        if model:
+            self.write(os.path.join(path, "device/model"), model)
+        if kind:
+            os.makedirs(os.path.join(path, kind))
+        os.makedirs(os.path.join(path, "holders"))
+        return devno
+
+    def partition(self, disk, number, size, major=8):
+        """Add partition number of disk and return its name"""
+        name = f"{disk}p{number}" if disk[-1].isdigit() else f"{disk}{number}"
+        path = os.path.join(self.sysfs, "block", disk, name)
+        os.makedirs(os.path.join(path, "holders"))
+        self.write(os.path.join(path, "dev"), self.devno(major))
+        self.write(os.path.join(path, "size"), size // 512)
+        self.write(os.path.join(path, "partition"), number)
+        return name
+
+    def holder(self, holder, disk, partition=None):
+        """Stack holder (e.g. dm-0) on a disk or one of its partitions"""
+        path = os.path.join(self.sysfs, "block", disk, partition or "")
+        os.symlink(f"../../{holder}", os.path.join(path, "holders", holder))
+
+    def mount(self, devno, mountpoint, source, fstype="ext4"):
+        self.mounts.append((devno, mountpoint.replace(" ", "\\040"), source, fstype))
+
+    def save(self):
+        """Write mountinfo and swaps for everything mounted so far"""
+        with open(self.mountinfo, "w") as f:
+            for i, (devno, mountpoint, source, fstype) in enumerate(self.mounts, 30):
+                f.write(f"{i} 1 {devno} / {mountpoint} rw,relatime shared:{i} - {fstype} {source} rw\n")
+        with open(self.swaps, "w") as f:
+            f.write("Filename\tType\tSize\tUsed\tPriority\n")
+            for device in self.swap_devices:
+                f.write(f"{device}\tpartition\t1048572\t0\t-2\n")
+
+    def paths(self):
+        return {"sysfs": self.sysfs, "mountinfo": self.mountinfo, "swaps": self.swaps}
+
+    def pci(self, address, vendor, pci_class, device="0x0001", driver=None, module=None):
+        """Add a PCI function, e.g. pci("0000:01:00.0", "0x10de", "0x030000")"""
+        path = os.path.join(self.sysfs, "bus/pci/devices", address)
+        for name, value in (("vendor", vendor), ("device", device), ("class", pci_class)):
+            self.write(os.path.join(path, name), value)
+        self.write(os.path.join(path, "modalias"),
+                   f"pci:v0000{vendor[2:].upper()}d0000{device[2:].upper()}sv00000000sd00000000"
+                   f"bc{pci_class[2:4].upper()}sc{pci_class[4:6].upper()}i{pci_class[6:8].upper()}")
+        self.bind(path, "pci", driver, module)
+
+    def usb(self, interface, modalias, interface_class, driver=None, module=None):
+        """Add a USB interface, e.g. usb("1-4:1.0", "usb:v8087p0026...", "e0")"""
+        path = os.path.join(self.sysfs, "bus/usb/devices", interface)
+        self.write(os.path.join(path, "modalias"), modalias)
+        self.write(os.path.join(path, "bInterfaceClass"), interface_class)
+        self.bind(path, "usb", driver, module)
+
+    def bind(self, path, bus, driver, module=None):
+        """Link a device to its driver, and the driver to the module it lives in"""
+        if not driver:
+            return
+        drivers = os.path.join(self.sysfs, "bus", bus, "drivers", driver)
+        if module and not os.path.lexists(os.path.join(drivers, "module")):
+            os.makedirs(drivers, exist_ok=True)
+            os.symlink(f"../../../../module/{module}", os.path.join(drivers, "module"))
+        os.symlink(f"../../drivers/{driver}", os.path.join(path, "driver"))
+
+    def modules(self, names):
+        """/proc/modules listing names as loaded"""
+        self.write(os.path.join(self.procfs, "modules"),
+                   "\n".join(f"{name} 16384 0 - Live 0x0000000000000000" for name in names))
+
+    def efi(self):
+        os.makedirs(os.path.join(self.sysfs, "firmware/efi/efivars"), exist_ok=True)
+
+    def cpu(self, vendor_id, threads=1):
+        """/proc/cpuinfo repeating every field for each thread, as the kernel does"""
+        self.write(os.path.join(self.procfs, "cpuinfo"), "\n".join(
+            f"processor\t: {n}\nvendor_id\t: {vendor_id}\nflags\t\t: fpu vme de pse tsc msr\n"
+            for n in range(threads)))
+
+    def memory(self, mb):
+        self.write(os.path.join(self.procfs, "meminfo"), f"MemTotal:       {mb * 1024} kB\nMemFree:        1024 kB")
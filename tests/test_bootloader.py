@@ -0,0 +1,76 @@
+"""Unit tests for bootloader modules"""
+
+import os
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.bootloader.grub import Grub
+from arch_installer.bootloader.systemd_boot import SystemdBoot
+from arch_installer.bootloader.render import grub_cfg, kernel_options, systemd_boot_entries
+from arch_installer.chroot import ChrootSession
+from fakes import StubRunner
+
+SNAPSHOTS = os.path.join(os.path.dirname(__file__), "snapshots", "bootloader")
+ROOT_UUID = "3f2b6c1e-8d4a-4f57-9a61-0c2e5b7d9e10"
+EFI_UUID = "A1B2-C3D4"
+
+class TestBootloaderConfig(unittest.TestCase):
+    """Rendered configs against files in tests/snapshots; UPDATE_SNAPSHOTS=1 rewrites them"""
+
+    def assertSnapshot(self, name, text):
+        path = os.path.join(SNAPSHOTS, name)
+        if os.environ.get("UPDATE_SNAPSHOTS") or not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write(text)
+        with open(path) as f:
+            self.assertEqual(text, f.read(), f"{name} differs from its snapshot")
+
+    def test_systemd_boot_entries(self):
+        """Test the default and fallback entry with microcode"""
+        entries = systemd_boot_entries("linux", kernel_options(ROOT_UUID), "intel-ucode.img")
+        self.assertEqual(sorted(entries), ["arch-fallback.conf", "arch.conf"])
+        for name, text in entries.items():
+            self.assertSnapshot(f"systemd-boot-{name}", text)
+
+    def test_systemd_boot_without_fallback(self):
+        """Test skipping the fallback image drops its entry"""
+        entries = systemd_boot_entries("linux-lts", kernel_options(ROOT_UUID, "btrfs", "nvidia"),
+                                       fallback=False)
+        self.assertEqual(list(entries), ["arch.conf"])
+        self.assertSnapshot("systemd-boot-nvidia-btrfs.conf", entries["arch.conf"])
+
+    def test_grub_cfg(self):
+        """Test grub.cfg finds the ESP by UUID and boots the root by UUID"""
+        self.assertSnapshot("grub.cfg", grub_cfg("linux", kernel_options(ROOT_UUID), EFI_UUID, "amd-ucode.img"))
+        self.assertSnapshot("grub-no-fallback.cfg",
+                            grub_cfg("linux-zen", kernel_options(ROOT_UUID, "xfs"), EFI_UUID, fallback=False))
+
+class TestBootloaderInstall(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "mnt")
+        self.runner = StubRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def test_grub_skips_transaction_and_probing(self):
+        """Test GRUB is installed without pacman, grub-mkconfig or os-prober"""
+        with ChrootSession(self.root) as chroot:
+            Grub().install(ROOT_UUID, EFI_UUID, "linux", "None", "intel-ucode.img", self.root, chroot)
+
+        self.assertEqual(self.runner.count("(?s)^chroot .*grub-install --target=x86_64-efi"), 1)
+        self.assertEqual(self.runner.count("pacman|grub-mkconfig|os-prober"), 0)
+        with open(os.path.join(self.root, "boot/grub/grub.cfg")) as f:
+            self.assertEqual(f.read(), grub_cfg("linux", kernel_options(ROOT_UUID), EFI_UUID, "intel-ucode.img"))
+
+    def test_systemd_boot_rewrites_entries(self):
+        """Test entries are replaced, and a stale fallback entry removed"""
+        boot = SystemdBoot()
+        boot.write_entries(ROOT_UUID, "linux", "None", root=self.root)
+        boot.write_entries(ROOT_UUID, "linux", "None", root=self.root, fallback=False)
+        self.assertEqual(os.listdir(os.path.join(self.root, "boot/loader/entries")), ["arch.conf"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Unit tests for chroot module"""
+
+import shlex
+import subprocess
+import unittest
+from arch_installer import utils
+from arch_installer.chroot import ChrootSession
+
+class HostShellRunner:
+    """Fake mounts, run chroot scripts with the host shell"""
+
+    def __init__(self, busy=()):
+        self.commands = []
+        self.busy = busy
+
+    def __call__(self, cmd):
+        self.commands.append(cmd)
+        args = shlex.split(cmd)
+        if args[0] == "chroot":
+            result = subprocess.run(args[2:], capture_output=True, text=True)
+            return result.returncode, result.stdout + result.stderr
+        if args[0] == "umount" and args[-1] in self.busy:
+            return 32, "target is busy"
+        return 0, ""
+
+class TestChrootSession(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = HostShellRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def test_mounts_once_and_tears_down_in_reverse(self):
+        """Test the API filesystems are mounted once per session"""
+        with ChrootSession("/target") as session:
+            session.run("true")
+            session.run("true")
+        mounts = [c.split()[-1] for c in self.runner.commands if c.startswith("mount")]
+        umounts = [c.split()[-1] for c in self.runner.commands if c.startswith("umount")]
+        self.assertEqual(mounts.count("/target/proc"), 1)
+        self.assertEqual(umounts, mounts[::-1])
+        self.assertFalse(session.active)
+
+    def test_run_batch_splits_output_and_exit_codes(self):
+        """Test each batched command reports its own exit code and output"""
+        with ChrootSession("/target") as session:
+            results = session.run_batch(["echo one", "printf 'two'", "exit 3", "echo four"], check=False)
+        self.assertEqual([r.returncode for r in results], [0, 0, 3, 0])
+        self.assertEqual([r.output for r in results], ["one", "two", "", "four"])
+        self.assertEqual(sum(1 for c in self.runner.commands if c.startswith("chroot")), 1)
+
+    def test_run_batch_stops_at_failure(self):
+        """Test a failing command stops the batch and raises for it"""
+        with ChrootSession("/target") as session:
+            with self.assertRaises(subprocess.CalledProcessError) as failure:
+                session.run_batch(["echo ok", "echo broken >&2; false", "touch /never"])
+        self.assertEqual(failure.exception.cmd, "chroot /target echo")
+        self.assertEqual(failure.exception.output, "broken")
+
+    def test_busy_mount_detached_lazily(self):
+        """Test teardown falls back to a lazy unmount and still unmounts the rest"""
+        utils.set_runner(HostShellRunner(busy=("/target/dev",)))
+        with self.assertRaises(subprocess.CalledProcessError):
+            with ChrootSession("/target") as session:
+                session.run("false")
+        self.assertIn("umount -l /target/dev", utils._runner.commands)
+        self.assertIn("umount /target/proc", utils._runner.commands)
+
+if __name__ == '__main__':
+    unittest.main()
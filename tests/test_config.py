@@ -0,0 +1,27 @@
+"""Unit tests for config module"""
+
+import unittest
+from arch_installer.config import ConfigError, parse_simple_yaml, validate_config
+
+class TestConfig(unittest.TestCase):
+
+    def test_parse_nested(self):
+        """Test flat keys, one level of nesting and trailing comments"""
+        config = parse_simple_yaml("disk: /dev/sda  # target\nuse_swap: yes\nlayout:\n  preset: home\n  raid: 1\n")
+        self.assertEqual(config, {'disk': "/dev/sda", 'use_swap': True, 'layout': {'preset': "home", 'raid': 1}})
+
+    def test_parse_rejects_lists(self):
+        """Test lists and flow mappings fail instead of being misread"""
+        for text in ["layout:\n  partitions:\n    - {mountpoint: /home}\n",
+                     "layout:\n  partitions: [{mountpoint: /}]\n",
+                     "locale: {lang: C}\n"]:
+            with self.assertRaisesRegex(ConfigError, "need PyYAML"):
+                parse_simple_yaml(text)
+
+    def test_unknown_keys(self):
+        """Test a misspelt key is reported with the other errors"""
+        with self.assertRaisesRegex(ConfigError, "unknown key 'filesytem'"):
+            validate_config({'disk': "/dev/vda", 'rootpass': "secret", 'filesytem': "xfs"}, ["/dev/vda"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,31 +1,76 @@
 """Unit tests for disk module"""
 
+import tempfile
 import unittest
-from unittest.mock import patch, MagicMock
+from arch_installer import utils
 from arch_installer.disk import DiskManager
+from arch_installer.inventory import Inventory
+from fakes import FakeSysfs, StubRunner
 
 class TestDiskManager(unittest.TestCase):
-    
-    @patch('subprocess.check_output')
-    def test_list_disks(self, mock_check_output):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fake = FakeSysfs(self.tmp.name)
+        self.fake.disk("sda", 100 << 30)
+        self.fake.disk("sdb", 200 << 30)
+
+    def inventory(self):
+        self.fake.save()
+        return Inventory.scan(**self.fake.paths())
+
+    def test_list_disks(self):
         """Test disk listing"""
-        mock_check_output.return_value = "sda 100G disk\nsdb 200G disk\n"
-        
-        disks = DiskManager.list_disks()
+        disks = DiskManager.list_disks(self.inventory())
         expected = ["/dev/sda (100G)", "/dev/sdb (200G)"]
         self.assertEqual(disks, expected)
-    
-    @patch('subprocess.run')
-    def test_is_disk_mounted(self, mock_run):
+
+    def test_is_disk_mounted(self):
         """Test disk mount detection"""
-        mock_result = MagicMock()
-        mock_result.returncode = 0
-        mock_run.return_value = mock_result
-        
-        self.assertTrue(DiskManager.is_disk_mounted("/dev/sda"))
-        
-        mock_result.returncode = 1
-        self.assertFalse(DiskManager.is_disk_mounted("/dev/sda"))
+        self.assertFalse(DiskManager.is_disk_mounted("/dev/sda", self.inventory()))
+
+        self.fake.mount(self.fake.partition("sda", 1, 1 << 30), "/mnt", "/dev/sda1")
+        self.assertTrue(DiskManager.is_disk_mounted("/dev/sda", self.inventory()))
+        self.assertFalse(DiskManager.is_disk_mounted("/dev/sdb", self.inventory()))
+
+    def test_unmount_disk(self):
+        """Test only the disk's own mounts are released, deepest first"""
+        root = self.fake.partition("sda", 2, 99 << 30)
+        self.fake.mount(root, "/mnt", "/dev/sda2")
+        self.fake.mount(self.fake.partition("sda", 1, 1 << 30), "/mnt/boot", "/dev/sda1")
+        self.fake.mount(self.fake.partition("sdb", 1, 1 << 30), "/home", "/dev/sdb1")
+        self.fake.swap_devices.append("/dev/sda3")
+        self.fake.partition("sda", 3, 1 << 30)
+
+        runner = StubRunner()
+        utils.set_runner(runner)
+        self.addCleanup(utils.set_runner, None)
+        DiskManager.unmount_disk("/dev/sda", self.inventory())
+        self.assertEqual(runner.commands, ["swapoff /dev/sda3", "umount /mnt/boot", "umount /mnt"])
+
+    def test_unmount_stops_stacked_devices(self):
+        """Test volume groups and then arrays on the disk are stopped after unmounting"""
+        self.fake.partition("sda", 1, 1 << 30)
+        self.fake.partition("sda", 2, 99 << 30)
+        self.fake.partition("sdb", 1, 1 << 30)
+        self.fake.disk("md127", 99 << 30, bus=None, major=9, kind="md")
+        self.fake.holder("md127", "sda", "sda2")
+        lvm = self.fake.disk("dm-0", 99 << 30, bus=None, major=254, kind="dm")
+        self.fake.write(f"{self.fake.sysfs}/block/dm-0/dm/name", "arch_sda-var--log")
+        self.fake.write(f"{self.fake.sysfs}/block/dm-0/dm/uuid", "LVM-abc")
+        self.fake.holder("dm-0", "md127")
+        self.fake.disk("dm-1", 1 << 30, bus=None, major=254, kind="dm")
+        self.fake.write(f"{self.fake.sysfs}/block/dm-1/dm/name", "cryptswap")
+        self.fake.write(f"{self.fake.sysfs}/block/dm-1/dm/uuid", "CRYPT-LUKS2-abc")
+        self.fake.holder("dm-1", "sdb", "sdb1")
+        self.fake.mount(lvm, "/mnt/var/log", "/dev/mapper/arch_sda-var--log")
+
+        runner = StubRunner()
+        utils.set_runner(runner)
+        self.addCleanup(utils.set_runner, None)
+        DiskManager.unmount_disk("/dev/sda", self.inventory())
+        self.assertEqual(runner.commands, ["umount /mnt/var/log", "vgchange -an arch_sda", "mdadm --stop /dev/md127"])
 
 if __name__ == '__main__':
     unittest.main()
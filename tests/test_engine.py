@@ -0,0 +1,167 @@
+"""Unit tests for engine module"""
+
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from arch_installer import utils
+from arch_installer.engine import CommandEngine, CommandCancelled, cancel_on_signals, command_kind
+from arch_installer.tracing import tracer
+
+def alive(pid):
+    """True while pid runs; zombies count as dead"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+class TestCommandEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = CommandEngine(grace=0.5)
+        self.engine.start()
+        self.addCleanup(self.engine.close)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def wait_dead(self, pid_file):
+        with open(pid_file) as f:
+            pid = int(f.read())
+        deadline = time.monotonic() + 5
+        while alive(pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not alive(pid)
+
+    def test_command_kind(self):
+        """Test commands are classified by the program they start"""
+        self.assertEqual(command_kind(["mkfs.ext4", "/dev/vda2"]), "disk")
+        self.assertEqual(command_kind("sgdisk -o /dev/vda"), "disk")
+        self.assertEqual(command_kind(["/usr/bin/pacstrap", "-K", "/mnt", "base"]), "network")
+        self.assertIsNone(command_kind("chroot /mnt /bin/sh -c true"))
+
+    def test_argv_without_shell(self):
+        """Test argv lists are not expanded by a shell, and stderr can be kept apart"""
+        out, err = [], []
+        returncode = self.engine.stream(["sh", "-c", 'echo "$0"; echo oops >&2', "$HOME"], out.append, err.append)
+        self.assertEqual((returncode, out, err), (0, ["$HOME"], ["oops"]))
+
+    def test_timeout_kills_process_group(self):
+        """Test a command past its timeout dies with the children it started"""
+        pid_file = os.path.join(self.tmp.name, "pid")
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.engine.stream(f"sleep 30 & echo $! > {pid_file}; wait", timeout=0.3)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(self.wait_dead(pid_file))
+
+    def test_cancel(self):
+        """Test cancel kills a running command and fails the ones after it"""
+        pid_file = os.path.join(self.tmp.name, "pid")
+        errors = []
+
+        def target():
+            try:
+                self.engine.stream(f"echo $$ > {pid_file}; exec sleep 30")
+            except CommandCancelled as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(pid_file) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.engine.cancel()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(self.wait_dead(pid_file))
+        with self.assertRaises(CommandCancelled):
+            self.engine.stream("true")
+
+        self.engine.reset()
+        self.assertEqual(self.engine.stream("true"), 0)
+
+    def test_cancel_on_signals(self):
+        """Test SIGTERM to the installer kills the running command instead of orphaning it"""
+        pid_file = os.path.join(self.tmp.name, "pid")
+        previous = cancel_on_signals(self.engine)
+        self.addCleanup(lambda: [signal.signal(signum, handler) for signum, handler in previous.items()])
+        errors = []
+
+        def target():
+            try:
+                self.engine.stream(f"echo $$ > {pid_file}; exec sleep 30")
+            except CommandCancelled as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(pid_file) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        start = time.monotonic()
+        os.kill(os.getpid(), signal.SIGTERM)
+        thread.join(5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(self.wait_dead(pid_file))
+        with self.assertRaises(KeyboardInterrupt):
+            os.kill(os.getpid(), signal.SIGINT)
+            time.sleep(0.1)
+
+    def test_limits(self):
+        """Test commands of a kind wait for a free slot"""
+        mkfs = os.path.join(self.tmp.name, "mkfs.slow")
+        with open(mkfs, "w") as f:
+            f.write("#!/bin/sh\nsleep 0.2\n")
+        os.chmod(mkfs, 0o755)
+        engine = CommandEngine(limits={"disk": 2})
+        self.addCleanup(engine.close)
+        threads = [threading.Thread(target=engine.stream, args=([mkfs],)) for _ in range(4)] + \
+                  [threading.Thread(target=engine.stream, args=("sleep 0.2",)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(engine.peak["disk"], 2)
+        self.assertEqual(engine.peak[None], 3)
+
+    def test_as_runner(self):
+        """Test utils.run goes through the engine with its output handling intact"""
+        seen = []
+        handler = lambda cmd, line: seen.append((cmd, line))
+        utils.add_output_handler(handler)
+        self.addCleanup(utils.remove_output_handler, handler)
+        utils.set_runner(self.engine)
+        self.addCleanup(utils.set_runner, None)
+
+        output = utils.run("echo one; echo oops >&2; echo two", silent=False)
+        self.assertEqual(output, "one\ntwo")
+        self.assertEqual(sorted(line for _, line in seen), ["one", "oops", "two"])
+        self.assertEqual(utils.run(["echo", "a b"], silent=False), "a b")
+        self.assertIn(("echo 'a b'", "a b"), seen)
+        with self.assertRaises(subprocess.CalledProcessError) as failure:
+            utils.run("echo broken; exit 3")
+        self.assertEqual((failure.exception.returncode, failure.exception.output), (3, "broken"))
+
+    def test_usage_traced(self):
+        """Test commands run by the engine keep their CPU time, I/O and peak RSS in the trace"""
+        tracer.start()
+        self.addCleanup(tracer.stop)
+        utils.set_runner(self.engine)
+        self.addCleanup(utils.set_runner, None)
+        path = os.path.join(self.tmp.name, "data")
+        cmd = f"head -c 1048576 /dev/zero > {path}"
+        utils.run(cmd)
+        span = next(s for s in reversed(tracer.spans) if s.name == cmd)
+        self.assertEqual(span.args["returncode"], 0)
+        self.assertGreaterEqual(span.args["wchar"], 1 << 20)
+        self.assertGreater(span.args["max_rss_kb"], 0)
+        self.assertIn("user", span.args)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Unit tests for filesystems module"""
+
+import os
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.filesystems import get_filesystem, write_fstab, Vfat, FSTAB_HEADER
+from arch_installer.inventory import BlockDevice
+from fakes import StubRunner
+
+def device(rotational):
+    disk = BlockDevice("sda", "8:0", 1 << 40, "disk")
+    disk.rotational = rotational
+    return disk
+
+SSD = device(False)
+HDD = device(True)
+
+class TestFilesystems(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = StubRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def test_options_follow_device(self):
+        """Test flash gets discard and TRIM, spinning disks skip them"""
+        ext4 = get_filesystem("ext4")
+        self.assertIn("discard,lazy_itable_init=0,lazy_journal_init=1", ext4.mkfs_args("u", SSD))
+        self.assertIn("nodiscard", ext4.mkfs_args("u", HDD))
+        self.assertEqual(ext4.mkfs_args("u"), ["mkfs.ext4", "-F", "-U", "u"])
+        self.assertEqual(ext4.services(SSD), ["fstrim.timer"])
+        self.assertEqual(ext4.services(HDD), [])
+
+        btrfs = get_filesystem("btrfs")
+        self.assertIn("discard=async", btrfs.mount_options(SSD))
+        self.assertIn("compress=zstd:1", btrfs.mount_options(HDD))
+        self.assertIn("-K", btrfs.mkfs_args("u", HDD))
+        self.assertEqual(btrfs.services(SSD), [])
+
+        xfs = get_filesystem("xfs")
+        self.assertEqual(xfs.mount_options(HDD), ["noatime", "logbsize=256k"])
+        self.assertEqual(xfs.packages, ["xfsprogs"])
+
+        with self.assertRaisesRegex(Exception, "zfs"):
+            get_filesystem("zfs")
+
+    def test_format_and_mount(self):
+        """Test the UUID given to mkfs is returned and install-only options stay out of fstab"""
+        ext4 = get_filesystem("ext4")
+        fs_uuid = ext4.format("/dev/sda2", SSD)
+        ext4.mount("/dev/sda2", "/mnt", SSD)
+        self.assertEqual(self.runner.commands[0],
+                         f"mkfs.ext4 -F -U {fs_uuid} -E discard,lazy_itable_init=0,lazy_journal_init=1 /dev/sda2")
+        self.assertEqual(self.runner.commands[1], "mount -o noatime,commit=60 /dev/sda2 /mnt")
+        self.assertEqual(ext4.fstab_line(fs_uuid, "/", SSD), f"UUID={fs_uuid} / ext4 noatime 0 1")
+        self.assertEqual(ext4.fstab_line(fs_uuid, "/home", SSD), f"UUID={fs_uuid} /home ext4 noatime 0 2")
+        self.assertEqual(get_filesystem("xfs").fstab_line(fs_uuid, "/var"), f"UUID={fs_uuid} /var xfs noatime 0 0")
+
+        volume_id = Vfat().format("/dev/sda1")
+        self.assertRegex(volume_id, r"^[0-9A-F]{4}-[0-9A-F]{4}$")
+        self.assertEqual(self.runner.commands[2], f"mkfs.fat -F32 -i {volume_id.replace('-', '')} /dev/sda1")
+
+    def test_write_fstab(self):
+        """Test the shipped fstab is replaced"""
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "etc"))
+            with open(os.path.join(root, "etc/fstab"), "w") as f:
+                f.write("# Static information about the filesystems.\n")
+            write_fstab(root, ["UUID=1 / ext4 noatime 0 1"])
+            with open(os.path.join(root, "etc/fstab")) as f:
+                self.assertEqual(f.read(), FSTAB_HEADER + "UUID=1 / ext4 noatime 0 1\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Unit tests for firmware module"""
+
+import os
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.firmware import FirmwareSelection, firmware_package, modinfo_firmware
+from fakes import FakeSysfs
+
+# modinfo -F firmware output recorded on a ThinkPad, trimmed
+MODINFO = {
+    "i915": ["i915/mtl_gsc_1.bin", "i915/tgl_guc_70.bin", "i915/tgl_huc.bin", "i915/tgl_dmc.bin"],
+    "iwlwifi": ["iwlwifi-QuZ-a0-hr-b0-77.ucode", "iwlwifi-so-a0-gf-a0.pnvm"],
+    "iwlmvm": [],
+    "r8169": ["rtl_nic/rtl8168h-2.fw", "rtl_nic/rtl8125b-2.fw"],
+    "btusb": [],
+    "btintel": ["intel/ibt-19-0-4.sfi", "intel/ibt-19-0-4.ddc"],
+    "snd_hda_intel": [],
+    "nvme": [],
+    "amdgpu": ["amdgpu/dcn_3_1_4_dmcub.bin", "amdgpu/psp_13_0_4_toc.bin"],
+}
+
+# pacman -Si for the split firmware, recorded against a mirror, trimmed
+PACMAN_SI = {
+    "linux-firmware": ("Name            : linux-firmware\n"
+                       "Depends On      : linux-firmware-whence  linux-firmware-amdgpu  linux-firmware-intel  "
+                       "linux-firmware-nvidia  linux-firmware-other  linux-firmware-realtek\n"
+                       "Download Size   : 1.97 KiB\nInstalled Size  : 0.00 B\n"),
+    "linux-firmware-amdgpu": "Name            : linux-firmware-amdgpu\nDownload Size   : 24.21 MiB\n"
+                             "Installed Size  : 27.05 MiB\n",
+    "linux-firmware-intel": "Name            : linux-firmware-intel\nDownload Size   : 45.09 MiB\n"
+                            "Installed Size  : 50.71 MiB\n",
+    "linux-firmware-nvidia": "Name            : linux-firmware-nvidia\nDownload Size   : 81.37 MiB\n"
+                             "Installed Size  : 88.26 MiB\n",
+    "linux-firmware-other": "Name            : linux-firmware-other\nDownload Size   : 95.30 MiB\n"
+                            "Installed Size  : 115.09 MiB\n",
+    "linux-firmware-realtek": "Name            : linux-firmware-realtek\nDownload Size   : 5.81 MiB\n"
+                              "Installed Size  : 6.39 MiB\n",
+    "linux-firmware-whence": "Name            : linux-firmware-whence\nDownload Size   : 44.55 KiB\n"
+                             "Installed Size  : 191.61 KiB\n",
+}
+
+def recorded_modinfo(modules):
+    return [path for module in modules for path in MODINFO[module]]
+
+class RecordingRunner:
+    """Answer modinfo and pacman -Si from the recordings"""
+
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, cmd):
+        self.commands.append(cmd)
+        args = cmd.split()
+        if args[0] == "modinfo":
+            return 0, "\n".join(recorded_modinfo(args[3:]))
+        if args[:2] == ["pacman", "-Si"]:
+            return 0, "\n".join(PACMAN_SI[pkg] for pkg in args[2:])
+        return 127, ""
+
+class TestFirmwareSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fake = FakeSysfs(self.tmp.name)
+        self.modules_dir = os.path.join(self.tmp.name, "modules")
+        os.makedirs(self.modules_dir)
+        with open(os.path.join(self.modules_dir, "modules.alias"), "w") as f:
+            f.write("alias pci:v00001002d*sv*sd*bc03sc*i* amdgpu\n"
+                    "alias usb:v8087p0026d*dc*dsc*dp*ic*isc*ip*in* btusb\n")
+        self.runner = RecordingRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def laptop(self):
+        self.fake.pci("0000:00:02.0", "0x8086", "0x030000", driver="i915", module="i915")
+        self.fake.pci("0000:00:14.3", "0x8086", "0x028000", driver="iwlwifi", module="iwlwifi")
+        self.fake.pci("0000:00:1f.3", "0x8086", "0x040380", driver="snd_hda_intel", module="snd_hda_intel")
+        self.fake.pci("0000:03:00.0", "0x10ec", "0x020000", driver="r8169", module="r8169")
+        self.fake.pci("0000:04:00.0", "0x144d", "0x010802", driver="nvme", module="nvme")
+        # Host bridges have no driver and need no firmware
+        self.fake.pci("0000:00:00.0", "0x8086", "0x060000")
+        self.fake.usb("3-10:1.0", "usb:v8087p0026d0002dcE0dsc01dp01icE0isc01ip01in00", "e0",
+                      driver="btusb", module="btusb")
+        self.fake.modules(["i915", "iwlmvm", "iwlwifi", "snd_hda_intel", "r8169", "nvme", "btusb", "btintel"])
+
+    def detect(self, modinfo=recorded_modinfo):
+        return FirmwareSelection.detect(self.fake.sysfs, self.fake.procfs, self.modules_dir, modinfo)
+
+    def test_laptop(self):
+        """Test bound drivers and loaded helpers map to the intel and realtek packages"""
+        self.laptop()
+        selection = self.detect()
+
+        self.assertEqual(selection.packages, ["linux-firmware-intel", "linux-firmware-realtek"])
+        self.assertIn("intel/ibt-19-0-4.sfi", selection.files)
+        self.assertEqual(selection.replace(["base", "linux-firmware", "sudo"]),
+                         ["base", "linux-firmware-intel", "linux-firmware-realtek", "sudo"])
+
+    def test_unbound_device_from_aliases(self):
+        """Test an unbound GPU is matched through modules.alias"""
+        self.fake.pci("0000:c1:00.0", "0x1002", "0x030000", device="0x15bf")
+        selection = self.detect()
+        self.assertEqual(selection.packages, ["linux-firmware-amdgpu"])
+
+    def test_builtin_driver(self):
+        """Test a driver built into the kernel is looked up in modules.builtin.modinfo"""
+        with open(os.path.join(self.modules_dir, "modules.builtin.modinfo"), "wb") as f:
+            f.write(b"r8169.license=GPL\0r8169.firmware=rtl_nic/rtl8168h-2.fw\0virtio_pci.license=GPL\0")
+        self.fake.pci("0000:03:00.0", "0x10ec", "0x020000", driver="r8169")
+        self.fake.pci("0000:00:04.0", "0x1af4", "0x020000", driver="virtio-pci")
+        selection = self.detect()
+        self.assertEqual((selection.packages, selection.files), (["linux-firmware-realtek"], ["rtl_nic/rtl8168h-2.fw"]))
+
+    def test_unknown_device_keeps_everything(self):
+        """Test a network card without any known module falls back to the full package"""
+        self.laptop()
+        self.fake.pci("0000:05:00.0", "0x1d6a", "0x020000", device="0x07b1")
+        selection = self.detect()
+
+        self.assertTrue(selection.full)
+        self.assertEqual(selection.unknown, ["0000:05:00.0"])
+        self.assertEqual(selection.replace(["linux-firmware"]), ["linux-firmware"])
+        self.assertEqual(selection.report(), "Firmware: full linux-firmware, unknown: 0000:05:00.0")
+
+    def test_modinfo_failure_keeps_everything(self):
+        """Test a failed modinfo falls back to the full package"""
+        self.laptop()
+        self.runner = lambda cmd: (1, "modinfo: ERROR: Module iwlmvm not found.")
+        utils.set_runner(self.runner)
+        self.assertTrue(FirmwareSelection.detect(self.fake.sysfs, self.fake.procfs, self.modules_dir).full)
+
+    def test_modinfo_output(self):
+        """Test every module is asked about in a single modinfo call"""
+        files = modinfo_firmware({"r8169", "btintel"})
+        self.assertEqual(self.runner.commands, ["modinfo -F firmware btintel r8169"])
+        self.assertEqual(files, ["intel/ibt-19-0-4.sfi", "intel/ibt-19-0-4.ddc",
+                                 "rtl_nic/rtl8168h-2.fw", "rtl_nic/rtl8125b-2.fw"])
+
+    def test_savings(self):
+        """Test the saving is the meta package's dependencies minus the selection"""
+        self.laptop()
+        download, installed = self.detect().savings()
+        # amdgpu, nvidia, other, whence and the meta package itself
+        self.assertAlmostEqual(download / (1 << 20), 24.21 + 81.37 + 95.30 + (44.55 + 1.97) / 1024, places=2)
+        self.assertAlmostEqual(installed / (1 << 20), 27.05 + 88.26 + 115.09 + 191.61 / 1024, places=2)
+        self.assertIn("saving 200.", self.detect().report())
+
+    def test_package_mapping(self):
+        """Test firmware paths map to the split package shipping them"""
+        self.assertEqual(firmware_package("iwlwifi-cc-a0-77.ucode"), "linux-firmware-intel")
+        self.assertEqual(firmware_package("rtw89/rtw8852b_fw-1.bin"), "linux-firmware-realtek")
+        self.assertEqual(firmware_package("mt7921/WIFI_RAM_CODE_MT7961_1.bin"), "linux-firmware-other")
+        self.assertEqual(firmware_package("mediatek/WIFI_RAM_CODE_MT7961_1.bin"), "linux-firmware-mediatek")
+
+if __name__ == '__main__':
+    unittest.main()
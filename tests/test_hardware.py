@@ -0,0 +1,88 @@
+"""Unit tests for hardware module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from arch_installer.config import validate_config
+from arch_installer.hardware import HardwareProfile, cpu_vendor
+from fakes import FakeSysfs
+
+GIB = 1 << 30
+
+class TestHardwareProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fake = FakeSysfs(self.tmp.name)
+
+    def probe(self):
+        self.fake.save()
+        return HardwareProfile.probe(self.fake.sysfs, self.fake.procfs)
+
+    def test_workstation(self):
+        """Test a hybrid graphics workstation preselects the discrete card's driver"""
+        self.fake.cpu("GenuineIntel", threads=8)
+        self.fake.memory(32 * 1024)
+        self.fake.efi()
+        self.fake.pci("0000:00:02.0", "0x8086", "0x030000", driver="i915")
+        self.fake.pci("0000:01:00.0", "0x10de", "0x030200")
+        self.fake.pci("0000:02:00.0", "0x8086", "0x028000", driver="iwlwifi")
+        self.fake.pci("0000:00:1f.0", "0x8086", "0x060100")
+        self.fake.disk("nvme0n1", 512 * GIB, bus="nvme", major=259)
+        self.fake.disk("sda", 1000 * GIB, rotational=True)
+
+        profile = self.probe()
+        self.assertEqual((profile.cpu, profile.microcode, profile.efi), ("intel", "intel", True))
+        self.assertEqual([gpu.driver for gpu in profile.gpus], ["i915", None])
+        self.assertEqual([nic.driver for nic in profile.nics], ["iwlwifi"])
+        self.assertEqual(profile.defaults(), {'kernel': "linux", 'gpu': "nvidia"})
+        self.assertEqual(profile.swap_mb(), 16 * 1024)
+        self.assertTrue(profile.disk("/dev/sda").rotational)
+        self.assertEqual([d.name for d in profile.disks], ["nvme0n1", "sda"])
+        with self.assertRaises(AttributeError):
+            profile.gpu = "amd"
+
+    def test_virtual_machine(self):
+        """Test paravirtual devices pick the LTS kernel and BIOS is reported"""
+        self.fake.cpu("AuthenticAMD")
+        self.fake.memory(2048)
+        self.fake.pci("0000:00:01.0", "0x1234", "0x030000", driver="bochs-drm")
+        self.fake.pci("0000:00:03.0", "0x1af4", "0x020000", driver="virtio-pci")
+
+        profile = self.probe()
+        self.assertEqual(profile.defaults(), {'kernel': "linux-lts", 'gpu': "None"})
+        self.assertEqual((profile.microcode, profile.efi), ("amd", False))
+
+    def test_missing_sources(self):
+        """Test an empty tree gives an empty profile instead of an error"""
+        profile = self.probe()
+        self.assertEqual(profile, HardwareProfile(None, (), (), 0, False, ()))
+        self.assertIsNone(profile.swap_mb())
+
+    def test_cpuinfo_read_until_vendor(self):
+        """Test only the start of a huge cpuinfo is read"""
+        path = os.path.join(self.tmp.name, "cpuinfo")
+        with open(path, "wb") as f:
+            f.write(b"processor\t: 0\nvendor_id\t: AuthenticAMD\n" + b"x" * (1 << 20) + b"\xff\xfe\n")
+        # Decoding past the first buffer would hit the invalid bytes
+        self.assertEqual(cpu_vendor(path), "amd")
+
+    def test_detect_probes_once(self):
+        """Test detect caches the profile per tree"""
+        self.fake.save()
+        with patch.object(HardwareProfile, "_cache", {}):
+            with patch.object(HardwareProfile, "probe", wraps=HardwareProfile.probe) as probe:
+                first = HardwareProfile.detect(self.fake.sysfs, self.fake.procfs)
+                self.assertIs(HardwareProfile.detect(self.fake.sysfs, self.fake.procfs), first)
+        self.assertEqual(probe.call_count, 1)
+
+    def test_config_preselection(self):
+        """Test detected values fill in only what the config leaves out"""
+        detected = {'kernel': "linux-lts", 'gpu': "amd"}
+        config = validate_config({'disk': "/dev/sda", 'rootpass': "x", 'gpu': "None"}, ["/dev/sda"], detected)
+        self.assertEqual((config['kernel'], config['gpu']), ("linux-lts", "None"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""End-to-end tests for unattended installs with a stubbed command runner"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from arch_installer import utils
+from arch_installer.__main__ import main
+from fakes import StubRunner, HARDWARE
+
+CONFIG = """# unattended test config
+disk: "/dev/vda"
+username: "archuser"
+userpass: "userpass"
+rootpass: "rootpass"
+kernel: "linux"
+gpu: "None"
+wmde: "None"
+bootloader: "systemd-boot"
+swap: "swapfile"
+swap_size_mb: 1
+cache_dir: "{tmp}/cache"
+target: "{tmp}/mnt"
+trace_file: "{tmp}/trace.json"
+"""
+
+class TestHeadlessInstall(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp.name, "config.yaml")
+        self.target = os.path.join(self.tmp.name, "mnt")
+        self.write_config(CONFIG.format(tmp=self.tmp.name))
+
+        patches = [
+            patch('arch_installer.installer.HardwareProfile.detect', return_value=HARDWARE),
+            patch('arch_installer.disk.DiskManager.list_disks', return_value=["/dev/vda (20G)"]),
+            patch('arch_installer.packages.PackageManager.optimize_mirrorlist'),
+            patch('arch_installer.prefetch.Prefetcher.write_pacman_conf', return_value="pacman.conf"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(utils.set_runner, None)
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_config(self, text):
+        with open(self.config_path, "w") as f:
+            f.write(text)
+
+    def install(self, runner):
+        utils.set_runner(runner)
+        out = io.StringIO()
+        with redirect_stdout(out), self.assertRaises(SystemExit) as exit_code:
+            main(["--config", self.config_path])
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        return exit_code.exception.code, events
+
+    def test_full_install(self):
+        """Test the unattended path runs every step without curses"""
+        runner = StubRunner()
+        code, events = self.install(runner)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(events[-1]["event"], "success")
+        self.assertIn({"event": "package", "package": "base", "status": "done"},
+                      [{k: v for k, v in e.items() if k != "time"} for e in events])
+        config_event = next(e for e in events if e["event"] == "config")
+        self.assertEqual(config_event["config"]["rootpass"], "***")
+
+        self.assertLess(runner.index("^sfdisk .*/dev/vda <<"), runner.index("mkfs.ext4"))
+        self.assertLess(runner.index("mkfs.ext4"), runner.index("^pacstrap -K"))
+        self.assertLess(runner.index("^pacstrap -K"), runner.index("chpasswd"))
+        self.assertEqual(runner.count(f"(?s)^chroot {self.target} .*useradd -m -G wheel -s /bin/bash archuser"), 1)
+        # The chroot is set up once for all steps and torn down at the end
+        self.assertEqual(runner.count(f"^mount -t proc .* {self.target}/proc$"), 1)
+        self.assertGreater(runner.index(f"^umount {self.target}/proc$"), runner.index("chpasswd"))
+        self.assertNotIn("reboot", runner.commands)
+
+        # Steps that write files directly did so below the target root
+        with open(os.path.join(self.target, "etc/fstab")) as f:
+            root_uuid = f.read().split("UUID=")[1].split()[0]
+        with open(os.path.join(self.target, "boot/loader/entries/arch.conf")) as f:
+            self.assertIn(f"root=UUID={root_uuid} rw rootfstype=ext4", f.read())
+        with open(os.path.join(self.target, "etc/locale.gen")) as f:
+            self.assertIn("\nen_US.UTF-8 UTF-8", "\n" + f.read())
+        self.assertEqual(os.path.getsize(os.path.join(self.target, "swapfile")), 1 << 20)
+        with open(os.path.join(self.target, "etc/fstab")) as f:
+            fstab = [line.split() for line in f if not line.startswith("#")]
+        self.assertEqual([(entry[1], entry[2]) for entry in fstab],
+                         [("/", "ext4"), ("/boot", "vfat"), ("none", "swap")])
+        self.assertEqual(runner.count(f"^mkfs.ext4 -F -U {fstab[0][0][len('UUID='):]} .*/dev/vda2$"), 1)
+
+        # Hooks are masked while packages go in, then every image is built once
+        self.assertEqual(runner.count(f"^pacstrap .*--hookdir {self.target}/etc/pacman.d/hooks"),
+                         runner.count("^pacstrap"))
+        self.assertEqual(runner.count("(?s)^chroot .*libalpm/scripts/mkinitcpio install"), 1)
+        self.assertGreater(runner.index("(?s)mkinitcpio install"), runner.index("^pacstrap -K"))
+        self.assertEqual(os.listdir(os.path.join(self.target, "etc/pacman.d/hooks")), [])
+        self.assertTrue(os.path.exists(os.path.join(self.target, "boot/initramfs-linux.img")))
+
+        # Every step shows up on the timeline
+        with open(os.path.join(self.tmp.name, "trace.json")) as f:
+            names = {e["name"] for e in json.load(f)["traceEvents"] if e.get("cat") == "step"}
+        self.assertTrue({"partition", "format", "packages", "passwords"} <= names)
+
+    def test_grub(self):
+        """Test GRUB comes in with the other packages and its config is written without probing"""
+        self.write_config(CONFIG.format(tmp=self.tmp.name).replace('"systemd-boot"', '"grub"'))
+        runner = StubRunner()
+        code, events = self.install(runner)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(runner.count("^pacstrap -K .* grub efibootmgr"), 1)
+        self.assertEqual(runner.count("(?s)^chroot .*(pacman -S|grub-mkconfig)"), 0)
+        with open(os.path.join(self.target, "boot/grub/grub.cfg")) as f:
+            self.assertIn("search --no-floppy --fs-uuid --set=root ", f.read())
+
+    @unittest.skipUnless(shutil.which("zstd"), "needs zstd")
+    def test_golden_image(self):
+        """Test the first install captures an image and the next one deploys it without pacstrap"""
+        image = os.path.join(self.tmp.name, "image")
+        self.write_config(CONFIG.format(tmp=self.tmp.name) + f'image: "{image}"\n')
+        code, events = self.install(StubRunner())
+        self.assertEqual(code, 0)
+        self.assertTrue(os.path.exists(os.path.join(image, "manifest.json")))
+
+        shutil.rmtree(self.target)
+        runner = StubRunner()
+        code, events = self.install(runner)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(runner.count("^pacstrap"), 0)
+        self.assertEqual(runner.count("^pacman -S[ypw]* "), 0)
+        self.assertEqual(runner.count("(?s)useradd"), 1)
+        with open(os.path.join(self.target, "etc/locale.gen")) as f:
+            self.assertIn("\nen_US.UTF-8 UTF-8", "\n" + f.read())
+        self.assertTrue(os.path.exists(os.path.join(self.target, "boot/loader/entries/arch.conf")))
+
+    def test_invalid_config_touches_nothing(self):
+        """Test validation errors are reported before any command runs"""
+        self.write_config('disk: "/dev/sdz"\nkernel: "linux-rt"\nrootpass: "it\'s"\n')
+        runner = StubRunner()
+        code, events = self.install(runner)
+
+        self.assertEqual(code, 1)
+        self.assertEqual(runner.commands, [])
+        message = events[-1]["message"]
+        for problem in ("/dev/sdz", "kernel", "single quotes"):
+            self.assertIn(problem, message)
+
+    def test_failed_step_exit_code(self):
+        """Test a failing command ends the run with an error event"""
+        code, events = self.install(StubRunner(fail_on="mkfs.ext4"))
+
+        self.assertEqual(code, 1)
+        self.assertEqual(events[-1]["event"], "error")
+        self.assertIn("mkfs.ext4", events[-1]["message"])
+
+if __name__ == '__main__':
+    unittest.main()
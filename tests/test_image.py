@@ -0,0 +1,87 @@
+"""Unit tests for image module"""
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from arch_installer.image import GoldenImage
+
+PKGS = ["base", "linux", "sudo"]
+
+@unittest.skipUnless(shutil.which("zstd") and shutil.which("tar"), "needs zstd and tar")
+class TestGoldenImage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "root")
+        self.write("etc/hostname", "golden\n")
+        self.write("usr/bin/tool", "#!/bin/sh\n", mode=0o4755)
+        self.write("boot/vmlinuz-linux", "kernel")
+        self.write("etc/machine-id", "0123456789abcdef\n")
+        self.write("swapfile", "\0" * 4096)
+        os.symlink("usr/bin", os.path.join(self.root, "bin"))
+        self.image = GoldenImage(os.path.join(self.tmp.name, "image"))
+
+    def write(self, name, content, mode=0o644):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, mode)
+
+    def test_capture_and_deploy(self):
+        """Test a deployed root matches the captured one, minus machine specific files"""
+        manifest = self.image.capture(self.root, PKGS)
+        self.assertTrue(self.image.matches(reversed(PKGS)))
+        self.assertFalse(self.image.matches(PKGS + ["vim"]))
+        self.assertEqual(set(manifest["parts"]), {"root", "boot"})
+
+        target = os.path.join(self.tmp.name, "target")
+        self.image.deploy(target)
+        with open(os.path.join(target, "etc/hostname")) as f:
+            self.assertEqual(f.read(), "golden\n")
+        with open(os.path.join(target, "boot/vmlinuz-linux")) as f:
+            self.assertEqual(f.read(), "kernel")
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(target, "usr/bin/tool")).st_mode), 0o4755)
+        self.assertEqual(os.readlink(os.path.join(target, "bin")), "usr/bin")
+        self.assertFalse(os.path.exists(os.path.join(target, "etc/machine-id")))
+        self.assertFalse(os.path.exists(os.path.join(target, "swapfile")))
+
+    def test_part_per_filesystem(self):
+        """Test each filesystem of a layout is its own part, without the ones mounted below it"""
+        self.write("var/lib/pacman/local/ALPM_DB_VERSION", "9\n")
+        self.write("var/log/pacman.log", "log\n")
+        self.write("home/user/notes", "notes\n")
+        image = GoldenImage(os.path.join(self.tmp.name, "layout"), mountpoints=["/", "/boot", "/home", "/var"])
+        manifest = image.capture(self.root, PKGS)
+        self.assertEqual(set(manifest["parts"]), {"root", "boot", "home", "var"})
+        self.assertTrue(image.matches_layout())
+        self.assertFalse(GoldenImage(image.path).matches_layout())
+
+        target = os.path.join(self.tmp.name, "target")
+        image.deploy(target)
+        with open(os.path.join(target, "var/lib/pacman/local/ALPM_DB_VERSION")) as f:
+            self.assertEqual(f.read(), "9\n")
+        with open(os.path.join(target, "home/user/notes")) as f:
+            self.assertEqual(f.read(), "notes\n")
+        self.assertFalse(os.path.exists(os.path.join(target, "var/log/pacman.log")))
+        root_part = next(part for part in image.parts if part.name == "root")
+        self.assertIn("--exclude=./var/*", root_part.create_args)
+
+    def test_corrupt_image_rejected(self):
+        """Test a damaged archive fails the deploy"""
+        manifest = self.image.capture(self.root, PKGS)
+        path = os.path.join(self.image.path, manifest["parts"]["root"]["file"])
+        with open(path, "r+b") as f:
+            f.seek(os.path.getsize(path) // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xff]))
+
+        with self.assertRaisesRegex(Exception, "root.tar.zst"):
+            self.image.deploy(os.path.join(self.tmp.name, "target"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Unit tests for initramfs module"""
+
+import os
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.chroot import ChrootSession
+from arch_installer.initramfs import InitramfsBuilder, DEFERRED_HOOKS, DROP_IN_PATH, PRESET_TEMPLATE
+from arch_installer.packages import PackageManager
+from fakes import StubRunner
+
+TEMPLATE = """ALL_kver="/boot/vmlinuz-%PKGBASE%"
+PRESETS=('default' 'fallback')
+default_image="/boot/initramfs-%PKGBASE%.img"
+fallback_image="/boot/initramfs-%PKGBASE%-fallback.img"
+"""
+
+class FakeUI:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+class TestInitramfsBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "mnt")
+        path = os.path.join(self.root, PRESET_TEMPLATE)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(TEMPLATE)
+        self.runner = StubRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def install(self, builder):
+        """Packages in two transactions, as the installer does, then the build step"""
+        manager = PackageManager(self.root)
+        manager.options = builder.pacman_options()
+        builder.prepare()
+        builder.watch()
+        try:
+            manager.install_packages(FakeUI(), ["base", "linux", "linux-lts", "linux-firmware", "amd-ucode"])
+            manager.install_packages(FakeUI(), ["nvidia-dkms"])
+            with ChrootSession(self.root) as chroot:
+                builder.build(chroot)
+        finally:
+            builder.unwatch()
+
+    def test_deferred_builds_once(self):
+        """Test masked hooks leave one build of each image for the end"""
+        builder = InitramfsBuilder(self.root)
+        self.install(builder)
+
+        self.assertEqual(builder.images, 4)
+        self.assertEqual(self.runner.count("(?s)^chroot .*mkinitcpio install"), 1)
+        self.assertEqual(builder.masked(), [])
+        self.assertTrue(builder.built())
+        self.assertTrue(os.path.exists(os.path.join(self.root, "boot/initramfs-linux-lts-fallback.img")))
+
+    def test_per_transaction_builds(self):
+        """Test without defer every transaction touching a kernel rebuilds every image"""
+        builder = InitramfsBuilder(self.root, defer=False)
+        self.install(builder)
+
+        self.assertEqual(builder.images, 8)
+        self.assertEqual(self.runner.count("--hookdir"), 0)
+        self.assertEqual(self.runner.count("(?s)^chroot .*mkinitcpio install"), 0)
+
+    def test_no_fallback(self):
+        """Test dropping the fallback image halves the builds"""
+        builder = InitramfsBuilder(self.root, compression="lz4", fallback=False)
+        self.install(builder)
+
+        self.assertEqual(builder.images, 2)
+        with open(os.path.join(self.root, "etc/mkinitcpio.d/linux.preset")) as f:
+            self.assertIn("PRESETS=('default')\n", f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.root, "boot/initramfs-linux-fallback.img")))
+        with open(os.path.join(self.root, DROP_IN_PATH)) as f:
+            self.assertEqual(f.read(), 'COMPRESSION="lz4"\n')
+
+    def test_compression_profile(self):
+        """Test the zstd level goes into the mkinitcpio drop-in"""
+        self.assertEqual(InitramfsBuilder(level=1).drop_in(),
+                         'COMPRESSION="zstd"\nCOMPRESSION_OPTIONS=(-1 -T0)\n')
+        self.assertEqual(InitramfsBuilder(compression="gzip", level=6).drop_in(),
+                         'COMPRESSION="gzip"\nCOMPRESSION_OPTIONS=(-6)\n')
+
+    def test_prepare_masks_hooks(self):
+        """Test every deferred hook is overridden by a /dev/null link"""
+        builder = InitramfsBuilder(self.root)
+        builder.prepare()
+        self.assertEqual(builder.masked(), DEFERRED_HOOKS)
+        self.assertFalse(builder.built())
+        builder.unmask()
+        self.assertTrue(builder.built())
+
+if __name__ == '__main__':
+    unittest.main()
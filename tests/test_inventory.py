@@ -0,0 +1,109 @@
+"""Unit tests for inventory module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from arch_installer.inventory import Inventory, human_size
+from fakes import FakeSysfs
+
+GIB = 1 << 30
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fake = FakeSysfs(self.tmp.name)
+
+    def scan(self):
+        self.fake.save()
+        return Inventory.scan(**self.fake.paths())
+
+    def test_devices(self):
+        """Test sizes, flags, transport, model and partitions come from sysfs"""
+        self.fake.disk("sda", 1000 * GIB, rotational=True, model="WDC WD10EZEX")
+        for number in (1, 2, 10):
+            self.fake.partition("sda", number, GIB)
+        self.fake.disk("nvme0n1", 512 * GIB, bus="nvme", major=259)
+        self.fake.partition("nvme0n1", 1, GIB, major=259)
+        self.fake.disk("sdb", 32 * GIB, bus="usb")
+        self.fake.disk("vda", 20 * GIB, bus="virtio", major=253)
+        self.fake.disk("loop0", GIB, bus=None, major=7, kind="loop")
+        self.fake.disk("zram0", GIB, bus=None, major=252)
+        self.fake.disk("dm-0", GIB, bus=None, major=254, kind="dm")
+
+        inventory = self.scan()
+        self.assertEqual([d.name for d in inventory.disks()], ["nvme0n1", "sda", "sdb", "vda"])
+        sda = inventory.get("/dev/sda")
+        self.assertEqual(sda.size, 1000 * GIB)
+        self.assertTrue(sda.rotational)
+        self.assertEqual(sda.model, "WDC WD10EZEX")
+        self.assertEqual([p.name for p in sda.partitions], ["sda1", "sda2", "sda10"])
+        self.assertEqual(inventory.get("sda10").parent, "sda")
+        self.assertEqual({d.name: d.transport for d in inventory.disks()},
+                         {"nvme0n1": "nvme", "sda": "sata", "sdb": "usb", "vda": "virtio"})
+        self.assertTrue(inventory.get("sdb").removable)
+        self.assertEqual(inventory.get("nvme0n1p1").parent, "nvme0n1")
+        self.assertIsNone(inventory.get("/dev/sdz"))
+
+    def test_exact_matching(self):
+        """Test a mount on /dev/sdaa or /dev/nvme0n10 does not count for sda or nvme0n1"""
+        self.fake.disk("sda", GIB)
+        self.fake.disk("sdaa", GIB)
+        self.fake.mount(self.fake.partition("sdaa", 1, GIB), "/data", "/dev/sdaa1")
+        self.fake.disk("nvme0n1", GIB, bus="nvme", major=259)
+        nvme = self.fake.disk("nvme0n10", GIB, bus="nvme", major=259)
+        self.fake.mount(nvme, "/srv", "/dev/nvme0n10")
+
+        inventory = self.scan()
+        self.assertFalse(inventory.is_mounted("/dev/sda"))
+        self.assertTrue(inventory.is_mounted("/dev/sdaa"))
+        self.assertFalse(inventory.is_mounted("/dev/nvme0n1"))
+        self.assertEqual(inventory.mountpoints("/dev/nvme0n10"), ["/srv"])
+
+    def test_mountpoints_through_holders(self):
+        """Test mounts on partitions, LVM volumes and btrfs subvolumes belong to the disk"""
+        self.fake.disk("sda", 100 * GIB)
+        efi = self.fake.partition("sda", 1, GIB)
+        self.fake.partition("sda", 2, 99 * GIB)
+        self.fake.partition("sda", 3, GIB)
+        lvm = self.fake.disk("dm-0", 99 * GIB, bus=None, major=254, kind="dm")
+        self.fake.write(os.path.join(self.fake.sysfs, "block/dm-0/dm/name"), "vg-root")
+        self.fake.holder("dm-0", "sda", "sda2")
+        self.fake.mount(lvm, "/mnt", "/dev/mapper/vg-root")
+        self.fake.mount(efi, "/mnt/boot", "/dev/sda1", fstype="vfat")
+        self.fake.mount("0:45", "/mnt/données dir", "/dev/mapper/vg-root", fstype="btrfs")
+        self.fake.swap_devices.append("/dev/sda3")
+
+        inventory = self.scan()
+        self.assertEqual(inventory.get("sda2").holders, ["dm-0"])
+        self.assertEqual(inventory.mountpoints("/dev/sda"), ["/mnt/boot", "/mnt/données dir", "/mnt"])
+        self.assertEqual([d.name for d in inventory.swap_devices("sda")], ["sda3"])
+        self.assertTrue(inventory.is_mounted("sda"))
+
+    def test_many_devices(self):
+        """Test a JBOD host is read once and queried without touching sysfs again"""
+        for i in range(120):
+            name = f"sd{chr(97 + i // 26)}{chr(97 + i % 26)}"
+            devno = self.fake.disk(name, 4000 * GIB, rotational=True, major=8 + i // 16)
+            for number in range(1, 4):
+                self.fake.partition(name, number, GIB, major=8 + i // 16)
+            if i % 2:
+                self.fake.mount(devno, f"/srv/{name}", f"/dev/{name}")
+
+        inventory = self.scan()
+        with patch('builtins.open', side_effect=AssertionError("read after scan")), \
+                patch('os.scandir', side_effect=AssertionError("read after scan")):
+            self.assertEqual(len(inventory.disks()), 120)
+            mounted = [d.name for d in inventory.disks() if inventory.is_mounted(d.path)]
+        self.assertEqual(len(mounted), 60)
+
+    def test_human_size(self):
+        """Test sizes print like lsblk"""
+        self.assertEqual(human_size(20 * GIB), "20G")
+        self.assertEqual(human_size(1000 * 1000 ** 3), "931.3G")
+        self.assertEqual(human_size(512), "512B")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Tests for resuming interrupted installs from the step journal"""
+
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from arch_installer import utils
+from arch_installer.__main__ import main
+from arch_installer.installer import Installer
+from arch_installer.journal import StepJournal, JOURNAL_PATH
+from arch_installer.scheduler import StepScheduler
+from arch_installer.ui.headless import HeadlessUI
+from fakes import StubRunner, HARDWARE
+
+CONFIG = """disk: "/dev/vda"
+username: "archuser"
+userpass: "userpass"
+rootpass: "rootpass"
+bootloader: "systemd-boot"
+swap: "swapfile"
+swap_size_mb: 1
+cache_dir: "{tmp}/cache"
+target: "{tmp}/mnt"
+trace_file: "{tmp}/trace.json"
+"""
+
+# Runs an install in a child process that kills itself once the bootloader is reached
+CRASHING_INSTALL = """
+import os, signal, sys
+from unittest.mock import patch
+from arch_installer import utils
+from arch_installer.__main__ import main
+from fakes import StubRunner, HARDWARE
+
+class CrashingRunner(StubRunner):
+    def __call__(self, cmd):
+        if "bootctl install" in cmd:
+            os.kill(os.getpid(), signal.SIGKILL)
+        return super().__call__(cmd)
+
+with patch('arch_installer.installer.HardwareProfile.detect', return_value=HARDWARE), \\
+        patch('arch_installer.disk.DiskManager.list_disks', return_value=["/dev/vda (20G)"]), \\
+        patch('arch_installer.packages.PackageManager.optimize_mirrorlist'), \\
+        patch('arch_installer.prefetch.Prefetcher.write_pacman_conf', return_value="pacman.conf"):
+    utils.set_runner(CrashingRunner())
+    main(["--config", sys.argv[1]])
+"""
+
+class TestStepJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, JOURNAL_PATH)
+
+    def test_other_configuration_ignored(self):
+        """Test a journal is only used for the configuration that wrote it"""
+        journal = StepJournal(StepJournal.config_key({'disk': "/dev/vda", 'rootpass': "a"}))
+        journal.attach(self.path)
+        journal.record("partition", {}, {"root_partition": "/dev/vda2"})
+
+        same = StepJournal.config_key({'disk': "/dev/vda", 'rootpass': "b", 'trace_file': "x"})
+        self.assertEqual(StepJournal.load(self.path, same).completed("partition", {}),
+                         {"root_partition": "/dev/vda2"})
+        self.assertIsNone(StepJournal.load(self.path, StepJournal.config_key({'disk': "/dev/vdb"})))
+        with open(self.path) as f:
+            self.assertNotIn("rootpass", f.read())
+
+    def test_rerun_propagates_downstream(self):
+        """Test steps after one that has to run again are not skipped"""
+        journal = StepJournal("key", self.path)
+        calls = []
+
+        def build(verify_b):
+            scheduler = StepScheduler(journal=journal)
+            scheduler.add("a", lambda inputs: calls.append("a") or 1, outputs=["x"])
+            scheduler.add("b", lambda inputs: calls.append("b") or inputs['x'] + 1,
+                          inputs=["x"], outputs=["y"], verify=lambda inputs: verify_b)
+            scheduler.add("c", lambda inputs: calls.append("c") or inputs['y'] + 1,
+                          inputs=["y"], outputs=["z"])
+            return scheduler
+
+        self.assertEqual(build(True).run()["z"], 3)
+        self.assertEqual(calls, ["a", "b", "c"])
+
+        calls.clear()
+        self.assertEqual(build(True).run()["z"], 3)
+        self.assertEqual(calls, [])
+
+        calls.clear()
+        build(False).run()
+        self.assertEqual(calls, ["b", "c"])
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config_path = os.path.join(self.tmp.name, "config.yaml")
+        with open(self.config_path, "w") as f:
+            f.write(CONFIG.format(tmp=self.tmp.name))
+        self.target = os.path.join(self.tmp.name, "mnt")
+
+        patches = [
+            patch('arch_installer.installer.HardwareProfile.detect', return_value=HARDWARE),
+            patch('arch_installer.disk.DiskManager.list_disks', return_value=["/dev/vda (20G)"]),
+            patch('arch_installer.packages.PackageManager.optimize_mirrorlist'),
+            patch('arch_installer.prefetch.Prefetcher.write_pacman_conf', return_value="pacman.conf"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(utils.set_runner, None)
+
+    def test_packages_present_without_kernel(self):
+        """Test a finished package step is recognised when no kernel was chosen"""
+        target = os.path.join(self.tmp.name, "mnt")
+        os.makedirs(os.path.join(target, "var/lib/pacman/local/base-3-2"))
+        installer = Installer(ui=HeadlessUI(io.StringIO()), target=target)
+        installer.config = {'kernel': "None"}
+        self.assertTrue(installer._packages_present())
+        installer.config = {'kernel': "linux-lts"}
+        self.assertFalse(installer._packages_present())
+        os.makedirs(os.path.join(target, "var/lib/pacman/local/linux-lts-6.6.30-1"))
+        self.assertTrue(installer._packages_present())
+
+    def test_resume_after_kill(self):
+        """Test an install killed at the bootloader resumes there without touching the disk again"""
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.join(here, "..", "src"), here, os.environ.get("PYTHONPATH", "")]))
+        crashed = subprocess.run([sys.executable, "-c", CRASHING_INSTALL, self.config_path],
+                                 env=env, capture_output=True, text=True)
+        self.assertEqual(crashed.returncode, -signal.SIGKILL, crashed.stderr)
+
+        with open(os.path.join(self.target, JOURNAL_PATH)) as f:
+            done = set(json.load(f)["steps"])
+        self.assertTrue({"partition", "format", "packages"} <= done)
+        self.assertNotIn("bootloader", done)
+
+        runner = StubRunner()
+        utils.set_runner(runner)
+        out = io.StringIO()
+        with redirect_stdout(out), self.assertRaises(SystemExit) as exit_code:
+            main(["--config", self.config_path])
+
+        self.assertEqual(exit_code.exception.code, 0)
+        for cmd in ("^sfdisk", "mkfs", "^pacstrap", "^pacman -S[ypw]* "):
+            self.assertEqual(runner.count(cmd), 0, cmd)
+        self.assertEqual(runner.count("bootctl install"), 1)
+        self.assertEqual(runner.count("chpasswd"), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.target, "boot/loader/entries/arch.conf")))
+        # A finished install leaves no journal behind
+        self.assertFalse(os.path.exists(os.path.join(self.target, JOURNAL_PATH)))
+
+if __name__ == '__main__':
+    unittest.main()
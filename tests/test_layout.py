@@ -0,0 +1,146 @@
+"""Unit tests for layout module"""
+
+import re
+import tempfile
+import threading
+import unittest
+from arch_installer import utils
+from arch_installer.config import ConfigError, validate_config
+from arch_installer.disk import DiskManager
+from arch_installer.initramfs import InitramfsBuilder
+from arch_installer.layout import Layout, parse_size, partition_path
+from fakes import StubRunner
+
+class TestLayout(unittest.TestCase):
+
+    def test_partition_path(self):
+        """Test NVMe, MMC and loop partitions get a p separator"""
+        self.assertEqual(partition_path("/dev/sda", 2), "/dev/sda2")
+        self.assertEqual(partition_path("/dev/nvme0n1", 2), "/dev/nvme0n1p2")
+        self.assertEqual(partition_path("/dev/mmcblk0", 1), "/dev/mmcblk0p1")
+        self.assertEqual(partition_path("/dev/loop3", 1), "/dev/loop3p1")
+
+    def test_parse_size(self):
+        """Test sizes are read as MiB"""
+        self.assertEqual(parse_size("512M"), 512)
+        self.assertEqual(parse_size("40G"), 40 << 10)
+        self.assertEqual(parse_size("1TiB"), 1 << 20)
+        self.assertEqual(parse_size(100), 100)
+        self.assertIsNone(parse_size("rest"))
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+
+    def test_preset_on_nvme(self):
+        """Test a preset becomes one table on the disk, with every partition named after it"""
+        layout = Layout.from_config({'disk': "/dev/nvme0n1", 'layout': "server", 'filesystem': "xfs"})
+        self.assertEqual(layout.table(0), "label: gpt\n"
+                                          "size=1024MiB, type=U, name=esp\n"
+                                          "size=30720MiB, type=L, name=root\n"
+                                          "size=20480MiB, type=L, name=var\n"
+                                          "size=16384MiB, type=L, name=scratch\n"
+                                          "type=L, name=home\n")
+        self.assertEqual(layout.filesystems(), [
+            ("/", "xfs", "/dev/nvme0n1p2"),
+            ("/boot", "vfat", "/dev/nvme0n1p1"),
+            ("/home", "xfs", "/dev/nvme0n1p5"),
+            ("/scratch", "xfs", "/dev/nvme0n1p4"),
+            ("/var", "xfs", "/dev/nvme0n1p3"),
+        ])
+        self.assertEqual(layout.assemble_commands(), [])
+        self.assertEqual(layout.packages(), ["xfsprogs"])
+
+    def test_raid_per_volume(self):
+        """Test raid without lvm mirrors each partition into its own array"""
+        layout = Layout.from_config({'disk': "/dev/sda", 'layout': {'preset': "home", 'devices': "/dev/sdb",
+                                                                    'raid': 1}})
+        self.assertEqual(layout.table(0), layout.table(1))
+        self.assertIn("type=R, name=home", layout.table(1))
+        self.assertEqual(layout.assemble_commands()[0],
+                         ["mdadm", "--create", "/dev/md/sda_root", "--run", "--metadata=1.2", "--level=1",
+                          "--raid-devices=2", "/dev/sda2", "/dev/sdb2"])
+        self.assertEqual(dict((m, d) for m, _, d in layout.filesystems())["/"], "/dev/md/sda_root")
+        self.assertEqual(layout.hooks(), ["mdadm_udev"])
+
+    def test_lvm_across_disks(self):
+        """Test lvm gives each disk one partition and each volume a logical volume"""
+        layout = Layout.from_config({'disk': "/dev/sda", 'layout': {
+            'devices': ["/dev/sdb"], 'lvm': True,
+            'partitions': [{'mountpoint': "/", 'size': "20G", 'filesystem': "btrfs"},
+                           {'mountpoint': "/var/log", 'filesystem': "ext4"}]}})
+        self.assertEqual(layout.table(1), "label: gpt\ntype=V, name=lvm\n")
+        self.assertEqual([" ".join(cmd) for cmd in layout.assemble_commands()], [
+            "pvcreate -ff --yes /dev/sda2 /dev/sdb1",
+            "vgcreate arch_sda /dev/sda2 /dev/sdb1",
+            "lvcreate --yes -W y -n root -L 20480m arch_sda",
+            "lvcreate --yes -W y -n var_log -l 100%FREE arch_sda",
+        ])
+        self.assertEqual(layout.devices()[1][1], "/dev/arch_sda/var_log")
+        self.assertEqual(layout.packages(), ["btrfs-progs", "lvm2"])
+        self.assertIn("HOOKS=(base udev autodetect microcode modconf kms keyboard keymap consolefont "
+                      "block lvm2 filesystems fsck)",
+                      InitramfsBuilder(hooks=layout.hooks()).drop_in())
+
+    def test_errors(self):
+        """Test invalid layouts are reported through the config validation"""
+        config = {'disk': "/dev/vda", 'rootpass': "secret"}
+        self.assertEqual(validate_config(config, ["/dev/vda"])['layout'], "default")
+        for layout, message in [
+                ("raid", "layout must be one of default, home, server"),
+                ({'devices': "/dev/vdb", 'raid': 5}, "raid 5 needs 3 disks"),
+                ({'devices': "/dev/vdb"}, "need raid or lvm"),
+                ({'devices': "/dev/vdc", 'lvm': True}, "'/dev/vdc' is not one of the available disks"),
+                ({'partitions': [{'mountpoint': "/home"}, {'mountpoint': "/", 'filesystem': "zfs"}]},
+                 "only the last layout partition"),
+                ({'partitions': [{'mountpoint': "/boot", 'size': "1G"}, {'mountpoint': "/"}]}, "not /boot")]:
+            with self.assertRaisesRegex(ConfigError, re.escape(message)):
+                validate_config(dict(config, layout=layout), ["/dev/vda", "/dev/vdb"])
+
+    def test_parallel_targets(self):
+        """Test installs onto several disks take only single-disk layouts"""
+        config = {'disk': "/dev/vda", 'rootpass': "secret"}
+        self.assertEqual(validate_config(dict(config, layout="server"), ["/dev/vda"], parallel=True)['layout'],
+                         "server")
+        for layout in [{'devices': "/dev/vdb", 'lvm': True}, {'lvm': True}]:
+            with self.assertRaisesRegex(ConfigError, "installing onto several disks"):
+                validate_config(dict(config, layout=layout), ["/dev/vda", "/dev/vdb"], parallel=True)
+
+class TestLayoutDiskManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(utils.set_runner, None)
+
+    def test_tables_and_mkfs_run_concurrently(self):
+        """Test each disk's table is one sfdisk run and every mkfs overlaps with the others"""
+        layout = Layout(["/dev/vda", "/dev/vdb"], Layout.from_config({'layout': "home"}).volumes, lvm=True)
+        # Every sfdisk, then every mkfs, has to be running before any may finish
+        barriers = {"sfdisk": threading.Barrier(2, timeout=5), "mkfs": threading.Barrier(3, timeout=5)}
+
+        class BarrierRunner(StubRunner):
+            def __call__(self, cmd):
+                program = cmd.split()[0].split(".")[0]
+                if program in barriers:
+                    barriers[program].wait()
+                return super().__call__(cmd)
+
+        runner = BarrierRunner()
+        utils.set_runner(runner)
+        DiskManager.partition_disk(layout)
+        filesystems = DiskManager.format_and_mount(layout, self.tmp.name)
+
+        self.assertEqual(runner.count("^sfdisk"), 2)
+        self.assertTrue(runner.commands[0].startswith("sfdisk --wipe always --wipe-partitions always "))
+        self.assertLess(max(runner.index("^sfdisk .*vda"), runner.index("^sfdisk .*vdb")),
+                        runner.index("^pvcreate"))
+        # Once after each table, once after the volumes and before any mkfs
+        settles = [i for i, cmd in enumerate(runner.commands) if cmd == "udevadm settle"]
+        self.assertEqual(len(settles), 3)
+        self.assertLess(runner.index("^lvcreate .* home "), settles[-1])
+        self.assertLess(settles[-1], runner.index("^mkfs"))
+        self.assertEqual([entry[:2] for entry in filesystems], [["/", "ext4"], ["/boot", "vfat"], ["/home", "ext4"]])
+        mounts = [cmd.split()[-1] for cmd in runner.commands if cmd.startswith("mount")]
+        self.assertEqual(mounts, [self.tmp.name, f"{self.tmp.name}/boot", f"{self.tmp.name}/home"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Unit tests for listview module"""
+
+import curses
+import unittest
+from arch_installer.ui.listview import ListView
+
+class FakeWindow:
+    """Records what is written where, like a curses window of a fixed size"""
+
+    def __init__(self, height=12, width=40):
+        self.size = (height, width)
+        self.rows = {}
+        self.writes = 0
+
+    def getmaxyx(self):
+        return self.size
+
+    def addstr(self, y, x, text, attr=0):
+        self.rows[y] = (text.rstrip(), attr)
+        self.writes += 1
+
+LOCALES = [f"{lang}_{country}.UTF-8" for lang in ("de", "en", "fr", "vi") for country in ("AT", "DE", "US", "VN")]
+
+class TestListView(unittest.TestCase):
+
+    def view(self, options, height=12):
+        self.win = FakeWindow(height)
+        view = ListView(self.win, options)
+        view.draw()
+        return view
+
+    def keys(self, view, keys):
+        for key in keys:
+            result = view.handle(ord(key) if isinstance(key, str) else key)
+            view.draw()
+        return result
+
+    def test_only_visible_rows_drawn(self):
+        """Test a huge list writes one screen of rows and scrolls with the highlight"""
+        view = self.view([f"option {i}" for i in range(50000)])
+        self.assertEqual(self.win.writes, 1 + view.height)
+        self.assertEqual(self.win.rows[2], ("> option 0", curses.A_REVERSE))
+
+        self.win.writes = 0
+        self.keys(view, [curses.KEY_DOWN])
+        # The status line and the two rows the highlight moved between
+        self.assertEqual(self.win.writes, 3)
+
+        self.keys(view, [curses.KEY_NPAGE, curses.KEY_NPAGE])
+        self.assertEqual(view.selected, f"option {1 + 2 * view.height}")
+        self.assertEqual(self.win.rows[2 + view.height - 1][0], f"> option {1 + 2 * view.height}")
+        self.keys(view, [curses.KEY_END])
+        self.assertEqual(view.selected, "option 49999")
+        self.keys(view, [curses.KEY_HOME])
+        self.assertEqual(self.win.rows[2][0], "> option 0")
+
+    def test_filter(self):
+        """Test typing narrows the list in order, backspace and ESC widen it again"""
+        view = self.view(LOCALES)
+        self.keys(view, "US")
+        self.assertEqual([LOCALES[i] for i in view.matches],
+                         ["de_US.UTF-8", "en_US.UTF-8", "fr_US.UTF-8", "vi_US.UTF-8"])
+        self.keys(view, "x")
+        self.assertEqual(list(view.matches), [])
+        self.assertIsNone(self.keys(view, [10]))
+        self.assertEqual(self.win.rows[1][0], "Filter: usx  (0/0)")
+
+        self.keys(view, [curses.KEY_BACKSPACE, curses.KEY_DOWN])
+        self.assertEqual(view.selected, "en_US.UTF-8")
+        self.assertEqual(self.keys(view, [10]), "select")
+
+        self.keys(view, [27])
+        self.assertEqual(len(view.matches), len(LOCALES))
+        self.assertEqual(self.keys(view, [27]), "cancel")
+
+    def test_filter_after_clear(self):
+        """Test a query that does not extend the last one searches everything"""
+        view = self.view(LOCALES)
+        self.keys(view, "vi")
+        view.filter("de")
+        self.assertEqual(view.selected, "de_AT.UTF-8")
+        self.assertEqual(len(view.matches), 7)
+
+    def test_index_matches_scan(self):
+        """Test the substring index finds exactly what a plain scan does"""
+        options = [f"{LOCALES[i % len(LOCALES)]}-{i}" for i in range(3000)]
+        view = self.view(options)
+        self.assertIsNotNone(view.grams)
+        for query in ("en_", "en_us.utf-8-1", "t-29", "zz"):
+            view.filter(query)
+            self.assertEqual([options[i] for i in view.matches],
+                             [o for o in options if query in o.lower()], query)
+
+if __name__ == '__main__':
+    unittest.main()
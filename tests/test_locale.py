@@ -0,0 +1,114 @@
+"""Unit tests for locale module"""
+
+import os
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.locale import LocaleManager, SupportedLocales, ARCHIVE_PATH, SUPPORTED_PATH
+from fakes import StubRunner
+
+SUPPORTED = """de_DE.UTF-8 UTF-8
+de_DE ISO-8859-1
+en_US.UTF-8 UTF-8
+en_US ISO-8859-1
+sr_RS@latin UTF-8
+vi_VN UTF-8
+"""
+
+LOCALE_GEN = """# Configuration file for locale-gen
+#
+#  Examples:
+#  en_US.UTF-8 UTF-8
+#
+#de_DE.UTF-8 UTF-8
+#de_DE ISO-8859-1
+#en_US.UTF-8 UTF-8
+vi_VN UTF-8
+"""
+
+def conf(main, lang=None):
+    return {'locale': main, 'lang': lang or main, 'time_format': main,
+            'number_format': main, 'currency_format': "C.UTF-8"}
+
+class LocaleGenRunner(StubRunner):
+    """locale-gen writes an archive listing what locale.gen enables"""
+
+    def __call__(self, cmd):
+        code, out = super().__call__(cmd)
+        if cmd.startswith("chroot ") and "locale-gen" in cmd:
+            root = cmd.split()[1]
+            with open(os.path.join(root, "etc/locale.gen")) as f:
+                enabled = [line for line in f if line[:1].isalpha()]
+            os.makedirs(os.path.dirname(os.path.join(root, ARCHIVE_PATH)), exist_ok=True)
+            with open(os.path.join(root, ARCHIVE_PATH), "w") as f:
+                f.writelines(enabled)
+        return code, out
+
+class TestLocaleManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = os.path.join(self.tmp.name, "cache")
+        self.runner = LocaleGenRunner()
+        utils.set_runner(self.runner)
+        self.addCleanup(utils.set_runner, None)
+
+    def make_root(self, name="root", glibc="2.40+r16+gaa533d58ff-2"):
+        root = os.path.join(self.tmp.name, name)
+        for path, content in ((SUPPORTED_PATH, SUPPORTED), ("etc/locale.gen", LOCALE_GEN)):
+            os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+            with open(os.path.join(root, path), "w") as f:
+                f.write(content)
+        os.makedirs(os.path.join(root, "var/lib/pacman/local", f"glibc-{glibc}"))
+        os.makedirs(os.path.join(root, "var/lib/pacman/local", "glibc-locales-2.40-2"))
+        return root
+
+    def test_supported_index(self):
+        """Test names resolve whatever the codeset spelling, and the list is parsed once"""
+        root = self.make_root()
+        supported = SupportedLocales.load(root)
+        self.assertIs(SupportedLocales.load(root), supported)
+        self.assertEqual(supported.entry("en_US.utf8"), "en_US.UTF-8 UTF-8")
+        self.assertEqual(supported.entry("en_US"), "en_US ISO-8859-1")
+        self.assertIsNone(supported.entry("xx_XX.UTF-8"))
+        self.assertEqual(LocaleManager.get_available_locales(root)[:2], ["de_DE.UTF-8", "de_DE"])
+        self.assertIsNone(SupportedLocales.load(os.path.join(self.tmp.name, "missing")))
+
+    def test_only_requested_locales(self):
+        """Test locale.gen enables exactly the configured locales"""
+        root = self.make_root()
+        self.assertEqual(LocaleManager.locale_gen_entries(conf("de_DE.UTF-8", "en_US"), root),
+                         ["de_DE.UTF-8 UTF-8", "en_US ISO-8859-1"])
+        with self.assertRaisesRegex(Exception, "xx_XX"):
+            LocaleManager.locale_gen_entries(conf("xx_XX.UTF-8"), root)
+
+        LocaleManager.write_locale_gen(["de_DE.UTF-8 UTF-8", "en_US ISO-8859-1"], root)
+        with open(os.path.join(root, "etc/locale.gen")) as f:
+            lines = f.read().splitlines()
+        self.assertIn("#  en_US.UTF-8 UTF-8", lines)
+        self.assertEqual([line for line in lines if line[:1].isalpha()], ["de_DE.UTF-8 UTF-8", "en_US ISO-8859-1"])
+        self.assertIn("#vi_VN UTF-8", lines)
+
+    def test_archive_cache(self):
+        """Test a second install with the same locales and glibc copies the archive instead of compiling"""
+        first = self.make_root("first")
+        self.assertEqual(LocaleManager.setup_locale(conf("de_DE.UTF-8"), first, cache_dir=self.cache), "generated")
+        self.assertEqual(LocaleManager.setup_locale(conf("de_DE.UTF-8"), first, cache_dir=self.cache),
+                         "already built")
+
+        second = self.make_root("second")
+        self.assertEqual(LocaleManager.setup_locale(conf("de_DE.UTF-8"), second, cache_dir=self.cache), "from cache")
+        with open(os.path.join(second, ARCHIVE_PATH)) as f:
+            self.assertEqual(f.read(), "de_DE.UTF-8 UTF-8\n")
+        self.assertEqual(self.runner.count("locale-gen"), 1)
+
+        upgraded = self.make_root("upgraded", glibc="2.41-1")
+        self.assertEqual(LocaleManager.setup_locale(conf("de_DE.UTF-8"), upgraded, cache_dir=self.cache),
+                         "generated")
+        other = self.make_root("other")
+        self.assertEqual(LocaleManager.setup_locale(conf("vi_VN"), other, cache_dir=self.cache), "generated")
+        self.assertEqual(self.runner.count("locale-gen"), 3)
+
+if __name__ == '__main__':
+    unittest.main()
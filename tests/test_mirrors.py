@@ -0,0 +1,92 @@
+"""Unit tests for mirrors module"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from arch_installer.mirrors import MirrorRanker, load_candidates
+
+def start_mirror(latency, size=64 * 1024):
+    """Serve core.db after an injected delay, returning the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path != "/core/os/x86_64/core.db":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.wfile.write(b"\0" * size)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def server_line(server, prefix=""):
+    return f"http://127.0.0.1:{server.server_address[1]}{prefix}/$repo/os/$arch"
+
+class TestMirrorRanker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.tmp.name, "mirrors.json")
+        self.servers = [start_mirror(latency) for latency in (0.6, 0.0, 0.3)]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.tmp.cleanup()
+
+    def test_rank_by_latency(self):
+        """Test mirrors are ordered fastest first and failures dropped"""
+        slow, fast, medium = (server_line(s) for s in self.servers)
+        broken = server_line(self.servers[1], prefix="/missing")
+        ranker = MirrorRanker([slow, broken, fast, medium], cache_path=self.cache)
+
+        results = ranker.rank()
+        self.assertEqual([r["server"] for r in results], [fast, medium, slow])
+        self.assertGreater(results[0]["throughput"], 0)
+        self.assertEqual(results[0]["bytes"], 64 * 1024)
+
+    def test_timeout(self):
+        """Test a mirror slower than the timeout is skipped"""
+        slow, fast, _ = (server_line(s) for s in self.servers)
+        ranker = MirrorRanker([slow, fast], cache_path=self.cache, timeout=0.2)
+
+        self.assertEqual([r["server"] for r in ranker.rank()], [fast])
+
+    def test_cached_ranking_skips_probing(self):
+        """Test a fresh cache is reused without contacting mirrors"""
+        candidates = [server_line(s) for s in self.servers]
+        first = MirrorRanker(candidates, cache_path=self.cache).rank()
+
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(MirrorRanker(candidates, cache_path=self.cache).rank(), first)
+        expired = MirrorRanker(candidates, cache_path=self.cache, ttl=0, timeout=0.5)
+        self.assertEqual(expired.rank(), [])
+
+    def test_write_mirrorlist(self):
+        """Test the ranked servers are written as a pacman mirrorlist"""
+        candidates = [server_line(s) for s in self.servers]
+        source = os.path.join(self.tmp.name, "mirrorlist")
+        with open(source, "w") as f:
+            f.write("\n".join(f"#Server = {c}" for c in candidates))
+
+        MirrorRanker(load_candidates(source), cache_path=self.cache).write_mirrorlist(source, count=2)
+
+        self.assertEqual(load_candidates(source), [candidates[1], candidates[2]])
+        with open(source) as f:
+            self.assertEqual(sum(line.startswith("Server = ") for line in f), 2)
+
+if __name__ == '__main__':
+    unittest.main()
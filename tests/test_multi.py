@@ -0,0 +1,131 @@
+"""Tests for parallel installs onto several disks"""
+
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+from arch_installer import utils
+from arch_installer.multi import MultiInstaller
+from fakes import StubRunner, HARDWARE
+
+CONFIG = {
+    'rootpass': "rootpass",
+    'kernel': "linux",
+    'bootloader': "systemd-boot",
+    'swap': "swapfile",
+    'swap_size_mb': 1,
+}
+
+DISKS = ["/dev/vdb", "/dev/vdc", "/dev/nvme0n1"]
+
+class TestMultiInstaller(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = dict(CONFIG, cache_dir=os.path.join(self.tmp.name, "cache"))
+        patches = [
+            patch('arch_installer.installer.HardwareProfile.detect', return_value=HARDWARE),
+            patch('arch_installer.disk.DiskManager.list_disks',
+                  return_value=[f"{disk} (20G)" for disk in DISKS]),
+            patch('arch_installer.packages.PackageManager.optimize_mirrorlist'),
+            patch('arch_installer.prefetch.Prefetcher.write_pacman_conf', return_value="pacman.conf"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(utils.set_runner, None)
+        self.addCleanup(self.tmp.cleanup)
+
+        # The test runner may have configured logging before Installer does
+        root_logger = logging.getLogger()
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+        root_logger.setLevel(logging.INFO)
+
+    def install(self, runner, disks):
+        utils.set_runner(runner)
+        out = io.StringIO()
+        multi = MultiInstaller(self.config, disks, stream=out,
+                               mount_base=os.path.join(self.tmp.name, "mnt"), log_dir=self.tmp.name)
+        results = multi.run()
+        return results, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_parallel_targets(self):
+        """Test every disk gets its own root, log and events, with one shared download"""
+        runner = StubRunner()
+        results, events = self.install(runner, DISKS)
+
+        self.assertEqual(results, {"vdb": None, "vdc": None, "nvme0n1": None})
+        self.assertEqual(runner.count("^pacman -Sw "), 1)
+        for name, efi in (("vdb", "/dev/vdb1"), ("nvme0n1", "/dev/nvme0n1p1")):
+            root = os.path.join(self.tmp.name, "mnt", name)
+            self.assertEqual(runner.count(f"^pacstrap -K {root} "), 1)
+            self.assertIn(f"mount -o umask=0077 {efi} {root}/boot", runner.commands)
+            self.assertTrue(os.path.exists(os.path.join(root, "boot/loader/entries/arch.conf")))
+            self.assertTrue(any(e["event"] == "success" and e["target"] == name for e in events))
+
+            with open(os.path.join(self.tmp.name, f"arch-install-{name}.log")) as f:
+                log = f.read()
+            self.assertIn(f"pacstrap -K {root}", log)
+            other = os.path.join(self.tmp.name, "mnt", "vdc")
+            self.assertNotIn(other, log)
+
+    def test_one_failing_target(self):
+        """Test a failure on one disk does not stop the others"""
+        results, events = self.install(StubRunner(fail_on="/dev/vdc2"), DISKS[:2])
+
+        self.assertIsNone(results["vdb"])
+        self.assertIsNotNone(results["vdc"])
+        self.assertTrue(any(e["event"] == "error" and e["target"] == "vdc" for e in events))
+
+LOOP_TOOLS = ("losetup", "sfdisk", "mkfs.fat", "mkfs.ext4", "mount")
+
+@unittest.skipUnless(os.geteuid() == 0 and all(shutil.which(t) for t in LOOP_TOOLS),
+                     "needs root and " + ", ".join(LOOP_TOOLS))
+class TestMultiInstallerLoopDevices(TestMultiInstaller):
+    """Partition, format and mount real loop devices; pacstrap and chroot stay stubbed"""
+
+    def setUp(self):
+        super().setUp()
+        self.loops = []
+        for i in range(2):
+            image = os.path.join(self.tmp.name, f"disk{i}.img")
+            with open(image, "wb") as f:
+                f.truncate(1536 << 20)
+            loop = subprocess.check_output(["losetup", "-f", "--show", "-P", image], text=True).strip()
+            self.loops.append(loop)
+            self.addCleanup(subprocess.call, ["losetup", "-d", loop])
+
+    def test_loop_devices(self):
+        """Test two loop devices are installed concurrently"""
+
+        class LoopRunner(StubRunner):
+            def __call__(self, cmd):
+                if (cmd.split()[0] in ("pacstrap", "chroot", "mkdir") or "umount" in cmd
+                        or cmd.startswith(("mount -t", "mount --bind"))):
+                    return super().__call__(cmd)
+                self.commands.append(cmd)
+                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+                return result.returncode, result.stdout
+
+        with patch('arch_installer.disk.DiskManager.list_disks',
+                   return_value=[f"{loop} (1.5G)" for loop in self.loops]):
+            results, _ = self.install(LoopRunner(), self.loops)
+
+        for loop in self.loops:
+            name = os.path.basename(loop)
+            root = os.path.join(self.tmp.name, "mnt", name)
+            self.addCleanup(subprocess.call, ["umount", "-R", root])
+            self.assertIsNone(results[name])
+            self.assertTrue(os.path.ismount(root))
+            self.assertTrue(os.path.ismount(os.path.join(root, "boot")))
+
+    test_parallel_targets = None
+    test_one_failing_target = None
+
+if __name__ == '__main__':
+    unittest.main()
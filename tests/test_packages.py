@@ -0,0 +1,60 @@
+"""Unit tests for packages module"""
+
+import io
+import unittest
+from unittest.mock import patch, MagicMock
+from arch_installer.packages import PackageManager
+
+def fake_pacstrap(failing=()):
+    """Build a Popen replacement that fails when a failing package is requested"""
+    calls = []
+
+    def popen(cmd, **kwargs):
+        pkgs = cmd[3:]
+        calls.append(pkgs)
+        process = MagicMock()
+        process.stdout = io.BytesIO("".join(f"({i}/{len(pkgs)}) installing {pkg}\n"
+                                            for i, pkg in enumerate(pkgs, 1)).encode())
+        process.wait.return_value = 1 if set(pkgs) & set(failing) else 0
+        return process
+
+    return popen, calls
+
+class TestPackageManager(unittest.TestCase):
+
+    def test_batched_single_transaction(self):
+        """Test all packages go through one pacstrap run"""
+        popen, calls = fake_pacstrap()
+        ui = MagicMock()
+        with patch('subprocess.Popen', side_effect=popen):
+            PackageManager().install_packages(ui, ["base", "sudo", "nvim"])
+
+        self.assertEqual(calls, [["base", "sudo", "nvim"]])
+        ui.update_package_status.assert_any_call("sudo", "installing (2/3)")
+        ui.update_package_status.assert_any_call("nvim", "done")
+
+    def test_batched_chunk_fallback(self):
+        """Test a failing package is isolated by chunked retries"""
+        popen, calls = fake_pacstrap(failing=["broken"])
+        pkgs = [f"pkg{i}" for i in range(10)] + ["broken"]
+        with patch('subprocess.Popen', side_effect=popen):
+            with self.assertRaisesRegex(Exception, "broken"):
+                PackageManager().install_packages(MagicMock(), pkgs)
+
+        self.assertEqual(calls[0], pkgs)
+        self.assertEqual(calls[1], pkgs[:8])
+        self.assertEqual(calls[-1], ["broken"])
+
+    def test_per_package_mode(self):
+        """Test the legacy mode runs one pacstrap per package"""
+        popen, calls = fake_pacstrap()
+        ui = MagicMock()
+        with patch('subprocess.Popen', side_effect=popen):
+            PackageManager().install_packages(ui, ["base", "sudo"], batch=False)
+
+        self.assertEqual(calls, [["base"], ["sudo"]])
+        ui.update_package_progress.assert_any_call("sudo", 1, 1)
+        self.assertTrue(ui.show_transaction_progress.call_args[0][0].finished)
+
+if __name__ == '__main__':
+    unittest.main()
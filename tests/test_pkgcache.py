@@ -0,0 +1,106 @@
+"""Unit tests for pkgcache module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from arch_installer.pkgcache import PackageCache, parse_package_filename
+
+def fake_package(pkgdir, filename, size=100):
+    """Write a fake package file of the given size"""
+    with open(os.path.join(pkgdir, filename), "wb") as f:
+        f.write(filename.encode().ljust(size, b"\0"))
+
+def fake_install(root, *packages):
+    """Create local database entries as pacman would after an install"""
+    for package in packages:
+        path = os.path.join(root, "var/lib/pacman/local", package)
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, "desc"), "w").close()
+
+class TestPackageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = PackageCache(os.path.join(self.tmp.name, "cache"), max_bytes=1000)
+        self.root = os.path.join(self.tmp.name, "mnt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_package_filename(self):
+        """Test names with dashes and epochs are split correctly"""
+        self.assertEqual(parse_package_filename("linux-firmware-20240409.1addd7dc-1-any.pkg.tar.zst"),
+                         ("linux-firmware", "20240409.1addd7dc-1"))
+        self.assertEqual(parse_package_filename("nvim-1:0.9.5-2-x86_64.pkg.tar.zst"),
+                         ("nvim", "1:0.9.5-2"))
+        self.assertIsNone(parse_package_filename("base-3-1-any.pkg.tar.zst.sig"))
+
+    def test_miss_then_full_hit(self):
+        """Test a repeated package set is served from the cache"""
+        self.assertIsNone(self.cache.prepare(["base"]))
+        fake_package(self.cache.pkgdir, "base-3-2-any.pkg.tar.zst")
+        fake_package(self.cache.pkgdir, "glibc-2.39-1-x86_64.pkg.tar.zst")
+        fake_install(self.root, "base-3-2", "glibc-2.39-1")
+
+        report = self.cache.finish(self.root, ["base"])
+        self.assertEqual((report["hits"], report["misses"]), (0, 2))
+
+        cache = PackageCache(self.cache.path, max_bytes=1000)
+        files = cache.prepare(["base"])
+        self.assertEqual(sorted(os.path.basename(f) for f in files),
+                         ["base-3-2-any.pkg.tar.zst", "glibc-2.39-1-x86_64.pkg.tar.zst"])
+
+        report = cache.finish(self.root, ["base"])
+        self.assertEqual((report["hits"], report["misses"]), (2, 0))
+
+    def test_corrupt_file_dropped(self):
+        """Test a file that no longer matches its hash is not reused"""
+        self.cache.prepare(["base"])
+        fake_package(self.cache.pkgdir, "base-3-2-any.pkg.tar.zst")
+        fake_install(self.root, "base-3-2")
+        self.cache.finish(self.root, ["base"])
+
+        with open(os.path.join(self.cache.pkgdir, "base-3-2-any.pkg.tar.zst"), "ab") as f:
+            f.write(b"garbage")
+
+        self.assertIsNone(self.cache.prepare(["base"]))
+        self.assertEqual(self.cache.entries, {})
+        self.assertEqual(os.listdir(self.cache.pkgdir), [])
+
+    def test_new_package_set_verifies_only_its_closure(self):
+        """Test a new package set leaves hashing to the files pacman resolves"""
+        self.cache.prepare(["base"])
+        fake_package(self.cache.pkgdir, "base-3-2-any.pkg.tar.zst")
+        fake_package(self.cache.pkgdir, "vim-9.1-1-x86_64.pkg.tar.zst")
+        fake_install(self.root, "base-3-2", "vim-9.1-1")
+        self.cache.finish(self.root, ["base"])
+        for filename in os.listdir(self.cache.pkgdir):
+            with open(os.path.join(self.cache.pkgdir, filename), "ab") as f:
+                f.write(b"garbage")
+
+        with patch('arch_installer.pkgcache.sha256sum') as sha256sum:
+            self.assertIsNone(self.cache.prepare(["base", "sudo"]))
+        sha256sum.assert_not_called()
+
+        self.cache.verify_files(["base-3-2-any.pkg.tar.zst", "sudo-1.9-1-x86_64.pkg.tar.zst"])
+        self.assertEqual(os.listdir(self.cache.pkgdir), ["vim-9.1-1-x86_64.pkg.tar.zst"])
+
+    def test_lru_eviction(self):
+        """Test the least recently used files go first"""
+        self.cache.prepare(["old"])
+        fake_package(self.cache.pkgdir, "old-1-1-any.pkg.tar.zst", size=600)
+        fake_install(self.root, "old-1-1")
+        self.cache.finish(self.root, ["old"])
+
+        other_root = os.path.join(self.tmp.name, "mnt2")
+        self.cache.prepare(["new"])
+        fake_package(self.cache.pkgdir, "new-1-1-any.pkg.tar.zst", size=600)
+        fake_install(other_root, "new-1-1")
+        self.cache.finish(other_root, ["new"])
+
+        self.assertEqual(os.listdir(self.cache.pkgdir), ["new-1-1-any.pkg.tar.zst"])
+        self.assertNotIn(PackageCache.profile_key(["old"]), self.cache.profiles)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Unit tests for prefetch module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from arch_installer.prefetch import Prefetcher
+
+class TestPrefetcher(unittest.TestCase):
+
+    def test_write_pacman_conf(self):
+        """Test ParallelDownloads is enabled in the staged pacman.conf"""
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "source.conf")
+            with open(source, "w") as f:
+                f.write("[options]\n#ParallelDownloads = 5\n\n[core]\nInclude = x\n")
+
+            prefetcher = Prefetcher(MagicMock(), ["base"], parallel_downloads=12)
+            path = prefetcher.write_pacman_conf(os.path.join(tmp, "pacman.conf"), source)
+            with open(path) as f:
+                content = f.read()
+
+        self.assertIn("\nParallelDownloads = 12\n", content)
+        self.assertNotIn("#ParallelDownloads", content)
+
+    @patch('arch_installer.prefetch.run')
+    def test_download_uses_staging_cache(self, mock_run):
+        """Test downloads go to the staging cache with an empty database"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cachedir = os.path.join(tmp, "pkg")
+            prefetcher = Prefetcher(MagicMock(), ["base", "sudo"], cachedir=cachedir)
+            with patch.object(prefetcher, 'write_pacman_conf', return_value="conf"):
+                prefetcher.start()
+                prefetcher.wait()
+
+        cmd = mock_run.call_args[0][0]
+        self.assertIn(f"--cachedir {cachedir}", cmd)
+        self.assertIn(f"--dbpath {tmp}/db", cmd)
+        self.assertTrue(cmd.endswith("base sudo"))
+
+    @patch('arch_installer.prefetch.run')
+    def test_download_verifies_resolved_closure(self, mock_run):
+        """Test cached files pacman will reuse are verified before the download"""
+        mock_run.side_effect = lambda cmd, **kwargs: "base-3-2-any.pkg.tar.zst\n" if " -Sp " in cmd else None
+        cache = MagicMock()
+        with tempfile.TemporaryDirectory() as tmp:
+            prefetcher = Prefetcher(MagicMock(), ["base"], cachedir=os.path.join(tmp, "pkg"), cache=cache)
+            with patch.object(prefetcher, 'write_pacman_conf', return_value="conf"):
+                prefetcher.download()
+
+        cache.verify_files.assert_called_once_with(["base-3-2-any.pkg.tar.zst"])
+        self.assertEqual([c[0][0].split()[1] for c in mock_run.call_args_list], ["-Sy", "-Sp", "-Sw"])
+
+    def test_wait_raises_on_failure(self):
+        """Test a failed prefetch surfaces when the installer waits"""
+        package_manager = MagicMock()
+        package_manager.optimize_mirrorlist.side_effect = Exception("no mirrors")
+        prefetcher = Prefetcher(package_manager, ["base"])
+        prefetcher.start()
+
+        with self.assertRaisesRegex(Exception, "no mirrors"):
+            prefetcher.wait()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Unit tests for progress module"""
+
+import io
+import json
+import unittest
+from arch_installer.ui.headless import HeadlessUI
+from arch_installer.ui.progress import PacmanProgress, FrameLimiter, ProgressBar
+
+# pacstrap output with stdout on a pipe, shortened to four packages
+TRANSACTION = """==> Creating install root at /mnt
+==> Installing packages to /mnt
+:: Synchronizing package databases...
+ core downloading...
+ extra downloading...
+resolving dependencies...
+looking for conflicting packages...
+
+Packages (4) acl-2.3.2-1  attr-2.5.2-1  base-3-2  linux-6.9.7.arch1-1
+
+Total Download Size:    160.00 MiB
+Total Installed Size:   240.00 MiB
+
+:: Proceed with installation? [Y/n]
+:: Retrieving packages...
+ acl-2.3.2-1-x86_64 downloading...
+ attr-2.5.2-1-x86_64 downloading...
+ base-3-2-any downloading...
+ linux-6.9.7.arch1-1-x86_64 downloading...
+checking keyring...
+(4/4) checking keys in keyring
+(4/4) checking package integrity
+:: Processing package changes...
+(1/4) installing acl
+(2/4) installing attr
+(3/4) installing base
+(4/4) installing linux
+:: Running post-transaction hooks...
+(1/2) Creating system user accounts...
+(2/2) Updating linux initcpios...
+"""
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class TestPacmanProgress(unittest.TestCase):
+
+    def test_phases(self):
+        """Test counters, estimated bytes, rate and ETA follow the transaction"""
+        clock = FakeClock()
+        progress = PacmanProgress(clock)
+        seen = {}
+        for line in TRANSACTION.splitlines():
+            clock.now += 1
+            if progress.feed(line):
+                seen.setdefault(progress.phase, []).append((progress.current, progress.total))
+            if line.strip() == "attr-2.5.2-1-x86_64 downloading...":
+                self.assertEqual(progress.downloaded, 80 << 20)
+                self.assertEqual(progress.rate(), 40 << 20)
+                self.assertEqual(progress.eta(), 2)
+                self.assertIn("80.0 MiB/160.0 MiB 40.0 MiB/s ETA 0:02", progress.describe())
+            if line == "(3/4) installing base":
+                self.assertEqual(progress.fraction, 0.75)
+                self.assertEqual(progress.describe(), "Installing 3/4 1.0/s ETA 0:01 base")
+
+        self.assertEqual(seen["download"], [(0, 4), (1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(seen["verify"], [(4, 4), (4, 4)])
+        self.assertEqual(seen["install"], [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(seen["hooks"], [(0, 0), (1, 2), (2, 2)])
+        # Database downloads before the transaction are not package downloads
+        self.assertEqual(progress.packages, 4)
+
+    def test_cached_transaction(self):
+        """Test a transaction with nothing to download goes straight to installing"""
+        progress = PacmanProgress(FakeClock())
+        progress.feed("(1/2) installing base")
+        self.assertIsNone(progress.downloaded)
+        self.assertEqual(progress.fraction, 0.5)
+        self.assertEqual(PacmanProgress().describe(), "Preparing")
+
+    def test_render(self):
+        """Test the bar is clamped to its width"""
+        self.assertEqual(ProgressBar.render(4, 0.5), "██  ")
+        self.assertEqual(ProgressBar.render(4, 1.5), "████")
+
+class TestFrameLimiter(unittest.TestCase):
+
+    def test_redraws_coalesced(self):
+        """Test a chatty transaction produces a bounded number of progress events"""
+        clock = FakeClock()
+        stream = io.StringIO()
+        ui = HeadlessUI(stream)
+        ui.frames = FrameLimiter(fps=2, clock=clock)
+        progress = PacmanProgress(clock)
+        for i in range(1, 1001):
+            clock.now += 0.002
+            progress.feed(f"({i}/1000) installing pkg{i}")
+            ui.show_transaction_progress(progress)
+        progress.finish()
+        ui.show_transaction_progress(progress)
+
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        # Two seconds of output at two frames a second, plus the final one
+        self.assertEqual(len(events), 5)
+        self.assertEqual((events[-1]["percent"], events[-1]["finished"]), (100.0, True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Unit tests for scheduler module"""
+
+import threading
+import time
+import unittest
+from arch_installer.scheduler import StepScheduler
+
+class TestStepScheduler(unittest.TestCase):
+
+    def test_outputs_flow_to_inputs(self):
+        """Test values produced by one step reach its dependents"""
+        scheduler = StepScheduler()
+        scheduler.add("partition", lambda inputs: {"efi": "/dev/sda1", "root": "/dev/sda2"},
+                      outputs=["efi", "root"])
+        scheduler.add("format", lambda inputs: inputs["root"] + " mounted",
+                      inputs=["root"], outputs=["mounted"])
+
+        values = scheduler.run()
+        self.assertEqual(values["mounted"], "/dev/sda2 mounted")
+
+    def test_independent_steps_overlap(self):
+        """Test ready steps run concurrently"""
+        barrier = threading.Barrier(3, timeout=5)
+        scheduler = StepScheduler(max_workers=3)
+        for name in ("swap", "locale", "entries"):
+            scheduler.add(name, lambda inputs: barrier.wait())
+
+        scheduler.run()
+
+    def test_shared_resource_serializes(self):
+        """Test steps holding the same resource never overlap"""
+        active = []
+        overlaps = []
+
+        def step(inputs):
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+        scheduler = StepScheduler(max_workers=4)
+        for name in ("locale", "system", "passwords"):
+            scheduler.add(name, step, resources=["chroot"])
+
+        scheduler.run()
+        self.assertEqual(max(overlaps), 1)
+
+    def test_first_declared_failure_wins(self):
+        """Test the raised error does not depend on completion order"""
+        def fail(message, delay):
+            def step(inputs):
+                time.sleep(delay)
+                raise RuntimeError(message)
+            return step
+
+        scheduler = StepScheduler(max_workers=2)
+        scheduler.add("slow", fail("slow failed", 0.05))
+        scheduler.add("fast", fail("fast failed", 0))
+        scheduler.add("after", lambda inputs: None, inputs=["never"])
+        scheduler.add("source", fail("source failed", 0.1), outputs=["never"])
+
+        with self.assertRaisesRegex(RuntimeError, "slow failed"):
+            scheduler.run()
+        self.assertIsNone(scheduler.steps[2].start)
+
+    def test_poll_while_running(self):
+        """Test poll is called repeatedly while a step runs"""
+        polls = []
+        done = threading.Event()
+        scheduler = StepScheduler(poll=lambda: polls.append(1) if len(polls) < 3 else done.set())
+        scheduler.add("pacstrap", lambda inputs: done.wait(5))
+
+        scheduler.run()
+        self.assertTrue(done.is_set())
+
+    def test_cycle_rejected(self):
+        """Test dependency cycles are reported before running"""
+        scheduler = StepScheduler()
+        scheduler.add("a", lambda inputs: 1, inputs=["b_out"], outputs=["a_out"])
+        scheduler.add("b", lambda inputs: 1, inputs=["a_out"], outputs=["b_out"])
+
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            scheduler.run()
+
+    def test_critical_path(self):
+        """Test the longest dependent chain is reported"""
+        scheduler = StepScheduler()
+        scheduler.add("format", lambda inputs: time.sleep(0.02), outputs=["root"])
+        scheduler.add("cpu", lambda inputs: "intel", outputs=["cpu"])
+        scheduler.add("packages", lambda inputs: time.sleep(0.05), inputs=["root"], outputs=["base"])
+        scheduler.add("microcode", lambda inputs: None, inputs=["base", "cpu"])
+
+        scheduler.run()
+        names = [step.name for step in scheduler.critical_path()]
+        self.assertEqual(names, ["format", "packages", "microcode"])
+        self.assertIn("Critical path", scheduler.report())
+
+if __name__ == '__main__':
+    unittest.main()
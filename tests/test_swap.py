@@ -0,0 +1,53 @@
+"""Unit tests for swap module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from arch_installer import utils
+from arch_installer.swap import SwapManager, allocate_file, memory_mb, recommended_swap_mb
+from fakes import StubRunner
+
+class TestSwap(unittest.TestCase):
+
+    def test_memory_mb(self):
+        """Test MemTotal is read from meminfo"""
+        with tempfile.NamedTemporaryFile("w", suffix="meminfo") as f:
+            f.write("MemTotal:       16303428 kB\nMemFree:         1000 kB\n")
+            f.flush()
+            self.assertEqual(memory_mb(f.name), 15921)
+
+    def test_recommended_swap_mb(self):
+        """Test swap sizing from RAM and hibernation"""
+        self.assertEqual(recommended_swap_mb(1024), 2048)
+        self.assertEqual(recommended_swap_mb(8192), 8192)
+        self.assertEqual(recommended_swap_mb(262144), 32768)
+        self.assertEqual(recommended_swap_mb(65536, hibernate=True), 65536 + 8192)
+
+    def test_allocate_file(self):
+        """Test both allocation paths produce a fully sized file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "swapfile")
+            self.assertIn(allocate_file(path, 8), ("fallocate", "zero-fill"))
+            self.assertEqual(os.path.getsize(path), 8 << 20)
+
+            with patch('arch_installer.swap._fallocate', return_value=False):
+                self.assertEqual(allocate_file(path, 5, block_mb=2), "zero-fill")
+            self.assertEqual(os.path.getsize(path), 5 << 20)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_btrfs_swapfile(self):
+        """Test a btrfs root gets a NOCOW swap file from btrfs itself instead of a compressed one"""
+        runner = StubRunner()
+        utils.set_runner(runner)
+        self.addCleanup(utils.set_runner, None)
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('arch_installer.swap.allocate_file') as allocate:
+                result = SwapManager().setup("swapfile", size_mb=512, root=tmp, filesystem="btrfs")
+            allocate.assert_not_called()
+        self.assertEqual(result["method"], "mkswapfile")
+        self.assertEqual(runner.commands[0], f"btrfs filesystem mkswapfile --size 512m {tmp}/swapfile")
+        self.assertEqual(runner.count("^mkswap "), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Unit tests for tracing module"""
+
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from arch_installer import utils
+from arch_installer.chroot import BATCH_MARKER, ChrootSession
+from arch_installer.tracing import Tracer, tracer
+from arch_installer.utils import run
+from fakes import StubRunner
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        tracer.start()
+        self.addCleanup(tracer.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_command_usage(self):
+        """Test CPU time and I/O of a command include what its shell ran"""
+        path = os.path.join(self.tmp.name, "data")
+        cmd = f"head -c 4194304 /dev/zero > {path}; cat {path} > /dev/null"
+        run(cmd)
+        span = next(s for s in reversed(tracer.spans) if s.name == cmd)
+
+        self.assertEqual(span.args["returncode"], 0)
+        self.assertGreaterEqual(span.args["wchar"], 4 << 20)
+        self.assertGreaterEqual(span.args["rchar"], 4 << 20)
+        self.assertGreater(span.args["max_rss_kb"], 0)
+        self.assertIn("user", span.args)
+
+    def test_failed_command_recorded(self):
+        """Test exit codes reach both the caller and the trace"""
+        with self.assertRaises(Exception):
+            run("exit 7")
+        span = next(s for s in reversed(tracer.spans) if s.name == "exit 7")
+        self.assertEqual(span.args["returncode"], 7)
+
+    def test_batch_script_not_traced(self):
+        """Test passwords in a chroot batch reach neither the trace nor the log"""
+        runner = StubRunner()
+        utils.set_runner(runner)
+        self.addCleanup(utils.set_runner, None)
+        with self.assertLogs(level="INFO") as logs:
+            with ChrootSession(self.tmp.name) as session:
+                session.run_batch(["echo 'root:hunter2' | chpasswd", "true"])
+        self.assertEqual(runner.count("hunter2"), 1)
+        names = [span.name for span in tracer.spans if span.category == "command"]
+        self.assertIn(f"chroot {self.tmp.name} echo", names)
+        self.assertFalse(any("hunter2" in name for name in names))
+        self.assertNotIn("hunter2", tracer.summary(commands=100))
+        self.assertFalse(any("hunter2" in line for line in logs.output))
+
+    def test_failed_batch_script_not_reported(self):
+        """Test a failing chroot batch names only its program in the log and the error"""
+        class FailingRunner(StubRunner):
+            @staticmethod
+            def chroot(root, script):
+                return StubRunner.chroot(root, script).replace(f"{BATCH_MARKER} 1 0", f"{BATCH_MARKER} 1 1")
+
+        utils.set_runner(FailingRunner())
+        self.addCleanup(utils.set_runner, None)
+        with self.assertLogs(level="INFO") as logs:
+            with self.assertRaises(subprocess.CalledProcessError) as failure:
+                with ChrootSession(self.tmp.name) as session:
+                    session.run_batch(["true", "echo 'root:hunter2' | chpasswd"])
+        self.assertEqual(failure.exception.cmd, f"chroot {self.tmp.name} echo")
+        self.assertNotIn("hunter2", str(failure.exception))
+        self.assertFalse(any("hunter2" in line for line in logs.output))
+
+    def test_steps_and_trace_file(self):
+        """Test commands are attributed to their step and exported as trace events"""
+        local = Tracer()
+        local.start()
+        with local.span("format"):
+            local.record("mkfs.ext4 /dev/vda2", "command", local.origin + 0.5, local.origin + 1.5,
+                         user=0.2, sys=0.3, rchar=10, wchar=4096, max_rss_kb=2048)
+        local.record("pacman -Syw", "command", local.origin, local.origin + 3)
+
+        totals = local.step_totals()
+        self.assertEqual(totals["format"]["commands"], 1)
+        self.assertAlmostEqual(totals["format"]["user"] + totals["format"]["sys"], 0.5)
+        self.assertGreaterEqual(totals["format"]["write"], 4096)
+        summary = local.summary()
+        self.assertIn("format", summary)
+        self.assertIn("3.00s  pacman -Syw", summary)
+
+        path = os.path.join(self.tmp.name, "trace.json")
+        local.write(path)
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        mkfs = next(e for e in events if e["name"] == "mkfs.ext4 /dev/vda2")
+        self.assertEqual((mkfs["ph"], mkfs["ts"], mkfs["dur"]), ("X", 500000, 1000000))
+        self.assertEqual(mkfs["args"]["step"], "format")
+        self.assertTrue(any(e["ph"] == "M" and e["tid"] == mkfs["tid"] for e in events))
+
+if __name__ == '__main__':
+    unittest.main()
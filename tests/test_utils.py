@@ -1,7 +1,11 @@
 """Unit tests for utils module"""
 
+import subprocess
+import time
+import tracemalloc
 import unittest
 from unittest.mock import patch, MagicMock
+from arch_installer import utils
 from arch_installer.utils import run, safe_run, check_efi
 
 class TestUtils(unittest.TestCase):
@@ -33,6 +37,45 @@ class TestUtils(unittest.TestCase):
         result = safe_run("failing command")
         self.assertIsNone(result)
     
+    def test_run_streams_lines(self):
+        """Test handlers see each line, and stdout is returned apart from stderr"""
+        seen = []
+        handler = lambda cmd, line: seen.append(line)
+        utils.add_output_handler(handler)
+        self.addCleanup(utils.remove_output_handler, handler)
+
+        output = run("echo one; echo oops >&2; echo two", silent=False)
+        self.assertEqual(output, "one\ntwo")
+        self.assertEqual(sorted(seen), ["one", "oops", "two"])
+
+    def test_run_failure_keeps_tail(self):
+        """Test a failed command reports only the end of its output"""
+        with self.assertRaises(subprocess.CalledProcessError) as failure:
+            run("seq 1 1000; echo broken >&2; exit 3")
+        tail = failure.exception.output.splitlines()
+        self.assertEqual(len(tail), utils.TAIL_LINES)
+        self.assertEqual(tail[-1], "broken")
+        self.assertEqual(failure.exception.returncode, 3)
+
+    def test_run_memory_is_bounded(self):
+        """Test peak memory stays flat for a command printing 64 MiB"""
+        tracemalloc.start()
+        try:
+            run("yes $(printf '%01023d' 0) | head -c 67108864; "
+                "head -c 4194304 /dev/zero | tr '\\0' x")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 4 << 20)
+
+    def test_run_timeout(self):
+        """Test a shell command past its timeout is killed along with its children"""
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run("sleep 30 & wait", timeout=0.2)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(run(["echo", "$HOME"], silent=False, timeout=5), "$HOME")
+
     @patch('os.path.exists')
     def test_check_efi(self, mock_exists):
         """Test EFI detection"""